@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Throughput of BaseFormatter, compared with the implementation before
+# the format was precompiled, which decoded every attribute of the record
+# and detected terminal colors (import curses, isatty) for every record.
+#
+# usage: python benchmarks/log_format.py [records]
+
+from __future__ import print_function
+
+import os
+import sys
+import timeit
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from torext.log import BaseFormatter, _detect_colors
+from torext.compat import decode_
+
+
+class LegacyFormatter(BaseFormatter):
+    def format(self, record):
+        self._format_record(record)
+
+        record_dict = {}
+        for k, v in record.__dict__.items():
+            if isinstance(k, str):
+                k = decode_(k, 'utf8')
+            if isinstance(v, str):
+                v = decode_(v, 'utf8', 'replace')
+            record_dict[k] = v
+
+        if 'color' in self.fmt or 'end_color' in self.fmt:
+            colors_map, _normal = _detect_colors(sys.stderr)
+            record_dict['color'], record_dict['end_color'] = colors_map.get(record.levelno, _normal), _normal
+
+        log = self.ufmt % record_dict
+
+        if record.exc_text:
+            if log[-1:] != '\n':
+                log += '\n'
+            log += decode_(record.exc_text, 'utf8', 'replace')
+
+        log = log.replace('\n', '\n' + self.tab)
+
+        return log
+
+
+def make_record():
+    return logging.LogRecord('torext.request', logging.INFO, __file__, 42,
+                             '%d %s %.2fms', (200, 'GET /api/users/12345 (127.0.0.1)', 1.23), None)
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    record = make_record()
+    assert LegacyFormatter().format(record) == BaseFormatter().format(record)
+
+    records = [make_record() for _ in range(number)]
+    results = {}
+    for name, formatter in (('before', LegacyFormatter()), ('after', BaseFormatter())):
+        def run():
+            for record in records:
+                formatter.format(record)
+
+        # best of 5 runs
+        results[name] = min(timeit.repeat(run, number=1, repeat=5))
+        print('%-8s %.0f records per second' % (name, number / results[name]))
+    print('speedup  %.1fx' % (results['before'] / results['after']))
+
+
+if __name__ == '__main__':
+    main()
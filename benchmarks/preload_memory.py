@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Compare per-worker memory of supervised workers with and without PRELOAD.
+#
+# usage: python benchmarks/preload_memory.py [processes] [routes] [templates]
+#
+# The served application imports a few stdlib packages, defines `routes`
+# handler classes, holds a table of module level data, and renders from
+# `templates` templates, which is roughly what a real project loads.
+# USS is the memory unique to a worker, the lower the more workers fit
+# in a box; PSS adds each worker's share of the pages shared among them.
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import shutil
+import signal
+import socket
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PORT = 18766
+
+
+def serve(preload, processes, routes, templates):
+    import json
+    import decimal
+    import xml.dom.minidom
+    import email.mime.multipart
+
+    from torext.app import TorextApp
+    from torext.handlers import BaseHandler
+
+    template_path = os.environ['BENCH_TEMPLATE_PATH']
+    app = TorextApp(extra_settings={
+        'PORT': PORT,
+        'ADDRESS': '127.0.0.1',
+        'DEBUG': False,
+        'PROCESSES': processes,
+        'SUPERVISOR': True,
+        'PRELOAD': preload == 'on',
+        'LOGGERS': {'': {'level': 'WARNING'}},
+    }, application_options={'template_path': template_path})
+
+    # module level data, like a loaded config or an ORM metadata
+    table = dict(('key%s' % i, {'id': i, 'name': 'item %s' % i, 'price': decimal.Decimal(i)})
+                 for i in range(200000))
+
+    def make_handler(i):
+        class Handler(BaseHandler):
+            def get(self):
+                name = 'page%s.html' % (i % templates)
+                self.render(name, item=table['key%s' % i])
+        Handler.__name__ = 'Handler%s' % i
+        return Handler
+
+    for i in range(routes):
+        app.route('/r/%s' % i)(make_handler(i))
+
+    app.run()
+
+
+def make_templates(count):
+    path = tempfile.mkdtemp()
+    body = '<ul>' + ''.join('<li>{{ item["name"] }} {{ item["price"] }} %s</li>' % j
+                            for j in range(50)) + '</ul>'
+    for i in range(count):
+        with open(os.path.join(path, 'page%s.html' % i), 'w') as f:
+            f.write(body)
+    return path
+
+
+def fetch(path):
+    sock = socket.create_connection(('127.0.0.1', PORT))
+    try:
+        sock.sendall(('GET %s HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n' % path).encode('ascii'))
+        while sock.recv(4096):
+            pass
+    finally:
+        sock.close()
+
+
+def wait_port():
+    for _ in range(300):
+        try:
+            fetch('/r/0')
+            return
+        except socket.error:
+            time.sleep(0.1)
+    raise RuntimeError('server did not start')
+
+
+def children_of(ppid):
+    pids = []
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open('/proc/%s/stat' % name) as f:
+                # the command name in parentheses may contain spaces
+                fields = f.read().rsplit(')', 1)[1].split()
+        except (IOError, OSError):
+            continue
+        if int(fields[1]) == ppid:
+            pids.append(int(name))
+    return pids
+
+
+def report(preload, pids):
+    from torext.supervisor import get_memory_info
+
+    infos = [get_memory_info(pid) for pid in pids]
+    mb = lambda key: sum(i[key] for i in infos) / float(len(infos)) / 1024 / 1024
+
+    print('== PRELOAD %s, %s workers' % (preload, len(infos)))
+    print('  per worker MB: rss %.1f  pss %.1f  uss %.1f' % (mb('rss'), mb('pss'), mb('uss')))
+    print('  all workers USS MB: %.1f' % (sum(i['uss'] for i in infos) / 1024.0 / 1024))
+
+
+def main():
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    routes = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    templates = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+
+    from torext.supervisor import get_memory_info
+    if get_memory_info() is None:
+        print('/proc/<pid>/smaps is required')
+        sys.exit(1)
+
+    template_path = make_templates(templates)
+    env = dict(os.environ, BENCH_TEMPLATE_PATH=template_path)
+    try:
+        for preload in ('off', 'on'):
+            server = subprocess.Popen(
+                [sys.executable, __file__, 'serve', preload, str(processes), str(routes), str(templates)],
+                env=env, preexec_fn=os.setsid)
+            try:
+                wait_port()
+                # touch every route so that workers reach a steady state
+                for _ in range(2):
+                    for i in range(routes):
+                        fetch('/r/%s' % i)
+                time.sleep(1)
+                report(preload, children_of(server.pid))
+            finally:
+                os.killpg(server.pid, signal.SIGTERM)
+                server.wait()
+                time.sleep(0.5)
+    finally:
+        shutil.rmtree(template_path)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        serve(sys.argv[2], *[int(i) for i in sys.argv[3:6]])
+    else:
+        main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Per-request overhead of REQUEST_ID: creating the context, entering the
+# StackContext, and setting the context again in each callback of the
+# request. A request is simulated as a handler body that schedules 3
+# callbacks (e.g. a timeout, a stream read, a http client response), they
+# are wrapped by ``stack_context.wrap`` as the IOLoop does, then run.
+#
+# usage: python benchmarks/request_context.py [iterations]
+
+from __future__ import print_function
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tornado import stack_context
+from tornado.httputil import HTTPHeaders
+
+from torext.context import make_request_context, get_request_id
+
+
+class FakeRequest(object):
+    headers = HTTPHeaders({'X-Request-Id': 'abc-123'})
+
+
+REQUEST = FakeRequest()
+CALLBACKS = 3
+
+
+def callback():
+    get_request_id()
+
+
+def handle():
+    return [stack_context.wrap(callback) for _ in range(CALLBACKS)]
+
+
+def without_context():
+    for cb in handle():
+        cb()
+
+
+def with_context():
+    context_manager, context = make_request_context(REQUEST)
+    with context_manager:
+        callbacks = handle()
+    for cb in callbacks:
+        cb()
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    results = {}
+    for func in (without_context, with_context):
+        # best of 5 runs
+        results[func.__name__] = min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+        print('%-16s %.2f us per request' % (func.__name__, results[func.__name__]))
+    print('overhead         %.2f us per request' % (results['with_context'] - results['without_context']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Compare accept distribution and latency between shared-socket and
+# SO_REUSEPORT multi-process modes.
+#
+# usage: python benchmarks/reuseport.py [processes] [concurrency] [requests]
+#
+# Every request opens a new connection so that every request is an accept,
+# the response body is the pid of the worker that accepted it.
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import signal
+import socket
+import threading
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PORT = 18765
+
+
+def serve(mode, processes):
+    from torext.app import TorextApp
+    from torext.handlers import BaseHandler
+
+    app = TorextApp(extra_settings={
+        'PORT': PORT,
+        'ADDRESS': '127.0.0.1',
+        'DEBUG': False,
+        'PROCESSES': processes,
+        'REUSE_PORT': mode == 'reuseport',
+        'LOGGERS': {'': {'level': 'WARNING'}},
+    })
+
+    @app.route('/')
+    class PidHandler(BaseHandler):
+        def get(self):
+            self.write(str(os.getpid()))
+
+    app.run()
+
+
+def fetch():
+    sock = socket.create_connection(('127.0.0.1', PORT))
+    try:
+        sock.sendall(b'GET / HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n')
+        data = b''
+        while True:
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+    finally:
+        sock.close()
+    return data.split(b'\r\n\r\n', 1)[1].decode('ascii')
+
+
+def load(concurrency, requests):
+    results = []
+    lock = threading.Lock()
+    per_thread = requests // concurrency
+
+    def run():
+        local = []
+        for _ in range(per_thread):
+            start = time.time()
+            pid = fetch()
+            local.append((time.time() - start, pid))
+        with lock:
+            results.extend(local)
+
+    threads = [threading.Thread(target=run) for _ in range(concurrency)]
+    start = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, time.time() - start
+
+
+def wait_port():
+    for _ in range(100):
+        try:
+            fetch()
+            return
+        except socket.error:
+            time.sleep(0.1)
+    raise RuntimeError('server did not start')
+
+
+def percentile(sorted_values, p):
+    index = min(int(len(sorted_values) * p), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def report(mode, results, elapsed):
+    latencies = sorted(i[0] * 1000 for i in results)
+    counts = {}
+    for _, pid in results:
+        counts[pid] = counts.get(pid, 0) + 1
+    shares = sorted(counts.values(), reverse=True)
+    total = float(len(results))
+
+    print('== %s' % mode)
+    print('  requests/s: %.0f' % (total / elapsed))
+    print('  latency ms: p50 %.2f  p99 %.2f  p99.9 %.2f  max %.2f' % (
+        percentile(latencies, 0.5), percentile(latencies, 0.99),
+        percentile(latencies, 0.999), latencies[-1]))
+    print('  accepts per worker: %s' % ', '.join('%.1f%%' % (i / total * 100) for i in shares))
+    print('  max/min accepts: %.2f' % (shares[0] / float(shares[-1])))
+
+
+def main():
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    requests = int(sys.argv[3]) if len(sys.argv) > 3 else 20000
+
+    for mode in ('shared', 'reuseport'):
+        # run in a new session so that forked workers can be killed together
+        server = subprocess.Popen([sys.executable, __file__, 'serve', mode, str(processes)],
+                                  preexec_fn=os.setsid)
+        try:
+            wait_port()
+            results, elapsed = load(concurrency, requests)
+            report(mode, results, elapsed)
+        finally:
+            os.killpg(server.pid, signal.SIGTERM)
+            server.wait()
+            time.sleep(0.5)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        serve(sys.argv[2], int(sys.argv[3]))
+    else:
+        main()
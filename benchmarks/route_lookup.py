@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Cost of finding the handler of a path versus the number of routes, with
+# tornado's linear scan of route regexes and with ``torext.route.RadixRouter``.
+# Routes are a typical REST table, each resource has a literal list route,
+# an item route with a ``(\d+)`` id, and a nested route with ``([^/]+)``.
+# Paths of the last resources are looked up, which is the worst case of
+# the linear scan, as routes are tried in the order they are declared.
+#
+# usage: python benchmarks/route_lookup.py [lookups]
+
+from __future__ import print_function
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tornado.web import URLSpec, RequestHandler
+
+from torext.route import RadixRouter
+
+
+def make_specs(resources):
+    specs = []
+    for i in range(resources):
+        specs.append(URLSpec(r'/api/resource%d' % i, RequestHandler))
+        specs.append(URLSpec(r'/api/resource%d/(\d+)' % i, RequestHandler))
+        specs.append(URLSpec(r'/api/resource%d/(?P<id>\d+)/(?P<field>[^/]+)' % i, RequestHandler))
+    return specs
+
+
+def linear_lookup(specs, path):
+    for spec in specs:
+        if spec.regex.match(path):
+            return spec
+    return None
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    print('%-8s %-8s %12s %12s %8s' % ('routes', 'path', 'linear (us)', 'radix (us)', 'speedup'))
+    for resources in (3, 10, 30, 100, 300):
+        specs = make_specs(resources)
+        router = RadixRouter(specs)
+        last = resources - 1
+        paths = (
+            ('literal', '/api/resource%d' % last),
+            ('param', '/api/resource%d/123/name' % last),
+            ('missing', '/api/nothing'),
+        )
+        for kind, path in paths:
+            assert router.lookup(path) is linear_lookup(specs, path)
+            # best of 5 runs
+            linear = min(timeit.repeat(lambda: linear_lookup(specs, path), number=number, repeat=5))
+            radix = min(timeit.repeat(lambda: router.lookup(path), number=number, repeat=5))
+            print('%-8d %-8s %12.2f %12.2f %7.1fx' % (
+                len(specs), kind, linear / number * 1e6, radix / number * 1e6, linear / radix))
+
+
+if __name__ == '__main__':
+    main()
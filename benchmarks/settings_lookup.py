@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Per-request cost of reading settings on the hot paths:
+# LOG_REQUEST in prepare, LOG_RESPONSE in flush, TEMPLATE_ENGINE in
+# render_string, LOGGING_IGNORE_URLS in _log_function.
+#
+# usage: python benchmarks/settings_lookup.py [iterations]
+
+from __future__ import print_function
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from torext import settings
+
+settings['LOGGING_IGNORE_URLS'] = ['/favicon.ico', '/static/', '/_status', '/metrics']
+settings.freeze()
+
+URI = '/api/users/12345?fields=name'
+
+
+def before():
+    # Settings.__getitem__ with try/except, list scanned by startswith
+    settings['LOG_REQUEST']
+    settings['LOG_RESPONSE']
+    settings['TEMPLATE_ENGINE']
+    for i in settings['LOGGING_IGNORE_URLS']:
+        if URI.startswith(i):
+            break
+
+
+def after():
+    frozen = settings.frozen
+    frozen.LOG_REQUEST
+    frozen.LOG_RESPONSE
+    frozen.TEMPLATE_ENGINE
+    URI.startswith(frozen.LOGGING_IGNORE_URLS)
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    results = {}
+    for func in (before, after):
+        # best of 5 runs
+        results[func.__name__] = min(timeit.repeat(func, number=number, repeat=5)) / number * 1e9
+        print('%-8s %.0f ns per request' % (func.__name__, results[func.__name__]))
+    print('saved    %.0f ns per request (%.1fx)' % (
+        results['before'] - results['after'], results['before'] / results['after']))
+
+
+if __name__ == '__main__':
+    main()
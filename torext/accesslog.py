@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Access log pipeline
+#
+# Used instead of the ``torext.request`` log lines when ``ACCESS_LOG`` is on.
+# Each finished request is:
+#   1. dropped if its uri matches ``LOGGING_IGNORE_URLS``
+#   2. sampled by the rate of its path prefix, or of its status code, or the
+#      default rate, errors (5xx) and slow requests are always kept
+#   3. formatted as one compact JSON line, with fields in fixed order
+#   4. buffered, and written in batches by a single write call, so lines
+#      from multiple processes appending to the same file never interleave
+#
+# Prefixes are matched by one precompiled regex instead of a loop of
+# ``startswith``.
+
+import os
+import re
+import sys
+import json
+import time
+import random
+
+from torext.log import app_log
+
+
+class PrefixMatcher(object):
+    """Match a string against many prefixes in one regex call,
+    the longest matching prefix is returned
+    """
+    def __init__(self, prefixes):
+        self.prefixes = sorted(prefixes, key=len, reverse=True)
+        if self.prefixes:
+            self.regex = re.compile('|'.join(re.escape(i) for i in self.prefixes))
+        else:
+            self.regex = None
+
+    def match(self, s):
+        if self.regex is None:
+            return None
+        m = self.regex.match(s)
+        return m and m.group(0)
+
+
+class BufferedWriter(object):
+    def __init__(self, path=None, buffer_size=65536):
+        """Write to `path` in append mode, or to stdout if it's None"""
+        if path:
+            self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        else:
+            self.fd = sys.stdout.fileno()
+        self.buffer_size = buffer_size
+        self._lines = []
+        self._size = 0
+
+    def write(self, line):
+        self._lines.append(line)
+        self._size += len(line)
+        if self._size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if not self._lines:
+            return
+        data = ''.join(self._lines).encode('utf8')
+        del self._lines[:]
+        self._size = 0
+        try:
+            while data:
+                data = data[os.write(self.fd, data):]
+        except OSError:
+            app_log.warning('Failed to write access log', exc_info=True)
+
+
+class AccessLog(object):
+    def __init__(self, writer, ignore_urls=(), sample_rate=1.0, route_sample_rates=None,
+                 status_sample_rates=None, slow_threshold=1):
+        self.writer = writer
+        self.ignore_matcher = PrefixMatcher(ignore_urls)
+        self.sample_rate = sample_rate
+        self.route_sample_rates = route_sample_rates or {}
+        self.route_matcher = PrefixMatcher(self.route_sample_rates)
+        self.status_sample_rates = status_sample_rates or {}
+        self.slow_threshold = slow_threshold
+
+    @classmethod
+    def from_settings(cls, settings):
+        writer = BufferedWriter(settings['ACCESS_LOG_FILE'],
+                                buffer_size=settings['ACCESS_LOG_BUFFER_SIZE'])
+        access_log = cls(writer, ignore_urls=settings['LOGGING_IGNORE_URLS'],
+                         sample_rate=settings['ACCESS_LOG_SAMPLE_RATE'],
+                         route_sample_rates=settings['ACCESS_LOG_ROUTE_SAMPLE_RATES'],
+                         status_sample_rates=settings['ACCESS_LOG_STATUS_SAMPLE_RATES'],
+                         slow_threshold=settings['ACCESS_LOG_SLOW_THRESHOLD'])
+        # could be changed by settings reload
+        settings.add_key_callback('LOGGING_IGNORE_URLS', access_log.set_ignore_urls)
+        return access_log
+
+    def set_ignore_urls(self, ignore_urls):
+        self.ignore_matcher = PrefixMatcher(ignore_urls)
+
+    def get_sample_rate(self, request, status, request_time):
+        if status >= 500 or request_time >= self.slow_threshold:
+            return 1
+        if self.ignore_matcher.match(request.uri):
+            return 0
+        prefix = self.route_matcher.match(request.path)
+        if prefix is not None:
+            return self.route_sample_rates[prefix]
+        return self.status_sample_rates.get(status, self.sample_rate)
+
+    def log(self, handler, request_time):
+        request = handler.request
+        status = handler.get_status()
+        rate = self.get_sample_rate(request, status, request_time)
+        if rate < 1 and random.random() >= rate:
+            return
+        # `rate` lets the consumer scale sampled counts back
+        self.writer.write(
+            '{"time":%.3f,"status":%d,"method":%s,"uri":%s,"ip":%s,"ms":%.2f,'
+            '"handler":%s,"rate":%s,"request_id":%s}\n' % (
+                time.time(), status, json.dumps(request.method), json.dumps(request.uri),
+                json.dumps(request.remote_ip), request_time * 1000,
+                json.dumps(handler.__class__.__name__), rate,
+                json.dumps(getattr(handler, 'request_id', None))))
+
+    def flush(self):
+        self.writer.flush()
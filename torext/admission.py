@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Admission control
+#
+# Requests are admitted by ``TorextApplication`` before any handler is
+# created. A limiter allows at most `limit` requests to be handled at the
+# same time, there is one limiter for the whole process and one for each
+# configured path prefix. A request that exceeds a limiter waits in its
+# queue, until a slot is released or the queue timeout is reached. When the
+# queue is full or the request times out, it is answered with 503 and
+# Retry-After immediately, which is cheaper for both sides than letting it
+# wait until the client gives up.
+#
+# In adaptive mode, the limit of a limiter is adjusted by the latency of
+# finished requests (AIMD): it grows by one per `limit` requests finished
+# within the target latency while the limiter is saturated, and shrinks by
+# 10% at most once per target latency when requests finish slower.
+
+import time
+from collections import deque
+
+from tornado.ioloop import IOLoop
+from tornado.web import RequestHandler
+
+from torext.log import app_log
+
+
+class OverloadedHandler(RequestHandler):
+    def initialize(self, retry_after):
+        self.retry_after = retry_after
+
+    def prepare(self):
+        self.set_status(503)
+        self.set_header('Retry-After', str(self.retry_after))
+        self.finish('Service Unavailable')
+
+
+class Limiter(object):
+    def __init__(self, name, limit, queue_size=100, adaptive=False,
+                 target_latency=0.5, min_limit=1):
+        self.name = name
+        self.max_limit = limit
+        self.queue = deque()
+        self.queue_size = queue_size
+        self.active = 0
+        self.rejected = 0
+        self.expired = 0
+
+        self.adaptive = adaptive
+        self.target_latency = target_latency
+        self.min_limit = min_limit
+        self._limit = float(limit)
+        self._last_decrease = 0
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    @property
+    def is_full(self):
+        return self.active >= self.limit
+
+    def on_finish(self, latency):
+        if not self.adaptive:
+            return
+        if latency > self.target_latency:
+            now = time.time()
+            # requests admitted before the last decrease are still finishing
+            if now - self._last_decrease > self.target_latency:
+                self._limit = max(self._limit * 0.9, self.min_limit)
+                self._last_decrease = now
+                app_log.info('Admission limit of %s decreased to %s', self.name, self.limit)
+        elif self.active + 1 >= self.limit:
+            self._limit = min(self._limit + 1.0 / self._limit, self.max_limit)
+
+    def stats(self):
+        return {
+            'limit': self.limit,
+            'active': self.active,
+            'queued': len(self.queue),
+            'rejected': self.rejected,
+            'expired': self.expired,
+        }
+
+
+class AdmissionController(object):
+    def __init__(self, application, limit=0, route_limits=None, queue_size=100,
+                 queue_timeout=1, retry_after=1, adaptive=False, target_latency=0.5,
+                 min_limit=1):
+        """
+        `route_limits` is a dict of path prefix to limit,
+        `limit` 0 means no global limit
+        """
+        self.application = application
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+
+        def make(name, limit):
+            return Limiter(name, limit, queue_size=queue_size, adaptive=adaptive,
+                           target_latency=target_latency, min_limit=min_limit)
+
+        self.limiter = make('*', limit) if limit else None
+        # longer prefixes are matched first
+        self.route_limiters = [make(prefix, route_limits[prefix]) for prefix in
+                               sorted(route_limits or {}, key=len, reverse=True)]
+        self._draining = False
+
+    @classmethod
+    def from_settings(cls, application, settings):
+        if not settings['ADMISSION_LIMIT'] and not settings['ADMISSION_ROUTE_LIMITS']:
+            return None
+        return cls(application, limit=settings['ADMISSION_LIMIT'],
+                   route_limits=settings['ADMISSION_ROUTE_LIMITS'],
+                   queue_size=settings['ADMISSION_QUEUE_SIZE'],
+                   queue_timeout=settings['ADMISSION_QUEUE_TIMEOUT'],
+                   retry_after=settings['ADMISSION_RETRY_AFTER'],
+                   adaptive=settings['ADMISSION_ADAPTIVE'],
+                   target_latency=settings['ADMISSION_TARGET_LATENCY'],
+                   min_limit=settings['ADMISSION_MIN_LIMIT'])
+
+    def get_limiters(self, request):
+        limiters = []
+        for limiter in self.route_limiters:
+            if request.path.startswith(limiter.name):
+                limiters.append(limiter)
+                break
+        if self.limiter:
+            limiters.append(self.limiter)
+        return limiters
+
+    def admit(self, request, dispatch):
+        """Return True if the request could be dispatched right now,
+        otherwise it is queued or rejected, `dispatch` will be called
+        when a queued request is admitted later
+        """
+        limiters = self.get_limiters(request)
+        if not limiters:
+            return True
+
+        full = self._first_full(limiters)
+        if full is not None:
+            # requests whose connection was closed may still hold slots
+            self.application.prune_inflight()
+            full = self._first_full(limiters)
+        if full is None:
+            self._acquire(request, limiters)
+            return True
+
+        if len(full.queue) >= full.queue_size:
+            full.rejected += 1
+            self.reject(request)
+            return False
+
+        io_loop = IOLoop.current()
+        entry = [request, limiters, dispatch, None]
+        entry[3] = io_loop.add_timeout(time.time() + self.queue_timeout,
+                                       lambda: self._expire(full, entry))
+        full.queue.append(entry)
+        return False
+
+    def _first_full(self, limiters):
+        for limiter in limiters:
+            if limiter.is_full:
+                return limiter
+        return None
+
+    def _acquire(self, request, limiters):
+        for limiter in limiters:
+            limiter.active += 1
+        request._admission = (limiters, time.time())
+
+    def _expire(self, limiter, entry):
+        try:
+            limiter.queue.remove(entry)
+        except ValueError:
+            return
+        limiter.expired += 1
+        self.reject(entry[0])
+
+    def reject(self, request):
+        if request.connection and request.connection.stream.closed():
+            return
+        handler = OverloadedHandler(self.application, request, retry_after=self.retry_after)
+        handler._execute([])
+
+    def release(self, request):
+        admission = getattr(request, '_admission', None)
+        if not admission:
+            return
+        request._admission = None
+        limiters, admitted_at = admission
+        # time spent in queue is not counted
+        latency = time.time() - admitted_at
+        for limiter in limiters:
+            limiter.active -= 1
+            limiter.on_finish(latency)
+        self._drain()
+
+    def _drain(self):
+        # synchronous handlers finish and release in `dispatch`,
+        # which should not drain the queues recursively
+        if self._draining:
+            return
+        self._draining = True
+        try:
+            admitted = True
+            while admitted:
+                admitted = False
+                for limiter in [self.limiter] + self.route_limiters:
+                    if limiter is not None:
+                        admitted = self._drain_limiter(limiter) or admitted
+        finally:
+            self._draining = False
+
+    def _drain_limiter(self, limiter):
+        admitted = False
+        while limiter.queue:
+            request, limiters, dispatch, timeout = limiter.queue[0]
+            if request.connection and request.connection.stream.closed():
+                limiter.queue.popleft()
+                IOLoop.current().remove_timeout(timeout)
+                continue
+            if self._first_full(limiters) is not None:
+                break
+            limiter.queue.popleft()
+            IOLoop.current().remove_timeout(timeout)
+            self._acquire(request, limiters)
+            dispatch(request)
+            admitted = True
+        return admitted
+
+    def stats(self):
+        stats = {}
+        for limiter in [self.limiter] + self.route_limiters:
+            if limiter is not None:
+                stats[limiter.name] = limiter.stats()
+        return stats
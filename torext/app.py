@@ -4,21 +4,29 @@
 from __future__ import print_function
 
 import os
+import gc
 import sys
 import time
 import copy
+import json
+import signal
 import socket
 import logging
+import weakref
+import tempfile
 
-from tornado.ioloop import IOLoop
-from tornado.httpserver import HTTPServer
+from tornado.ioloop import IOLoop, PeriodicCallback
+from tornado.httpserver import HTTPServer, HTTPConnection
 from tornado.web import Application
 
 from torext import settings
 from torext import errors
 from torext.testing import TestClient, AppTestCase
-from torext.log import set_nose_formatter, app_log, request_log
-from torext.route import Router
+from torext.log import (
+    set_nose_formatter, set_loggers, flush_queue_handlers, uses_file_handlers, use_log_writer,
+    app_log, request_log)
+from torext.route import Router, URLBuilder, make_spec, get_lazy_includes
+from torext.metrics import Metrics
 from torext.utils import json_encode, json_decode
 
 
@@ -65,6 +73,131 @@ KEYS_FOR_TORNADO_APPLICATION_SETTINGS = [
 ]
 
 
+class TorextApplication(Application):
+    """Application that keeps track of requests in progress,
+    and admits requests by ``self.admission`` if it is set,
+    routes are looked up in radix trees after ``compile_routes`` is called,
+    and urls of named routes are built by cached ``URLBuilder``
+    """
+    def __init__(self, *args, **kwargs):
+        # handlers that did not finish in the same call stack, which are either
+        # asynchronous or being executed by ``__call__`` right now
+        self.inflight_handlers = set()
+        self.admission = None
+        # [(host regex, RadixRouter)]
+        self.routers = None
+        # name -> URLBuilder
+        self.url_builders = {}
+        super(TorextApplication, self).__init__(*args, **kwargs)
+
+    def add_handlers(self, host_pattern, host_handlers):
+        super(TorextApplication, self).add_handlers(host_pattern, host_handlers)
+        if self.routers is not None:
+            self.compile_routes()
+        self.compile_url_builders()
+
+    def compile_url_builders(self):
+        self.url_builders = dict((name, URLBuilder(spec))
+                                 for name, spec in self.named_handlers.items())
+
+    def reverse_url(self, name, *args, **kwargs):
+        """Return the path of route `name`, with its groups filled by `args`,
+        or by `kwargs` if they are named
+        """
+        builder = self.url_builders.get(name)
+        if builder is None:
+            if name not in self.named_handlers:
+                raise KeyError("%s not found in named urls" % name)
+            builder = self.url_builders[name] = URLBuilder(self.named_handlers[name])
+        return builder(*args, **kwargs)
+
+    def compile_routes(self):
+        from torext.route import RadixRouter
+        self.routers = [(host, RadixRouter(specs)) for host, specs in self.handlers]
+
+    def _get_host_handlers(self, request):
+        if self.routers is None:
+            return super(TorextApplication, self)._get_host_handlers(request)
+
+        # same as tornado, the handlers of all matched hosts are tried in order,
+        # and the default host is used when no host matches
+        host = request.host.lower().split(':')[0]
+        routers = [router for pattern, router in self.routers
+                   if router.specs and pattern.match(host)]
+        if not routers and "X-Real-Ip" not in request.headers:
+            routers = [router for pattern, router in self.routers
+                       if router.specs and pattern.match(self.default_host)]
+        if not routers:
+            return None
+        for router in routers:
+            spec = router.lookup(request.path)
+            if spec is not None:
+                return [spec]
+        from torext.route import NeverMatchSpec
+        return [NeverMatchSpec]
+
+    def __call__(self, request):
+        if self.admission and not self.admission.admit(request, self._dispatch):
+            return None
+        return self._dispatch(request)
+
+    def _dispatch(self, request):
+        handler = super(TorextApplication, self).__call__(request)
+        if not handler._finished:
+            self.inflight_handlers.add(handler)
+        return handler
+
+    def log_request(self, handler):
+        self.inflight_handlers.discard(handler)
+        if self.admission:
+            self.admission.release(handler.request)
+        super(TorextApplication, self).log_request(handler)
+
+    def prune_inflight(self):
+        # requests whose connection was closed by client will never finish
+        for handler in list(self.inflight_handlers):
+            connection = handler.request.connection
+            if connection and connection.stream.closed():
+                self.inflight_handlers.discard(handler)
+                if self.admission:
+                    self.admission.release(handler.request)
+
+    @property
+    def inflight(self):
+        self.prune_inflight()
+        return len(self.inflight_handlers)
+
+
+class TorextHTTPServer(HTTPServer):
+    """HTTPServer that keeps track of its connections, so that idle
+    keep-alive connections could be closed on shutdown
+    """
+    def __init__(self, *args, **kwargs):
+        self.connections = weakref.WeakSet()
+        self.draining = False
+        super(TorextHTTPServer, self).__init__(*args, **kwargs)
+
+    def handle_stream(self, stream, address):
+        connection = HTTPConnection(stream, address, self.request_callback,
+                                    self.no_keep_alive or self.draining,
+                                    self.xheaders, self.protocol)
+        self.connections.add(connection)
+
+    def drain(self):
+        """Stop accepting, close idle connections, and let busy connections
+        be closed after their current responses
+        """
+        self.draining = True
+        self.stop()
+        for connection in list(self.connections):
+            if connection.stream.closed():
+                continue
+            if connection._request is None:
+                connection.close()
+            else:
+                connection.no_keep_alive = True
+
+
 class TorextApp(object):
     """TorextApp defines a singleton class to represents the whole application,
     you can see it as the entrance for your web project.
@@ -97,11 +230,27 @@ class TorextApp(object):
         self.host_handlers = {
             self.default_host: []
         }
+        # ModuleSearcher of the modules included by `route_many`
+        self.route_includes = []
         self.application = None
+        self.http_server = None
+        self.loop_monitor = None
+        self.settings_reloader = None
+        self.thread_pool = None
+        self.process_pool = None
+        self.metrics = Metrics()
+        self.access_log = None
+        self.error_log = None
+        self.log_writer = None
+        self.request_debugger = None
         self.project = None
+        self.shutdown_hooks = []
+        self.is_shutting_down = False
         self.uimodules = {}
         self.json_encoder = json_encode
         self.json_decoder = json_decode
+        # finished requests in current process
+        self.request_count = 0
 
         self.settings = settings
 
@@ -211,12 +360,16 @@ class TorextApp(object):
             handlers = self.host_handlers[host]
         return handlers
 
-    def route(self, url, host=None):
-        """This is a decorator
+    def route(self, url, host=None, name=None):
+        """This is a decorator, url of a route with `name`
+        could be built by ``reverse_url(name, *args)``
         """
         def fn(handler_cls):
             handlers = self._get_handlers_on_host(host)
-            handlers.insert(0, (url, handler_cls))
+            if name:
+                handlers.insert(0, (url, handler_cls, {}, name))
+            else:
+                handlers.insert(0, (url, handler_cls))
             return handler_cls
         return fn
 
@@ -238,6 +391,7 @@ class TorextApp(object):
             raise ValueError('The amount of args of route_many method can only be one or two')
         router = Router(rules, prefix=prefix)
         self.add_handlers(router.get_handlers(), host=kwargs.get('host'))
+        self.route_includes.extend(router.searchers)
 
     def add_handlers(self, handlers, host=None):
         handlers_container = self._get_handlers_on_host(host)
@@ -364,15 +518,95 @@ class TorextApp(object):
                 raise ImportError('PROJECT could not be imported, may be app.py is outside the project'
                                   'or there is no __init__ in the package.')
 
+        # values are kept up to date by ``Settings.__setitem__`` after this
+        settings.freeze()
+
         self.is_setuped = True
 
-    def make_http_server(self):
-        multiprocessing = False
+    def preload(self):
+        """Load everything that could be shared among workers before forking:
+        the PROJECT package, route modules and handlers (by building the
+        application), and compiled templates. Then freeze the objects into
+        the permanent generation (python 3.7+), so that garbage collection
+        in workers will not touch, thus copy, the memory pages holding them.
+        """
+        if not self.is_setuped:
+            self.setup()
+        if not self.application:
+            self._init_application()
+
+        for include in get_lazy_includes(self.application):
+            include.load(self.application)
+
+        count = self.warm_templates()
+        app_log.debug('Compiled %s templates', count)
+
+        gc.collect()
+        if hasattr(gc, 'freeze'):
+            gc.freeze()
+            app_log.debug('Froze %s objects', gc.get_freeze_count())
+
+    def warm_templates(self):
+        """Compile all templates under template path into the loader
+        that handlers will use, return the number of templates compiled
+        """
+        if settings['TEMPLATE_ENGINE'] == 'jinja2':
+            from torext.handlers.base import get_jinja2_env
+
+            env = get_jinja2_env()
+            names = env.list_templates()
+            load = env.get_template
+        else:
+            from tornado.web import RequestHandler
+            from tornado.template import Loader
+
+            options = self.application.settings
+            template_path = options.get('template_path')
+            if not template_path or not os.path.isdir(template_path):
+                return 0
+            # same as ``RequestHandler.create_template_loader``
+            loader = RequestHandler._template_loaders.get(template_path)
+            if loader is None:
+                if 'template_loader' in options:
+                    loader = options['template_loader']
+                else:
+                    kwargs = {}
+                    if 'autoescape' in options:
+                        kwargs['autoescape'] = options['autoescape']
+                    loader = Loader(template_path, **kwargs)
+                RequestHandler._template_loaders[template_path] = loader
+
+            names = []
+            for dirpath, dirnames, filenames in os.walk(template_path):
+                for filename in filenames:
+                    names.append(os.path.relpath(os.path.join(dirpath, filename), template_path))
+            load = loader.load
+
+        count = 0
+        for name in names:
+            try:
+                load(name)
+            except Exception:
+                app_log.warning('Failed to compile template %s', name, exc_info=True)
+            else:
+                count += 1
+        return count
+
+    def _is_multiprocessing(self):
         if settings['PROCESSES'] and settings['PROCESSES'] > 1:
             if settings['DEBUG']:
                 app_log.info('Multiprocess could not be used in debug mode')
             else:
-                multiprocessing = True
+                return True
+        return False
+
+    def make_http_server(self, sockets=None):
+        """Create ``self.http_server``, if `sockets` is passed, the server will
+        accept on them in current process, this is how a supervisor worker works.
+        """
+        multiprocessing = False
+        if sockets is None:
+            multiprocessing = self._is_multiprocessing()
 
         if self.io_loop:
             if not self.io_loop.initialized():
@@ -386,19 +620,37 @@ class TorextApp(object):
                 self.io_loop = IOLoop.instance()
 
         http_server_options = self.get_httpserver_options()
-        http_server = HTTPServer(self.application, io_loop=self.io_loop, **http_server_options)
+        http_server = TorextHTTPServer(self.application, io_loop=self.io_loop, **http_server_options)
         listen_kwargs = {}
         if settings.get('ADDRESS'):
             listen_kwargs['address'] = settings.get('ADDRESS')
 
-        if multiprocessing:
+        if sockets is not None:
+            # Sockets are bound by someone else (the supervisor)
+            http_server.add_sockets(sockets)
+        elif multiprocessing and settings['REUSE_PORT']:
+            # Multiprocessing mode, each process binds its own socket
+            from torext.supervisor import fork_processes, bind_sockets, set_cpu_affinity
+
+            task_id = fork_processes(settings['PROCESSES'], log_writer=self.log_writer,
+                                     forward_signals=self._get_forward_signals())
+            if settings['CPU_AFFINITY']:
+                set_cpu_affinity(task_id)
+            http_server.add_sockets(bind_sockets(settings['PORT'], reuse_port=True, **listen_kwargs))
+        elif multiprocessing:
             # Multiprocessing mode
+            from torext.supervisor import fork_processes
+
             try:
                 http_server.bind(settings['PORT'], **listen_kwargs)
             except socket.error as e:
                 app_log.warning('socket.error detected on http_server.listen, set ADDRESS="0.0.0.0" in settings to avoid this problem')
                 raise e
-            http_server.start(settings['PROCESSES'])
+            # instead of `http_server.start(PROCESSES)`, signals of the parent
+            # are forwarded to children for graceful shutdown
+            fork_processes(settings['PROCESSES'], log_writer=self.log_writer,
+                           forward_signals=self._get_forward_signals())
+            http_server.start(1)
         else:
             # Single process mode
             try:
@@ -409,6 +661,33 @@ class TorextApp(object):
 
         self.http_server = http_server
 
+    def _get_forward_signals(self):
+        """Signals the master sends to every worker"""
+        return settings['SETTINGS_RELOAD'] and [signal.SIGUSR1] or []
+
+    def make_supervisor(self):
+        """Bind the listening sockets in master process, workers will be
+        spawned by the returned supervisor object
+        """
+        from torext.supervisor import Supervisor
+
+        try:
+            return Supervisor.bind(
+                settings['PORT'], address=settings.get('ADDRESS'),
+                reuse_port=settings['REUSE_PORT'],
+                worker_target=settings['PRELOAD'] and self._run_worker or None,
+                forward_signals=self._get_forward_signals(),
+                num_workers=settings['PROCESSES'],
+                graceful_timeout=settings['GRACEFUL_TIMEOUT'],
+                timeout=settings['WORKER_TIMEOUT'],
+                max_requests=settings['WORKER_MAX_REQUESTS'],
+                max_rss=settings['WORKER_MAX_RSS'] * 1024 * 1024,
+                metrics_dir=settings['METRICS'] and settings['METRICS_DIR'] or None,
+                log_writer=self.log_writer)
+        except socket.error as e:
+            app_log.warning('socket.error detected on binding, set ADDRESS="0.0.0.0" in settings to avoid this problem')
+            raise e
+
     @property
     def is_running(self):
         if self.io_loop:
@@ -420,24 +699,252 @@ class TorextApp(object):
             self.io_loop = IOLoop.instance()
 
     def run(self, application=None):
+        from torext import supervisor
+
         if not self.is_setuped:
             self.setup()
 
         self._init_application(application=application)
 
+        if settings['SETTINGS_RELOAD']:
+            from torext.reload import SettingsReloader
+
+            module_file = settings._module and settings._module.__file__
+            self.settings_reloader = SettingsReloader(
+                [module_file, settings['SETTINGS_RELOAD_FILE']], settings['SETTINGS_RELOADABLE'],
+                interval=settings['SETTINGS_RELOAD_INTERVAL'])
+
+        if supervisor.is_worker():
+            self._run_worker()
+            return
+
+        if self._is_multiprocessing() and uses_file_handlers(settings['LOGGERS']):
+            self.start_log_writer()
+
         if not settings.get('TESTING'):
             self.log_app_info(self.application)
 
+        if settings['METRICS_DIR']:
+            from torext.metrics import clear_dir
+            clear_dir(settings['METRICS_DIR'])
+
+        if settings['PRELOAD'] and self._is_multiprocessing():
+            self.preload()
+
+        if settings['SUPERVISOR'] and self._is_multiprocessing():
+            self.make_supervisor().run()
+            return
+
         self.make_http_server()
+        self._instance_ioloop()
+        self.start_process_tasks()
+
+        def on_signal(signum, frame):
+            if self.is_shutting_down:
+                # second signal, do not wait any more
+                self.io_loop.add_callback_from_signal(self.io_loop.stop)
+            else:
+                self.io_loop.add_callback_from_signal(self.shutdown)
 
+        signal.signal(signal.SIGTERM, on_signal)
+        signal.signal(signal.SIGINT, on_signal)
+
+        self.io_loop.start()
+        print('Exit')
+        sys.exit(0)
+
+    def start_log_writer(self):
+        """Fork the process that writes file logs of all processes,
+        then ship file logs of current process and workers to it
+        """
+        from torext.logwriter import LogWriter
+
+        address = settings['LOG_WRITER_SOCKET'] or os.path.join(
+            tempfile.gettempdir(), 'torext-log-%s.sock' % settings['PORT'])
+        self.log_writer = LogWriter(address, settings['LOGGERS'])
+        self.log_writer.start()
+        use_log_writer(address)
+        set_loggers(settings['LOGGERS'])
+        app_log.info('Log writer %s started on %s', self.log_writer.pid, address)
+
+    def _run_worker(self, sockets=None):
+        """Serve as a worker of supervisor, `sockets` are passed when
+        the worker is forked from a preloaded master
+        """
+        from torext import supervisor
+
+        sockets = list(sockets or [])
+        if settings['REUSE_PORT']:
+            sockets += supervisor.bind_sockets(
+                settings['PORT'], address=settings.get('ADDRESS'), reuse_port=True)
+        supervisor.run_worker(self, heartbeat_interval=settings['WORKER_HEARTBEAT_INTERVAL'],
+                              sockets=sockets, cpu_affinity=settings['CPU_AFFINITY'])
+
+    def start_process_tasks(self):
+        """Start the tasks that run in every serving process,
+        called after ``self.io_loop`` is created
+        """
+        self.start_loop_monitor()
+        if self.settings_reloader:
+            self.settings_reloader.start(self.io_loop)
+        if settings['METRICS'] and settings['METRICS_DIR']:
+            PeriodicCallback(self.dump_metrics, settings['METRICS_DUMP_INTERVAL'] * 1000,
+                             io_loop=self.io_loop).start()
+        if self.access_log:
+            PeriodicCallback(self.access_log.flush, settings['ACCESS_LOG_FLUSH_INTERVAL'] * 1000,
+                             io_loop=self.io_loop).start()
+        if self.error_log:
+            PeriodicCallback(self.error_log.report, settings['ERROR_LOG_INTERVAL'] * 1000,
+                             io_loop=self.io_loop).start()
+        if settings['LAZY_ROUTES_WARMUP']:
+            self.warmup_routes()
+
+    def warmup_routes(self):
+        """Load the lazy includes one per IOLoop iteration,
+        so that requests are still served in between
+        """
+        includes = get_lazy_includes(self.application)
+
+        def load_next():
+            if not includes:
+                return
+            include = includes.pop(0)
+            try:
+                include.load(self.application)
+            except Exception:
+                app_log.error('Failed to load routes of %s', include.searcher.import_path,
+                              exc_info=True)
+            self.io_loop.add_callback(load_next)
+
+        self.io_loop.add_callback(load_next)
+
+    def write_route_manifest(self, path):
+        """Import the included modules and write their routes to `path`, to be
+        used as ``ROUTE_MANIFEST``, so that starting in production with lazy
+        includes does not import them. Call it at build time, e.g. in a command
+        of manage script, it does not matter whether ``LAZY_ROUTES`` is on.
+        """
+        manifest = {}
+        for searcher in self.route_includes:
+            if searcher.import_path in manifest:
+                continue
+            entries = []
+            for searcher_spec in searcher.get_handlers():
+                searcher_spec = make_spec(searcher_spec)
+                pattern = searcher_spec.regex.pattern
+                if pattern.endswith('$'):
+                    pattern = pattern[:-1]
+                handler = searcher_spec.handler_class
+                entry = {
+                    'pattern': pattern,
+                    'handler': '%s.%s' % (handler.__module__, handler.__name__),
+                }
+                if searcher_spec.name:
+                    entry['name'] = searcher_spec.name
+                entries.append(entry)
+            manifest[searcher.import_path] = entries
+        if not manifest:
+            app_log.warning('No modules are included by route_many, the route manifest %s is empty', path)
+        with open(path, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        return manifest
+
+    def dump_metrics(self):
         try:
-            self._instance_ioloop()
-            self.io_loop.start()
-        except KeyboardInterrupt:
-            print('\nStopping ioloop.. ', end=' ')
-            IOLoop.instance().stop()
-            print('Exit')
-            sys.exit(0)
+            self.metrics.dump(settings['METRICS_DIR'])
+        except (IOError, OSError):
+            app_log.warning('Failed to dump metrics', exc_info=True)
+
+    def start_loop_monitor(self):
+        """Start monitoring the lag of ``self.io_loop`` if ``LOOP_MONITOR`` is on"""
+        if not settings['LOOP_MONITOR'] or self.loop_monitor:
+            return
+        from torext.monitor import LoopMonitor
+
+        self.loop_monitor = LoopMonitor(
+            self.io_loop, interval=settings['LOOP_MONITOR_INTERVAL'],
+            threshold=settings['LOOP_BLOCK_THRESHOLD'])
+        self.loop_monitor.start()
+
+    def run_in_thread(self, fn, *args, **kwargs):
+        """Call `fn` in the thread pool, return a future"""
+        if not self.thread_pool:
+            from torext.offload import make_thread_pool
+            self.thread_pool = make_thread_pool(settings['THREAD_POOL_SIZE'])
+        return self.thread_pool.submit(fn, *args, **kwargs)
+
+    def run_in_process(self, fn, *args, **kwargs):
+        """Call `fn` in the process pool, return a future,
+        `fn` and arguments must be picklable
+        """
+        if not self.process_pool:
+            from torext.offload import make_process_pool
+            self.process_pool = make_process_pool(settings['PROCESS_POOL_SIZE'])
+        return self.process_pool.submit(fn, *args, **kwargs)
+
+    @property
+    def inflight_requests(self):
+        """Number of requests in progress in current process"""
+        return getattr(self.application, 'inflight', 0)
+
+    def register_shutdown_hook(self, hook_func):
+        """Register a function to be called without arguments on shutdown,
+        after requests in progress are finished and before ioloop stops
+        """
+        self.shutdown_hooks.append(hook_func)
+        return hook_func
+
+    def shutdown(self, timeout=None):
+        """Gracefully shutdown the server:
+
+        1. stop accepting new connections
+        2. close idle keep-alive connections
+        3. wait for requests in progress, at most `timeout` seconds
+           (``GRACEFUL_TIMEOUT`` by default)
+        4. call shutdown hooks, then stop the ioloop
+        """
+        if self.is_shutting_down:
+            return
+        self.is_shutting_down = True
+        if timeout is None:
+            timeout = settings['GRACEFUL_TIMEOUT']
+        deadline = time.time() + timeout
+
+        if self.http_server:
+            self.http_server.drain()
+        app_log.info('Shutting down, %s requests in progress', self.inflight_requests)
+
+        def check():
+            inflight = self.inflight_requests
+            if inflight and time.time() < deadline:
+                return
+            if inflight:
+                app_log.warning('Graceful timeout, %s requests are dropped', inflight)
+            checker.stop()
+            self._run_shutdown_hooks()
+            if settings['METRICS'] and settings['METRICS_DIR']:
+                self.dump_metrics()
+            if self.access_log:
+                self.access_log.flush()
+            if self.error_log:
+                self.error_log.report()
+            if self.loop_monitor:
+                self.loop_monitor.stop()
+            for pool in (self.thread_pool, self.process_pool):
+                if pool:
+                    pool.shutdown(wait=False)
+            flush_queue_handlers()
+            self.io_loop.stop()
+
+        checker = PeriodicCallback(check, 100, io_loop=self.io_loop)
+        checker.start()
+
+    def _run_shutdown_hooks(self):
+        for hook in self.shutdown_hooks:
+            try:
+                hook()
+            except Exception:
+                app_log.error('Error in shutdown hook %s', hook, exc_info=True)
 
     def log_app_info(self, application=None):
         current_settings = self.settings
@@ -506,19 +1013,30 @@ class TorextApp(object):
         self.application_configurator = config_func
         return config_func
 
-    def make_application(self, application_class=Application):
+    def make_application(self, application_class=TorextApplication):
         options = self.get_application_options()
         app_log.debug('%s settings: %s', application_class.__name__, options)
 
         # this method intended to be able to called for multiple times,
         # so attributes should not be changed, just make a copy
         host_handlers = copy.copy(self.host_handlers)
-        top_host_handlers = host_handlers.pop('.*$')
+        # tornado does not accept names in tuples
+        top_host_handlers = [make_spec(i) for i in host_handlers.pop('.*$')]
         application = application_class(top_host_handlers, **options)
 
         if host_handlers:
             for host, handlers in host_handlers.items():
-                application.add_handlers(host, handlers)
+                application.add_handlers(host, [make_spec(i) for i in handlers])
+
+        if not isinstance(application, TorextApplication):
+            # other applications, like WSGIApplication, could not dispatch again
+            for include in get_lazy_includes(application):
+                include.load(application)
+        else:
+            if settings['RADIX_ROUTER']:
+                application.compile_routes()
+            from torext.admission import AdmissionController
+            application.admission = AdmissionController.from_settings(application, settings)
 
         # call `application_configurator` to do extra setups
         self.application_configurator(application)
@@ -535,6 +1053,22 @@ class TorextApp(object):
         else:
             self.application = self.make_application()
 
+        if settings['ACCESS_LOG'] and not self.access_log:
+            from torext.accesslog import AccessLog
+            self.access_log = AccessLog.from_settings(settings)
+
+        if settings['REQUEST_ID']:
+            from torext.context import propagate_request_id
+            propagate_request_id(settings['REQUEST_ID_HEADER'])
+
+        if not self.request_debugger:
+            from torext.debuglog import RequestDebugger
+            self.request_debugger = RequestDebugger.from_settings(settings)
+
+        if settings['ERROR_LOG_LIMIT'] and not self.error_log:
+            from torext.errorlog import ErrorLog
+            self.error_log = ErrorLog.from_settings(settings)
+
     def make_wsgi_application(self):
         from tornado.wsgi import WSGIApplication
         return self.make_application(application_class=WSGIApplication)
@@ -542,20 +1076,28 @@ class TorextApp(object):
     def _log_function(self, handler):
         """Override Application.log_function so that what to log can be controlled.
         """
-        if handler.get_status() < 400:
+        frozen = settings.frozen
+        self.request_count += 1
+        request_time = handler.request.request_time()
+        if frozen.METRICS:
+            self.metrics.observe(handler, request_time)
+        if self.access_log:
+            self.access_log.log(handler, request_time)
+            return
+
+        status = handler.get_status()
+        if status < 400:
             log_method = request_log.info
-        elif handler.get_status() < 500:
+        elif status < 500:
             log_method = request_log.warning
         else:
             log_method = request_log.error
-        for i in settings['LOGGING_IGNORE_URLS']:
-            if handler.request.uri.startswith(i):
-                log_method = request_log.debug
-                break
-
-        request_time = 1000.0 * handler.request.request_time()
-        log_method("%d %s %.2fms", handler.get_status(),
-                   handler._request_summary(), request_time)
+        # a tuple in frozen settings, matched in one call
+        if handler.request.uri.startswith(frozen.LOGGING_IGNORE_URLS):
+            log_method = request_log.debug
+
+        log_method("%d %s %.2fms", status,
+                   handler._request_summary(), 1000.0 * request_time)
 
 
 _caller_path = None
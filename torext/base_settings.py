@@ -20,6 +20,119 @@ PROCESSES = 1
 
 PORT = 8000
 
+# when PROCESSES > 1, use a master process to spawn and supervise workers,
+# send SIGHUP to master to replace workers one by one without downtime
+SUPERVISOR = False
+
+# on SIGTERM or SIGINT, seconds to wait for requests in progress to finish
+GRACEFUL_TIMEOUT = 30
+
+# a supervised worker reports heartbeat every WORKER_HEARTBEAT_INTERVAL seconds,
+# and will be killed and respawned if it keeps silent for WORKER_TIMEOUT seconds
+WORKER_HEARTBEAT_INTERVAL = 5
+
+WORKER_TIMEOUT = 60
+
+# gracefully recycle a supervised worker after it served this many requests,
+# or its RSS grows beyond this many megabytes, 0 means no limit
+WORKER_MAX_REQUESTS = 0
+
+WORKER_MAX_RSS = 0
+
+# when PROCESSES > 1, let each process bind its own listening socket with
+# SO_REUSEPORT (linux 3.9+) instead of accepting on a shared one
+REUSE_PORT = False
+
+# pin each process to one cpu, works with PROCESSES > 1
+CPU_AFFINITY = False
+
+# when PROCESSES > 1, build the application (routes, views and templates) once
+# in master process and fork workers from it without re-executing, so that the
+# loaded code and data are shared copy-on-write among workers. NOTE that code
+# changes are not picked up by SIGHUP rolling restart in this mode
+PRELOAD = False
+
+# measure the IOLoop lag every LOOP_MONITOR_INTERVAL seconds, and log the stack
+# and request when the loop is blocked for more than LOOP_BLOCK_THRESHOLD seconds
+LOOP_MONITOR = False
+
+LOOP_MONITOR_INTERVAL = 0.1
+
+LOOP_BLOCK_THRESHOLD = 0.5
+
+# size of the pools used by ``app.run_in_thread``, ``app.run_in_process`` and
+# ``torext.offload.offload`` handler methods, 0 process pool size means cpu count
+THREAD_POOL_SIZE = 10
+
+PROCESS_POOL_SIZE = 0
+
+# record request time histograms per handler and status, which could be exported
+# by ``torext.handlers.status.MetricsHandler``. When PROCESSES > 1, set METRICS_DIR
+# to a directory where processes dump their metrics every METRICS_DUMP_INTERVAL
+# seconds, so that metrics of all processes are merged when exported, with
+# SUPERVISOR, snapshots of exited workers are folded into one file
+METRICS = False
+
+METRICS_DIR = None
+
+METRICS_DUMP_INTERVAL = 5
+
+# admission control, at most ADMISSION_LIMIT requests are handled concurrently
+# in a process (0 means no limit), and at most the limit of a path prefix in
+# ADMISSION_ROUTE_LIMITS, e.g. {'/api/export': 4}. Requests exceed the limits
+# wait in a queue of ADMISSION_QUEUE_SIZE for ADMISSION_QUEUE_TIMEOUT seconds,
+# then get 503 with Retry-After header of ADMISSION_RETRY_AFTER seconds
+ADMISSION_LIMIT = 0
+
+ADMISSION_ROUTE_LIMITS = {}
+
+ADMISSION_QUEUE_SIZE = 100
+
+ADMISSION_QUEUE_TIMEOUT = 1
+
+ADMISSION_RETRY_AFTER = 1
+
+# adjust the limits between ADMISSION_MIN_LIMIT and the configured ones,
+# decrease when requests take longer than ADMISSION_TARGET_LATENCY seconds
+ADMISSION_ADAPTIVE = False
+
+ADMISSION_TARGET_LATENCY = 0.5
+
+ADMISSION_MIN_LIMIT = 1
+
+# responses cached by ``torext.cache.ResponseCacheMixin`` in each process take at most
+# RESPONSE_CACHE_SIZE bytes, TTL of the handlers could be overridden by path prefix
+# in RESPONSE_CACHE_ROUTE_TTLS, e.g. {'/api/articles': 10}
+RESPONSE_CACHE_SIZE = 64 * 1024 * 1024
+
+RESPONSE_CACHE_ROUTE_TTLS = {}
+
+# buckets of ``torext.ratelimit.RateLimitMixin`` are stored in this file which is
+# mapped into memory by all processes, None means a file named by PORT in temp
+# directory. The file holds RATELIMIT_SLOTS buckets, 24 bytes each
+RATELIMIT_FILE = None
+
+RATELIMIT_SLOTS = 65536
+
+# reload settings in every process on SIGUSR1, or when the files change if
+# SETTINGS_RELOAD_INTERVAL (seconds) > 0. The settings module is read again,
+# then SETTINGS_RELOAD_FILE (a python or .json file) over it, only keys
+# in SETTINGS_RELOADABLE are applied, others require a restart
+SETTINGS_RELOAD = False
+
+SETTINGS_RELOAD_FILE = None
+
+SETTINGS_RELOAD_INTERVAL = 0
+
+SETTINGS_RELOADABLE = [
+    'LOGGERS',
+    'LOG_REQUEST',
+    'LOG_RESPONSE',
+    'LOG_RESPONSE_LINE_LIMIT',
+    'LOGGING_IGNORE_URLS',
+    'METRICS',
+]
+
 DEBUG = True
 
 AUTORELOAD = True
@@ -32,6 +145,29 @@ TEMPLATE_PATH = 'template'
 
 TEMPLATE_ENGINE = 'tornado'
 
+# find the handler of a request in a tree of path segments compiled from the
+# routes, instead of trying the route regexes one by one, see ``torext.route.RadixRouter``
+RADIX_ROUTER = False
+
+# import the modules of ``include`` on the first request that matches their routes
+# instead of on startup, or soon after the server starts if LAZY_ROUTES_WARMUP.
+# With ROUTE_MANIFEST, a file written by ``app.write_route_manifest``, the routes
+# of lazy includes are registered without importing their modules
+LAZY_ROUTES = False
+
+LAZY_ROUTES_WARMUP = False
+
+ROUTE_MANIFEST = None
+
+# add `'queue': True` to a logger to write its records in a background thread,
+# so that a slow stderr never blocks the ioloop, at most `queue_size` (10000)
+# records are queued, more are dropped, or waited for if `queue_block` is True
+# add `'formatter': 'json'` to write records as JSON lines, see ``torext.log.JSONFormatter``
+# add `'handler': 'rotating_file'` (with `filename`, `max_bytes`, `backup_count`) or
+# `'handler': 'timed_rotating_file'` (with `filename`, `when`, `interval`, `backup_count`)
+# to write to a file, with multiple processes, the file is written by a log writer
+# process, other processes ship records to it by unix socket LOG_WRITER_SOCKET
+# (a file named by PORT in temp directory if None)
 LOGGERS = {
     '': {
         'level': 'INFO',
@@ -41,16 +177,69 @@ LOGGERS = {
     }
 }
 
+LOG_WRITER_SOCKET = None
+
+# keep a context for each request, which carries the request ID taken from
+# REQUEST_ID_HEADER or generated, the ID is added to log records as `request_id`,
+# sent back in the response and with the requests of AsyncHTTPClient
+REQUEST_ID = False
+
+REQUEST_ID_HEADER = 'X-Request-Id'
+
 LOG_REQUEST = False
 
 LOG_RESPONSE = False
 
 LOG_RESPONSE_LINE_LIMIT = 0
 
+# debug single requests: log request, response and timing spans, see ``torext.debuglog``,
+# chosen by a token signed by DEBUG_REQUEST_SECRET in the header or cookie,
+# path patterns (regex) in DEBUG_REQUEST_ROUTES, or sampled by DEBUG_REQUEST_SAMPLE_RATE
+DEBUG_REQUEST_SECRET = None
+
+DEBUG_REQUEST_HEADER = 'X-Debug-Token'
+
+DEBUG_REQUEST_COOKIE = 'debug_token'
+
+DEBUG_REQUEST_ROUTES = []
+
+DEBUG_REQUEST_SAMPLE_RATE = 0
+
 LOGGING_IGNORE_URLS = [
     '/favicon.ico',
 ]
 
+# write access log as JSON lines to ACCESS_LOG_FILE (stdout if None) instead of
+# the log lines of ``torext.request`` logger, in batches of ACCESS_LOG_BUFFER_SIZE
+# bytes or every ACCESS_LOG_FLUSH_INTERVAL seconds
+ACCESS_LOG = False
+
+ACCESS_LOG_FILE = None
+
+ACCESS_LOG_BUFFER_SIZE = 65536
+
+ACCESS_LOG_FLUSH_INTERVAL = 1
+
+# fraction of requests to be logged, by the path prefix in ACCESS_LOG_ROUTE_SAMPLE_RATES,
+# or by the status code in ACCESS_LOG_STATUS_SAMPLE_RATES, or ACCESS_LOG_SAMPLE_RATE;
+# errors (5xx) and requests slower than ACCESS_LOG_SLOW_THRESHOLD seconds are always logged
+ACCESS_LOG_SAMPLE_RATE = 1.0
+
+ACCESS_LOG_ROUTE_SAMPLE_RATES = {}
+
+ACCESS_LOG_STATUS_SAMPLE_RATES = {}
+
+ACCESS_LOG_SLOW_THRESHOLD = 1
+
+# log at most ERROR_LOG_LIMIT tracebacks of the same uncaught exception (by type and
+# innermost ERROR_LOG_FRAMES frames) in ERROR_LOG_INTERVAL seconds, the others are
+# counted and summarized at the end of the interval, 0 means log all of them
+ERROR_LOG_LIMIT = 0
+
+ERROR_LOG_INTERVAL = 60
+
+ERROR_LOG_FRAMES = 3
+
 TESTING = False
 
 TIME_ZONE = 'Asia/Shanghai'
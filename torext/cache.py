@@ -0,0 +1,322 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Response cache
+#
+# Full responses of GET requests are kept in the memory of each process,
+# keyed by path, query arguments, and the headers and cookies that the
+# response varies on. The cache is bounded by RESPONSE_CACHE_SIZE bytes of
+# response bodies and headers, the least recently used responses are evicted
+# first.
+#
+# A response is fresh for the TTL of its handler, or of the longest matching
+# path prefix in RESPONSE_CACHE_ROUTE_TTLS. Within CACHE_STALE_TTL seconds after
+# that, the stale response is still served immediately, while one request is
+# dispatched in background to compute a fresh one (stale-while-revalidate),
+# so clients never wait for a popular endpoint to be recomputed.
+
+import time
+from collections import OrderedDict
+
+from tornado.httpserver import HTTPRequest
+from tornado.httputil import HTTPHeaders
+from tornado.ioloop import IOLoop
+
+from torext import settings
+from torext.accesslog import PrefixMatcher
+from torext.log import app_log
+
+
+# headers of a response that are not kept in cache
+UNCACHED_HEADERS = frozenset(['Date', 'Server', 'Content-Length', 'Etag', 'Set-Cookie',
+                              'X-Cache', 'Age'])
+
+# conditional headers are not sent with background requests,
+# which should always get the full response
+CONDITIONAL_HEADERS = frozenset(['If-None-Match', 'If-Modified-Since'])
+
+
+class CacheEntry(object):
+    __slots__ = ('status', 'headers', 'body', 'size', 'created', 'expires', 'stale_until')
+
+    def __init__(self, status, headers, body, ttl, stale_ttl):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.size = len(body) + sum(len(k) + len(v) for k, v in headers)
+        self.created = time.time()
+        self.expires = self.created + ttl
+        self.stale_until = self.expires + stale_ttl
+
+
+class ResponseCache(object):
+    def __init__(self, max_size, route_ttls=None):
+        """`max_size` is in bytes, `route_ttls` is a dict of path prefix to TTL"""
+        self.max_size = max_size
+        self.route_ttls = route_ttls or {}
+        self.route_matcher = PrefixMatcher(self.route_ttls)
+        self.entries = OrderedDict()
+        self.size = 0
+        # keys being recomputed in background
+        self.refreshing = set()
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(settings['RESPONSE_CACHE_SIZE'], route_ttls=settings['RESPONSE_CACHE_ROUTE_TTLS'])
+
+    def get_ttl(self, path, default):
+        prefix = self.route_matcher.match(path)
+        if prefix is not None:
+            return self.route_ttls[prefix]
+        return default
+
+    def get(self, key):
+        """Return ``(entry, is_fresh)``, entry is None if missing or too stale"""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None, False
+        now = time.time()
+        if now >= entry.stale_until:
+            self.delete(key)
+            self.misses += 1
+            return None, False
+        # most recently used ones are at the end
+        del self.entries[key]
+        self.entries[key] = entry
+        if now < entry.expires:
+            self.hits += 1
+            return entry, True
+        self.stale_hits += 1
+        return entry, False
+
+    def set(self, key, entry):
+        if entry.size > self.max_size:
+            return
+        self.delete(key)
+        self.entries[key] = entry
+        self.size += entry.size
+        while self.size > self.max_size:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= evicted.size
+            self.evictions += 1
+
+    def delete(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def stats(self):
+        return {
+            'entries': len(self.entries),
+            'size': self.size,
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'refreshing': len(self.refreshing),
+        }
+
+    def format_prometheus(self, prefix='torext'):
+        """Render the counters in Prometheus text exposition format"""
+        lines = [
+            '# HELP %s_response_cache_requests_total Lookups of response cache.' % prefix,
+            '# TYPE %s_response_cache_requests_total counter' % prefix,
+        ]
+        for result, count in (('hit', self.hits), ('stale', self.stale_hits), ('miss', self.misses)):
+            lines.append('%s_response_cache_requests_total{result="%s"} %s' % (prefix, result, count))
+        lines.append('# HELP %s_response_cache_evictions_total Responses evicted from cache.' % prefix)
+        lines.append('# TYPE %s_response_cache_evictions_total counter' % prefix)
+        lines.append('%s_response_cache_evictions_total %s' % (prefix, self.evictions))
+        lines.append('# HELP %s_response_cache_bytes Size of cached responses.' % prefix)
+        lines.append('# TYPE %s_response_cache_bytes gauge' % prefix)
+        lines.append('%s_response_cache_bytes %s' % (prefix, self.size))
+        return '\n'.join(lines) + '\n'
+
+
+_cache = None
+
+
+def get_cache(create=True):
+    """The cache of current process, None if it's not created and not `create`"""
+    global _cache
+    if _cache is None and create:
+        _cache = ResponseCache.from_settings(settings)
+    return _cache
+
+
+def get_response_headers(handler):
+    """Return the headers of the response of `handler` that could be
+    replayed to other requests, as a list of ``(name, value)``
+    """
+    request_id_header = settings.frozen.REQUEST_ID_HEADER
+    return [(k, v) for k, v in handler._headers.get_all()
+            if k not in UNCACHED_HEADERS and k != request_id_header]
+
+
+def set_response_headers(handler, headers):
+    names = set()
+    for k, v in headers:
+        if k in names:
+            handler.add_header(k, v)
+        else:
+            handler.set_header(k, v)
+            names.add(k)
+
+
+class _NullStream(object):
+    def closed(self):
+        return False
+
+    def set_close_callback(self, callback):
+        pass
+
+
+class RefreshConnection(object):
+    """Connection of a background request, which discards the response,
+    as it is put into cache by the handler
+    """
+    xheaders = False
+
+    def __init__(self):
+        self.stream = _NullStream()
+
+    def set_close_callback(self, callback):
+        pass
+
+    def write(self, chunk, callback=None):
+        if callback is not None:
+            IOLoop.current().add_callback(callback)
+
+    def finish(self):
+        pass
+
+
+def make_refresh_request(request):
+    """Copy `request` into a GET request without a client"""
+    headers = HTTPHeaders()
+    for k, v in request.headers.get_all():
+        if k not in CONDITIONAL_HEADERS:
+            headers.add(k, v)
+    refresh_request = HTTPRequest(
+        'GET', request.uri, version=request.version, headers=headers,
+        remote_ip=request.remote_ip, protocol=request.protocol, host=request.host,
+        connection=RefreshConnection())
+    refresh_request._cache_refresh = True
+    return refresh_request
+
+
+class ResponseCacheMixin(object):
+    """Cache full responses of GET requests of a handler, add ``'cache'``
+    to ``PREPARES`` to enable it:
+
+    >>> class ArticlesHandler(ResponseCacheMixin, BaseHandler):
+    ...     PREPARES = ['cache']
+    ...     CACHE_TTL = 10
+    ...     CACHE_STALE_TTL = 60
+    ...     CACHE_QUERY_ARGS = ['page']
+
+    Only responses of status 200 that set no cookie and were not flushed
+    before finish are cached. ``X-Cache`` header of the response tells
+    whether it's a ``HIT``, a ``STALE`` one, or a ``MISS``.
+    """
+    # seconds a response is fresh, could be overridden by ``RESPONSE_CACHE_ROUTE_TTLS``
+    CACHE_TTL = 60
+
+    # seconds a stale response could be served after TTL, while being refreshed
+    CACHE_STALE_TTL = 0
+
+    # query arguments in the key, None means all of them
+    CACHE_QUERY_ARGS = None
+
+    # request headers in the key, e.g. ['Accept-Language']
+    CACHE_HEADERS = []
+
+    # cookies in the key
+    CACHE_COOKIES = []
+
+    _cache_key = None
+
+    def get_cache_key(self):
+        """Override to add other things like user id,
+        return None to skip cache for the request
+        """
+        request = self.request
+        if self.CACHE_QUERY_ARGS is None:
+            names = sorted(request.arguments)
+        else:
+            names = self.CACHE_QUERY_ARGS
+        parts = [self.__class__.__name__, request.path]
+        for name in names:
+            parts.append('%s=%s' % (name, request.arguments.get(name)))
+        for name in self.CACHE_HEADERS:
+            parts.append('%s:%s' % (name, request.headers.get(name)))
+        for name in self.CACHE_COOKIES:
+            parts.append('%s;%s' % (name, self.get_cookie(name)))
+        return '\n'.join(parts)
+
+    def prepare_cache(self):
+        if self.request.method != 'GET':
+            return
+        key = self.get_cache_key()
+        if key is None:
+            return
+        cache = get_cache()
+        if getattr(self.request, '_cache_refresh', False):
+            self._cache_key = key
+            return
+
+        entry, is_fresh = cache.get(key)
+        if entry is None:
+            # a refresh that never finished
+            cache.refreshing.discard(key)
+            self._cache_key = key
+            self.set_header('X-Cache', 'MISS')
+            return
+
+        if not is_fresh and key not in cache.refreshing:
+            cache.refreshing.add(key)
+            dispatch = getattr(self.application, '_dispatch', self.application)
+            IOLoop.current().add_callback(dispatch, make_refresh_request(self.request))
+        self.write_cached(entry, 'HIT' if is_fresh else 'STALE')
+
+    def write_cached(self, entry, state):
+        self.set_status(entry.status)
+        set_response_headers(self, entry.headers)
+        self.set_header('X-Cache', state)
+        self.set_header('Age', str(int(time.time() - entry.created)))
+        self.finish(entry.body)
+
+    def finish(self, chunk=None):
+        if self._cache_key is not None:
+            if chunk is not None:
+                self.write(chunk)
+                chunk = None
+            self._put_cache()
+        return super(ResponseCacheMixin, self).finish(chunk)
+
+    def _put_cache(self):
+        if self._status_code != 200 or self._headers_written or getattr(self, '_new_cookie', None):
+            return
+        body = b''.join(self._write_buffer)
+        cache = get_cache()
+        entry = CacheEntry(self._status_code, get_response_headers(self), body,
+                           cache.get_ttl(self.request.path, self.CACHE_TTL), self.CACHE_STALE_TTL)
+        cache.set(self._cache_key, entry)
+
+    def on_finish(self):
+        if getattr(self.request, '_cache_refresh', False) and self._cache_key is not None:
+            get_cache().refreshing.discard(self._cache_key)
+            if self._status_code != 200:
+                app_log.warning('Failed to refresh cached response of %s, status %s',
+                                self.request.uri, self._status_code)
+        super(ResponseCacheMixin, self).on_finish()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Single-flight coalescing of identical requests
+#
+# The first request of a key (the leader) is handled as usual, identical
+# requests that come while it is in progress (the followers) do not run the
+# handler method, but wait for the leader, then get a copy of its status,
+# headers and body. So when a popular expensive endpoint is not cached, it is
+# computed once instead of once per concurrent request.
+#
+# Errors of the leader, like a 500 page, are shared with the followers as any
+# other response. A response that could not be copied, i.e. one that sets
+# cookies or was flushed before finish, is not shared, the followers run the
+# handler method themselves instead. A follower that waits longer than
+# COALESCE_TIMEOUT gets 504, and a flight older than that is considered lost,
+# e.g. the leader never finishes, so the next request becomes a new leader.
+
+import time
+
+from tornado import stack_context
+from tornado.ioloop import IOLoop
+
+from torext.cache import get_response_headers, set_response_headers
+from torext.log import app_log
+
+
+class Flight(object):
+    __slots__ = ('key', 'started', 'callbacks')
+
+    def __init__(self, key):
+        self.key = key
+        self.started = time.time()
+        # called with the response of the leader when it finishes
+        self.callbacks = []
+
+
+class FlightGroup(object):
+    def __init__(self):
+        # key -> Flight
+        self.flights = {}
+        self.leaders = 0
+        self.followers = 0
+        self.timeouts = 0
+
+    def join(self, key, callback, timeout):
+        """Return the flight if the caller is the leader, otherwise
+        `callback` is added to the flight in progress and None is returned
+        """
+        flight = self.flights.get(key)
+        if flight is None or time.time() - flight.started > timeout:
+            flight = self.flights[key] = Flight(key)
+            self.leaders += 1
+            return flight
+        flight.callbacks.append(callback)
+        self.followers += 1
+        return None
+
+    def land(self, flight, response):
+        """Pass the response of the leader to the followers, `response` is
+        ``(status, reason, headers, body)``, or None if it could not be shared
+        """
+        if self.flights.get(flight.key) is flight:
+            del self.flights[flight.key]
+        for callback in flight.callbacks:
+            try:
+                callback(response)
+            except Exception:
+                app_log.error('Failed to pass coalesced response of %s', flight.key, exc_info=True)
+
+    def stats(self):
+        return {
+            'inflight': len(self.flights),
+            'leaders': self.leaders,
+            'followers': self.followers,
+            'timeouts': self.timeouts,
+        }
+
+
+_group = None
+
+
+def get_flight_group(create=True):
+    """The flights of current process, None if not created and not `create`"""
+    global _group
+    if _group is None and create:
+        _group = FlightGroup()
+    return _group
+
+
+class CoalesceMixin(object):
+    """Coalesce concurrent identical GET requests of a handler, add
+    ``'coalesce'`` to ``PREPARES`` to enable it, after the prepares that
+    reject requests, like authentication:
+
+    >>> class ReportHandler(CoalesceMixin, BaseHandler):
+    ...     PREPARES = ['auth', 'coalesce']
+    ...     COALESCE_TIMEOUT = 5
+
+    Requests are identical if they have the same path and query arguments,
+    override ``get_coalesce_key`` if the response depends on other things,
+    like the current user.
+    """
+    # seconds a follower waits for the leader
+    COALESCE_TIMEOUT = 10
+
+    _flight = None
+
+    _coalesce_timeout = None
+
+    def get_coalesce_key(self):
+        """Return None to handle the request on its own"""
+        request = self.request
+        args = ['%s=%s' % (name, request.arguments[name]) for name in sorted(request.arguments)]
+        return '\n'.join([self.__class__.__name__, request.path] + args)
+
+    def prepare_coalesce(self):
+        if self.request.method != 'GET':
+            return
+        key = self.get_coalesce_key()
+        if key is None:
+            return
+        # run in the stack context of this request, not the leader's
+        callback = stack_context.wrap(self._on_landed)
+        self._flight = get_flight_group().join(key, callback, self.COALESCE_TIMEOUT)
+        if self._flight is not None:
+            return
+
+        # wait asynchronously instead of calling the handler method
+        self._auto_finish = False
+        setattr(self, self.request.method.lower(), self._wait_for_leader)
+        self._coalesce_timeout = IOLoop.current().add_timeout(
+            time.time() + self.COALESCE_TIMEOUT, self._on_coalesce_timeout)
+
+    def _wait_for_leader(self, *args, **kwargs):
+        pass
+
+    def _on_coalesce_timeout(self):
+        self._coalesce_timeout = None
+        if self._finished:
+            return
+        get_flight_group().timeouts += 1
+        self.send_error(504)
+
+    def _on_landed(self, response):
+        if self._finished:
+            return
+        if self._coalesce_timeout is not None:
+            IOLoop.current().remove_timeout(self._coalesce_timeout)
+            self._coalesce_timeout = None
+        connection = self.request.connection
+        if connection and connection.stream.closed():
+            return
+
+        if response is None:
+            # run the handler method as it would be without coalescing
+            method = self.request.method.lower()
+            delattr(self, method)
+            self._auto_finish = True
+            try:
+                getattr(self, method)(*self.path_args, **self.path_kwargs)
+                if self._auto_finish and not self._finished:
+                    self.finish()
+            except Exception as e:
+                self._handle_request_exception(e)
+            return
+
+        status, reason, headers, body = response
+        self.set_status(status, reason=reason)
+        set_response_headers(self, headers)
+        self.finish(body)
+
+    def finish(self, chunk=None):
+        flight = self._flight
+        if flight is None:
+            return super(CoalesceMixin, self).finish(chunk)
+
+        self._flight = None
+        if chunk is not None:
+            self.write(chunk)
+        if self._headers_written or getattr(self, '_new_cookie', None):
+            response = None
+        else:
+            response = (self._status_code, self._reason, get_response_headers(self),
+                        b''.join(self._write_buffer))
+        try:
+            return super(CoalesceMixin, self).finish()
+        finally:
+            # followers are released even if finishing the leader fails
+            get_flight_group().land(flight, response)
@@ -6,10 +6,12 @@ PY2 = sys.version_info.major == 2
 
 
 if PY2:
-    from urllib import urlencode, quote
+    from urllib import urlencode, quote, quote_plus
     from urlparse import urljoin
     import httplib
     from Cookie import SimpleCookie
+    from Queue import Queue, Full
+    import cPickle as pickle
     def unicode_(s, *args):
         return unicode(s, *args)
     def decode_(s, *args):
@@ -18,10 +20,15 @@ if PY2:
         return s
     def str_(s):
         return s
+    def native_(s):
+        return s
+    string_types = basestring
 else:
-    from urllib.parse import urlencode, quote, urljoin
+    from urllib.parse import urlencode, quote, quote_plus, urljoin
     import http.client as httplib
     from http.cookies import SimpleCookie
+    from queue import Queue, Full
+    import pickle
     def unicode_(s, *args):
         return s
     def decode_(s, *args):
@@ -30,3 +37,9 @@ else:
         return s.encode('utf8')
     def str_(s):
         return s.decode('utf8')
+    def native_(s):
+        # for logging, undecodable bytes should not fail it
+        if isinstance(s, bytes):
+            return s.decode('utf8', 'replace')
+        return s
+    string_types = str
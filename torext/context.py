@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Request context
+#
+# There is no contextvars in python 2, and a thread local alone is wrong
+# on the IOLoop, where requests take turns in one thread. The context of a
+# request is stored in a thread local, and is kept with the request by a
+# tornado ``StackContext``: every callback scheduled while handling the
+# request (IOLoop timeouts, IOStream callbacks, AsyncHTTPClient callbacks,
+# coroutines) is wrapped to set the context back when it runs, and to
+# restore the previous one afterwards.
+#
+# The context carries the request ID, which is taken from the inbound
+# ``REQUEST_ID_HEADER`` header, or generated. It is added to every log
+# record as ``request_id`` by ``RequestIDFilter``, sent back in the
+# response, and sent with the requests of ``AsyncHTTPClient``. It also
+# tells whether the request is debugged, so that its DEBUG records are
+# written, see ``torext.debuglog``.
+
+import re
+import random
+import threading
+import functools
+
+from tornado import stack_context
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+
+from torext.utils import LocalProxy
+
+
+# an inbound ID is accepted only if it's safe to be logged
+REQUEST_ID_REGEX = re.compile(r'^[\w\-.:]{1,128}$')
+
+
+class _State(threading.local):
+    context = None
+
+
+_state = _State()
+
+
+class RequestContext(object):
+    __slots__ = ('request_id', 'debug')
+
+    def __init__(self, request_id):
+        self.request_id = request_id
+        # a ``DebugLevels`` if the request is debugged, it's entered while
+        # callbacks of the request run, see ``torext.debuglog``
+        self.debug = None
+
+
+class RequestContextManager(object):
+    """Set `context` as current request context, created by the factory of
+    ``StackContext`` every time a callback of the request runs
+    """
+    __slots__ = ('context', 'old_context')
+
+    def __init__(self, context):
+        self.context = context
+
+    def __enter__(self):
+        self.old_context = _state.context
+        _state.context = self.context
+        if self.context.debug:
+            self.context.debug.enter()
+
+    def __exit__(self, *exc_info):
+        if self.context.debug:
+            self.context.debug.exit()
+        _state.context = self.old_context
+
+
+def get_context():
+    return _state.context
+
+
+def get_request_id():
+    context = _state.context
+    return context and context.request_id
+
+
+current_context = LocalProxy(get_context)
+
+
+def generate_request_id():
+    return '%016x' % random.getrandbits(64)
+
+
+def make_request_context(request, header='X-Request-Id'):
+    """Return a new RequestContext for `request`, and the StackContext
+    which keeps it, use them like:
+
+    >>> stack_context, context = make_request_context(request)
+    >>> with stack_context:
+    ...     handle(request)
+    """
+    request_id = request.headers.get(header)
+    if not request_id or not REQUEST_ID_REGEX.match(request_id):
+        request_id = generate_request_id()
+    context = RequestContext(request_id)
+    return stack_context.StackContext(functools.partial(RequestContextManager, context)), context
+
+
+class RequestIDFilter(object):
+    """Add the ID of current request (or '-') to log records as ``request_id``"""
+    def filter(self, record):
+        context = _state.context
+        record.request_id = context.request_id if context else '-'
+        return True
+
+
+request_id_filter = RequestIDFilter()
+
+
+def _fetch(fetch, header):
+    def wrapper(self, request, callback=None, **kwargs):
+        context = _state.context
+        if context is not None:
+            if not isinstance(request, HTTPRequest):
+                request = HTTPRequest(url=request, **kwargs)
+                kwargs = {}
+            if header not in request.headers:
+                request.headers[header] = context.request_id
+        return fetch(self, request, callback, **kwargs)
+    return wrapper
+
+
+def propagate_request_id(header='X-Request-Id'):
+    """Send the request ID with every request made by ``AsyncHTTPClient``,
+    ``fetch`` of the base class is wrapped, so that clients created before
+    and all implementations are covered
+    """
+    if getattr(AsyncHTTPClient.fetch, 'propagates_request_id', False):
+        return
+    fetch = _fetch(AsyncHTTPClient.fetch, header)
+    fetch.propagates_request_id = True
+    AsyncHTTPClient.fetch = fetch
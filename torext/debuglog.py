@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Per-request debugging
+#
+# ``LOG_REQUEST``, ``LOG_RESPONSE`` and DEBUG level apply to every request,
+# which is too much under load. A single request could be debugged instead,
+# chosen by one of:
+#   1. a token signed by ``DEBUG_REQUEST_SECRET``, in the header
+#      ``DEBUG_REQUEST_HEADER`` or the cookie ``DEBUG_REQUEST_COOKIE``
+#   2. a path matching one of the patterns in ``DEBUG_REQUEST_ROUTES``
+#   3. a random fraction ``DEBUG_REQUEST_SAMPLE_RATE`` of requests
+#
+# For a debugged request, ``BaseHandler`` logs the request and response by
+# ``log_request`` and ``log_response``, writes ``log_debug`` at INFO level,
+# and logs the timing spans recorded by ``span`` when it finishes. Other
+# requests only pay for one attribute check.
+#
+# DEBUG records of a debugged request, from ``app_log.debug``, torext or
+# libraries, are written too: the request context carries ``debug_levels``,
+# which lowers loggers to DEBUG only while a callback of the request runs,
+# other requests keep the configured levels.
+#
+# A token is created by:
+# >>> RequestDebugger.from_settings(settings).make_token('someone')
+
+import re
+import time
+import random
+import logging
+
+from tornado.web import create_signed_value, decode_signed_value
+
+from torext.compat import native_
+from torext.context import get_context
+from torext.log import app_log
+
+
+TOKEN_NAME = 'torext_debug'
+
+
+class Span(object):
+    def __init__(self, spans, name):
+        self.spans = spans
+        self.name = name
+        self.start = time.time()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.finish()
+
+    def finish(self):
+        self.spans.append((self.name, self.start, time.time()))
+
+
+class NullSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def finish(self):
+        pass
+
+
+null_span = NullSpan()
+
+
+class RequestDebugger(object):
+    def __init__(self, secret=None, header='X-Debug-Token', cookie='debug_token',
+                 sample_rate=0, routes=()):
+        self.secret = secret
+        self.header = header
+        self.cookie = cookie
+        self.sample_rate = sample_rate
+        if routes:
+            self.routes_regex = re.compile('|'.join('(?:%s)$' % i for i in routes))
+        else:
+            self.routes_regex = None
+
+    @classmethod
+    def from_settings(cls, settings):
+        if not (settings['DEBUG_REQUEST_SECRET'] or settings['DEBUG_REQUEST_ROUTES'] or
+                settings['DEBUG_REQUEST_SAMPLE_RATE']):
+            return None
+        return cls(secret=settings['DEBUG_REQUEST_SECRET'],
+                   header=settings['DEBUG_REQUEST_HEADER'],
+                   cookie=settings['DEBUG_REQUEST_COOKIE'],
+                   sample_rate=settings['DEBUG_REQUEST_SAMPLE_RATE'],
+                   routes=settings['DEBUG_REQUEST_ROUTES'])
+
+    def make_token(self, value='debug'):
+        """Create a token valid for one day, `value` could tell who made it"""
+        # a native string, which is what headers and cookies are compared with
+        return native_(create_signed_value(self.secret, TOKEN_NAME, value))
+
+    def match(self, request):
+        """Return the reason why `request` should be debugged, or None"""
+        if self.secret:
+            token = request.headers.get(self.header)
+            if not token and self.cookie in request.cookies:
+                token = request.cookies[self.cookie].value
+            if token and decode_signed_value(self.secret, TOKEN_NAME, token, max_age_days=1):
+                return 'token'
+        if self.routes_regex and self.routes_regex.match(request.path):
+            return 'route'
+        if self.sample_rate and random.random() < self.sample_rate:
+            return 'sample'
+        return None
+
+
+def log_spans(handler):
+    request = handler.request
+    start = request._start_time
+    lines = []
+    for name, span_start, span_end in handler._debug_spans:
+        lines.append('| %-30s +%8.2fms %8.2fms' % (
+            name, (span_start - start) * 1000, (span_end - span_start) * 1000))
+    app_log.info('Debug %s %s (%s), %.2fms, spans:\n%s', handler.get_status(),
+                 handler._request_summary(), handler.debug_reason,
+                 request.request_time() * 1000, '\n'.join(lines) or '| (none)')
+
+
+class DebugLevels(object):
+    """Lower loggers to DEBUG while a callback of a debugged request runs,
+    entered and exited by the stack context of the request, so other
+    requests on the IOLoop are not affected. It's also the filter added to
+    the handlers, which drops records under the original levels logged
+    meanwhile by other threads
+    """
+    def __init__(self):
+        self.depth = 0
+        # logger -> original level
+        self.levels = {}
+
+    def enter(self):
+        self.depth += 1
+        if self.depth > 1:
+            return
+        loggers = [logging.root] + [i for i in logging.Logger.manager.loggerDict.values()
+                                    if isinstance(i, logging.Logger)]
+        for logger in loggers:
+            # NOTSET ones follow their parents
+            if logger.level > logging.DEBUG:
+                self.levels[logger] = logger.level
+                logger.setLevel(logging.DEBUG)
+            for handler in logger.handlers:
+                if self not in handler.filters:
+                    handler.addFilter(self)
+
+    def exit(self):
+        self.depth -= 1
+        if self.depth > 0:
+            return
+        for logger, level in self.levels.items():
+            # unless it's changed meanwhile, e.g. by ``set_logger``
+            if logger.level == logging.DEBUG:
+                logger.setLevel(level)
+        self.levels = {}
+
+    def get_level(self, name):
+        """The effective level of logger `name` before lowered"""
+        logger = logging.root if name == 'root' else logging.getLogger(name)
+        while logger:
+            level = self.levels.get(logger, logger.level)
+            if level:
+                return level
+            logger = logger.parent
+        return logging.NOTSET
+
+    def filter(self, record):
+        if not self.levels or record.levelno >= self.get_level(record.name):
+            return True
+        context = get_context()
+        return bool(context and context.debug)
+
+
+debug_levels = DebugLevels()
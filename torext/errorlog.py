@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Error log deduplication
+#
+# When a dependency goes down, every request fails with the same exception,
+# and logging the full traceback of each one floods the disk and the log
+# shippers. Uncaught exceptions are fingerprinted by their type and the
+# innermost frames of the traceback, only the first `limit` tracebacks of a
+# fingerprint are logged in an interval, the rest are counted and reported
+# by one line per fingerprint at the end of the interval.
+
+import time
+import hashlib
+from collections import deque
+
+from torext.log import app_log
+
+
+def fingerprint(exc_info, frames=3):
+    """Hash of the exception type and the innermost `frames` frames,
+    line numbers are included so that different raises are told apart
+    """
+    exc_type, _, tb = exc_info
+    entries = deque(maxlen=frames)
+    while tb is not None:
+        code = tb.tb_frame.f_code
+        entries.append('%s:%s:%s' % (code.co_filename, tb.tb_lineno, code.co_name))
+        tb = tb.tb_next
+    key = '%s.%s|%s' % (exc_type.__module__, exc_type.__name__, '|'.join(entries))
+    return hashlib.md5(key.encode('utf8')).hexdigest()[:12]
+
+
+class ErrorLog(object):
+    def __init__(self, limit=10, interval=60, frames=3):
+        self.limit = limit
+        self.interval = interval
+        self.frames = frames
+        # fingerprint -> [count, exception summary]
+        self.errors = {}
+        self.interval_start = time.time()
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(limit=settings['ERROR_LOG_LIMIT'],
+                   interval=settings['ERROR_LOG_INTERVAL'],
+                   frames=settings['ERROR_LOG_FRAMES'])
+
+    def should_log(self, exc_info):
+        """Count the exception, return ``(whether to log its traceback, fingerprint)``"""
+        if time.time() - self.interval_start >= self.interval:
+            self.report()
+        fp = fingerprint(exc_info, self.frames)
+        error = self.errors.get(fp)
+        if error is None:
+            error = self.errors[fp] = [0, None]
+        error[0] += 1
+        if error[0] <= self.limit:
+            return True, fp
+        error[1] = '%s: %s' % (exc_info[0].__name__, exc_info[1])
+        return False, fp
+
+    def report(self):
+        """Log the counts of suppressed exceptions, then start a new interval"""
+        elapsed = time.time() - self.interval_start
+        for fp, (count, summary) in self.errors.items():
+            if count > self.limit:
+                app_log.error('Uncaught exception [%s] %s, suppressed %d of %d in last %ds',
+                              fp, summary, count - self.limit, count, elapsed)
+        self.errors = {}
+        self.interval_start = time.time()
@@ -17,9 +17,11 @@ from tornado.escape import utf8
 
 from torext import settings, errors
 from torext.log import app_log
+from torext.debuglog import Span, null_span, log_spans, debug_levels
+from torext.context import make_request_context
 from torext.app import TorextApp
 from torext.utils import raise_exc_info
-from torext.compat import httplib
+from torext.compat import httplib, native_
 
 
 def log_response(handler):
@@ -31,7 +33,8 @@ def log_response(handler):
     if you are laze as I was and working in development, nothing could stop you.
     """
     content_type = handler._headers.get('Content-Type', None)
-    headers_str = handler._generate_headers()
+    # headers and body are bytes on python 3
+    headers_str = native_(handler._generate_headers())
     block = 'Response Infomations:\n' + headers_str.strip()
 
     if content_type and ('text' in content_type or 'json' in content_type):
@@ -45,7 +48,7 @@ def log_response(handler):
             else:
                 return [s]
 
-        body = ''.join(handler._write_buffer)
+        body = native_(b''.join(handler._write_buffer))
         lines = []
         for i in body.split('\n'):
             lines += ['| ' + j for j in cut(i)]
@@ -91,6 +94,46 @@ class BaseHandler(tornado.web.RequestHandler):
 
     PREPARES = []
 
+    # why this request is debugged, see ``torext.debuglog``
+    debug_reason = None
+
+    # the RequestContext if REQUEST_ID is on or the request is debugged,
+    # see ``torext.context``
+    context = None
+
+    def _execute(self, transforms, *args, **kwargs):
+        frozen = settings.frozen
+        debugger = self.app and self.app.request_debugger
+        if debugger:
+            self.debug_reason = debugger.match(self.request)
+            if self.debug_reason:
+                self._debug_spans = []
+        if not frozen.REQUEST_ID and not self.debug_reason:
+            return super(BaseHandler, self)._execute(transforms, *args, **kwargs)
+        # all callbacks of the request are run with the context
+        stack_context, self.context = make_request_context(self.request, frozen.REQUEST_ID_HEADER)
+        if frozen.REQUEST_ID:
+            self.set_header(frozen.REQUEST_ID_HEADER, self.context.request_id)
+        if self.debug_reason:
+            # let DEBUG records of this request be written
+            self.context.debug = debug_levels
+        with stack_context:
+            super(BaseHandler, self)._execute(transforms, *args, **kwargs)
+
+    def clear(self):
+        super(BaseHandler, self).clear()
+        # keep the ID when the response is cleared by `send_error`
+        if self.context and settings.frozen.REQUEST_ID:
+            self.set_header(settings.frozen.REQUEST_ID_HEADER, self.context.request_id)
+
+    @property
+    def request_id(self):
+        return self.context and self.context.request_id
+
+    def reverse_url(self, name, *args, **kwargs):
+        """Named groups could be filled by keyword arguments"""
+        return self.application.reverse_url(name, *args, **kwargs)
+
     def _exception_default_handler(self, e):
         """This method is a copy of tornado.web.RequestHandler._handle_request_exception
         """
@@ -105,8 +148,15 @@ class BaseHandler(tornado.web.RequestHandler):
             else:
                 self.send_error(e.status_code, exc_info=sys.exc_info())
         else:
-            app_log.error("Uncaught exception %s\n%r", self._request_summary(),
-                          self.request, exc_info=True)
+            error_log = self.app and self.app.error_log
+            if error_log:
+                should_log, fp = error_log.should_log(sys.exc_info())
+                if should_log:
+                    app_log.error("Uncaught exception [%s] %s\n%r", fp, self._request_summary(),
+                                  self.request, exc_info=True)
+            else:
+                app_log.error("Uncaught exception %s\n%r", self._request_summary(),
+                              self.request, exc_info=True)
             self.send_error(500, exc_info=sys.exc_info())
 
     def _handle_request_exception(self, e):
@@ -142,6 +192,32 @@ class BaseHandler(tornado.web.RequestHandler):
         """Make `curl -I` useable"""
         self.finish()
 
+    def log_debug(self, msg, *args):
+        """Log at DEBUG level, or INFO level if this request is debugged,
+        so that it stands out among the DEBUG records of the request
+        """
+        if self.debug_reason:
+            app_log.info('[debug] ' + msg, *args)
+        else:
+            app_log.debug(msg, *args)
+
+    def span(self, name):
+        """Measure the time of a step if this request is debugged:
+
+        >>> with self.span('query users'):
+        ...     users = self.db.query(User).all()
+
+        or call ``finish`` on the returned span, for callback style code
+        """
+        if not self.debug_reason:
+            return null_span
+        return Span(self._debug_spans, name)
+
+    def _log(self):
+        super(BaseHandler, self)._log()
+        if self.debug_reason:
+            log_spans(self)
+
     @property
     def app(self):
         return TorextApp.current_app
@@ -169,7 +245,7 @@ class BaseHandler(tornado.web.RequestHandler):
 
         This method will not be called in wsgi mode
         """
-        if settings['LOG_RESPONSE'] and not self._status_code == 500:
+        if (settings.frozen.LOG_RESPONSE or self.debug_reason) and not self._status_code == 500:
             log_response(self)
 
         super(BaseHandler, self).flush(*args, **kwgs)
@@ -256,7 +332,7 @@ class BaseHandler(tornado.web.RequestHandler):
         will be executed by sequence. In this example, those methods are
         `_prepare_auth` and `_prepare_context`
         """
-        if settings['LOG_REQUEST']:
+        if settings.frozen.LOG_REQUEST or self.debug_reason:
             log_request(self)
 
         for i in self.PREPARES:
@@ -270,14 +346,15 @@ class BaseHandler(tornado.web.RequestHandler):
         it will only affect on template rendering process, ui modules feature,
         which is mostly exposed in `render` method, is kept to be used as normal.
         """
-        if 'tornado' == settings['TEMPLATE_ENGINE']:
+        engine = settings.frozen.TEMPLATE_ENGINE
+        if 'tornado' == engine:
             return super(BaseHandler, self).render_string(template_name, **kwargs)
-        elif 'jinja2' == settings['TEMPLATE_ENGINE']:
+        elif 'jinja2' == engine:
             return jinja2_render(template_name, **kwargs)
         else:
             raise errors.SettingsError(
                 '%s is not a supported TEMPLATE_ENGINE, should be `tornado` or `jinja2`'
-                % settings['TEMPLATE_ENGINE'])
+                % engine)
 
 
 class WSGIStreamHandler(BaseHandler):
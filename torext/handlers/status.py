@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+
+from torext import settings
+from torext.handlers.base import BaseHandler
+from torext.log import get_dropped_records
+from torext.cache import get_cache
+from torext.coalesce import get_flight_group
+from torext.metrics import Metrics
+
+
+class StatusHandler(BaseHandler):
+    """Report the state of current process, useful for an orchestrator
+    to wait on before stopping the process, e.g. a preStop hook:
+
+        until curl -s localhost:8000/_status | grep -q '"inflight": 0'; do sleep 1; done
+
+    Usage:
+    >>> app.route('/_status')(StatusHandler)
+    """
+    def get(self):
+        app = self.app
+        admission = getattr(app.application, 'admission', None)
+        cache = get_cache(create=False)
+        flights = get_flight_group(create=False)
+        self.write_json({
+            'pid': os.getpid(),
+            # this request itself is not counted
+            'inflight': app.inflight_requests,
+            'requests': app.request_count,
+            'shutting_down': app.is_shutting_down,
+            # in milliseconds, null if LOOP_MONITOR is off
+            'loop_lag': app.loop_monitor and app.loop_monitor.percentiles(),
+            'thread_pool': app.thread_pool and app.thread_pool.stats(),
+            'process_pool': app.process_pool and app.process_pool.stats(),
+            'admission': admission and admission.stats(),
+            # log records dropped by full queues of QueueHandler
+            'log_dropped': get_dropped_records(),
+            # null if no response is cached
+            'response_cache': cache and cache.stats(),
+            # null if no request is coalesced
+            'coalesce': flights and flights.stats(),
+        })
+
+
+class MetricsHandler(BaseHandler):
+    """Export request metrics in Prometheus text format, ``METRICS`` should
+    be turned on. When ``METRICS_DIR`` is set, metrics of all processes
+    are merged, so that any process could answer the scrape for the node.
+    Counters of ``torext.cache`` are those of current process.
+
+    Usage:
+    >>> app.route('/metrics')(MetricsHandler)
+    """
+    def get(self):
+        metrics = self.app.metrics
+        if settings['METRICS_DIR']:
+            self.app.dump_metrics()
+            metrics = Metrics.load(settings['METRICS_DIR'])
+        self.set_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        text = metrics.format_prometheus()
+        cache = get_cache(create=False)
+        if cache:
+            text += cache.format_prometheus()
+        self.write(text)
@@ -1,10 +1,19 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import os
+import re
 import sys
+import json
+import time
+import socket
+import struct
 import logging
+import logging.handlers
+import threading
 from torext.utils import split_kwargs
-from torext.compat import unicode_ as u_, decode_
+from torext.context import request_id_filter
+from torext.compat import unicode_ as u_, decode_, Queue, Full, pickle, string_types
 
 
 try:
@@ -20,13 +29,41 @@ request_log = logging.getLogger('torext.request')
 
 
 # borrow from tornado.options._LogFormatter.__init__
-def _color(lvl):
+def _color(lvl, stream=None):
+    return _get_colors(stream or sys.stderr)(lvl)
+
+
+_colors_cache = {}
+
+
+def _no_colors(lvl):
+    return u_(''), u_('')
+
+
+def _get_colors(stream):
+    """Detect color capability of `stream` once, return a function
+    of level to ``(color, end_color)``
+    """
+    try:
+        return _colors_cache[stream]
+    except KeyError:
+        pass
+    colors_map, _normal = _detect_colors(stream)
+
+    def get(lvl):
+        return colors_map.get(lvl, _normal), _normal
+
+    _colors_cache[stream] = get
+    return get
+
+
+def _detect_colors(stream):
     try:
         import curses
     except ImportError:
         curses = None
     color = False
-    if curses and sys.stderr.isatty():
+    if curses and stream.isatty():
         try:
             curses.setupterm()
             if curses.tigetnum("colors") > 0:
@@ -34,7 +71,7 @@ def _color(lvl):
         except:
             pass
     if not color:
-        return u_(''), u_('')
+        return {}, u_('')
     # The curses module has some str/bytes confusion in
     # python3.  Until version 3.2.3, most methods return
     # bytes, but only accept strings.  In addition, we want to
@@ -60,7 +97,7 @@ def _color(lvl):
     }
     _normal = u_(curses.tigetstr("sgr0"), "ascii")
 
-    return colors_map.get(lvl, _normal), _normal
+    return colors_map, _normal
 
 
 FIXED_LEVELNAMES = {
@@ -69,19 +106,25 @@ FIXED_LEVELNAMES = {
     'ERROR': 'ERRO'
 }
 
+FMT_FIELD_REGEX = re.compile(r'%\((\w+)\)')
+
 
 class BaseFormatter(logging.Formatter):
     def __init__(self,
                  fmt='%(color)s[%(fixed_levelname)s %(asctime)s %(module)s:%(lineno)d]%(end_color)s %(message)s',
                  datefmt='%Y-%m-%d %H:%M:%S',
-                 color=False,
-                 tab='  '):
+                 color=None,
+                 tab='  ',
+                 stream=None):
         """
         a log is constituted by two part: prefix + content
 
         prefix is determined by `prefixfmt`, whose color depends on logging level
 
         content is what passed to the log method, %(message)s by default
+
+        `stream` is where the log is written to, for detecting whether it
+        supports color, stderr by default, `color` False disables colors
         """
         # as origin __init__ function is very simple
         # (just store two attributes on self: _fmt & datefmt), execute it firstly
@@ -91,6 +134,17 @@ class BaseFormatter(logging.Formatter):
         self.ufmt = decode_(fmt, 'utf8')
         self.color = color
         self.tab = tab
+        self.stream = stream
+
+        # only the fields used in fmt are read from records
+        self.fields = ()
+        for i in FMT_FIELD_REGEX.findall(fmt):
+            if i not in self.fields and i not in ('color', 'end_color'):
+                self.fields += (i, )
+        self.with_color = 'color' in self.fmt or 'end_color' in self.fmt
+        self._colors = None
+        if color is False:
+            self._colors = _no_colors
 
     def _format_record(self, record):
         record.message = record.getMessage()
@@ -112,15 +166,17 @@ class BaseFormatter(logging.Formatter):
         self._format_record(record)
 
         record_dict = {}
-        for k, v in record.__dict__.items():
-            if isinstance(k, str):
-                k = decode_(k, 'utf8')
+        attrs = record.__dict__
+        for k in self.fields:
+            v = attrs[k]
             if isinstance(v, str):
                 v = decode_(v, 'utf8', 'replace')
             record_dict[k] = v
 
-        if 'color' in self.fmt or 'end_color' in self.fmt:
-            record_dict['color'], record_dict['end_color'] = _color(record.levelno)
+        if self.with_color:
+            if self._colors is None:
+                self._colors = _get_colors(self.stream or sys.stderr)
+            record_dict['color'], record_dict['end_color'] = self._colors(record.levelno)
 
         log = self.ufmt % record_dict
 
@@ -134,6 +190,61 @@ class BaseFormatter(logging.Formatter):
         return log
 
 
+# attributes of every LogRecord, the others are passed by `extra`
+RECORD_ATTRS = frozenset(logging.LogRecord('', 0, '', 0, '', (), None).__dict__) | frozenset([
+    'message', 'asctime', 'fixed_levelname', 'secs'])
+
+
+class JSONFormatter(logging.Formatter):
+    """Format a record as one line of JSON, with fields:
+
+        level, time, module, lineno, message, exc (only if exc_info is given)
+
+    and the extra fields passed by ``extra`` argument of log methods or set
+    on records by filters, values that are not JSON serializable are
+    written by their repr.
+
+    `time` is formatted by `datefmt`, or the unix timestamp if it's None.
+    """
+    encoder = json.JSONEncoder(separators=(',', ':'), default=repr)
+
+    def __init__(self, datefmt=None):
+        logging.Formatter.__init__(self, datefmt=datefmt)
+
+    def format(self, record):
+        message = record.getMessage()
+        if isinstance(message, str):
+            message = decode_(message, 'utf8', 'replace')
+        data = {
+            'level': record.levelname,
+            'time': self.formatTime(record, self.datefmt) if self.datefmt else record.created,
+            'module': record.module,
+            'lineno': record.lineno,
+            'message': message,
+        }
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exc'] = decode_(record.exc_text, 'utf8', 'replace')
+
+        attrs = record.__dict__
+        for k in attrs:
+            if k not in RECORD_ATTRS:
+                v = attrs[k]
+                if isinstance(v, str):
+                    v = decode_(v, 'utf8', 'replace')
+                data[k] = v
+        # encoded in one pass by the C encoder
+        return self.encoder.encode(data)
+
+
+FORMATTER_TYPES = {
+    'base': BaseFormatter,
+    'json': JSONFormatter,
+}
+
+
 class BaseStreamHandler(logging.StreamHandler):
     def __init__(self, *args, **kwgs):
         _kwgs = split_kwargs(
@@ -141,26 +252,279 @@ class BaseStreamHandler(logging.StreamHandler):
 
         super(BaseStreamHandler, self).__init__(*args, **kwgs)
 
-        self.setFormatter(BaseFormatter(**_kwgs))
+        self.setFormatter(BaseFormatter(stream=self.stream, **_kwgs))
+
+
+class QueueHandler(logging.Handler):
+    """Put records into a bounded queue, a background thread formats them
+    and writes them by `target` handler, so that a slow stream never blocks
+    the thread who logs (the IOLoop).
+
+    When the queue is full, the record is dropped and counted in `dropped`,
+    or if `block` is True, the logging thread waits for free space.
+    """
+    def __init__(self, target, queue_size=10000, block=False):
+        logging.Handler.__init__(self)
+        self.target = target
+        self.queue_size = queue_size
+        self.block = block
+        self.dropped = 0
+        self._reported_dropped = 0
+        self._pid = None
+        self._thread = None
+        _queue_handlers.append(self)
+
+    def _start(self):
+        # threads don't survive fork, each process starts its own,
+        # the queue is recreated as its lock may be held by a dead thread
+        self._pid = os.getpid()
+        self.queue = Queue(self.queue_size)
+        self._thread = threading.Thread(target=self._run, name='torext-log-queue')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def emit(self, record):
+        # like other handlers, a bad log call is reported, not raised to the caller
+        try:
+            if self._pid != os.getpid():
+                self._start()
+            # args may be changed after this call returns, merge them now
+            if record.args:
+                record.msg = record.getMessage()
+                record.args = None
+            self.queue.put(record, self.block)
+        except Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            try:
+                if record is None:
+                    return
+                self._report_dropped()
+                self.target.handle(record)
+            except Exception:
+                self.handleError(record)
+            finally:
+                self.queue.task_done()
+
+    def _report_dropped(self):
+        dropped = self.dropped
+        if dropped == self._reported_dropped:
+            return
+        self.target.handle(logging.makeLogRecord({
+            'name': 'torext.log',
+            'levelno': logging.WARNING,
+            'levelname': 'WARNING',
+            'msg': '%s log records dropped as the queue is full' % (dropped - self._reported_dropped),
+        }))
+        self._reported_dropped = dropped
+
+    def flush(self, timeout=5):
+        """Wait at most `timeout` seconds for queued records to be written"""
+        if self._pid != os.getpid() or threading.current_thread() is self._thread:
+            return
+        deadline = time.time() + timeout
+        cond = self.queue.all_tasks_done
+        cond.acquire()
+        try:
+            while self.queue.unfinished_tasks and self._thread.is_alive():
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                cond.wait(remaining)
+        finally:
+            cond.release()
+        self.target.flush()
+
+    def close(self):
+        if self._pid == os.getpid() and self._thread.is_alive():
+            self.flush()
+            self.queue.put(None)
+            self._thread.join(1)
+            self._pid = None
+        self.target.close()
+        if self in _queue_handlers:
+            _queue_handlers.remove(self)
+        logging.Handler.close(self)
+
+
+_queue_handlers = []
+
+
+def flush_queue_handlers(timeout=5):
+    for handler in list(_queue_handlers):
+        handler.flush(timeout)
+
+
+def get_dropped_records():
+    return sum(h.dropped for h in _queue_handlers)
+
+
+class BatchFlushMixin(object):
+    """File handlers flush after every record, unless `batch` is True,
+    then ``flush(force=True)`` should be called after a batch of records
+    """
+    batch = False
+
+    def flush(self, force=False):
+        if force or not self.batch:
+            super(BatchFlushMixin, self).flush()
+
+
+class RotatingFileHandler(BatchFlushMixin, logging.handlers.RotatingFileHandler):
+    """Rotate when the file reaches `max_bytes`"""
+    def __init__(self, filename, max_bytes=0, backup_count=0):
+        logging.handlers.RotatingFileHandler.__init__(
+            self, filename, maxBytes=max_bytes, backupCount=backup_count, delay=True)
+
+
+class TimedRotatingFileHandler(BatchFlushMixin, logging.handlers.TimedRotatingFileHandler):
+    """Rotate every `interval` of `when`, see ``logging.handlers.TimedRotatingFileHandler``"""
+    def __init__(self, filename, when='midnight', interval=1, backup_count=0):
+        logging.handlers.TimedRotatingFileHandler.__init__(
+            self, filename, when=when, interval=interval, backupCount=backup_count, delay=True)
+
+
+class LogShipHandler(logging.handlers.SocketHandler):
+    """Send records to the log writer process through a unix socket, as
+    length prefixed pickles, the writer writes them by the handler of
+    logger `logger_name`, see ``torext.logwriter``
+    """
+    # tracebacks are formatted before shipping
+    formatter_for_exc = logging.Formatter()
+
+    def __init__(self, address, logger_name):
+        logging.handlers.SocketHandler.__init__(self, address, None)
+        self.address = address
+        self.logger_name = logger_name
+        self._pid = os.getpid()
+        # the writer is restarted by the master right away, do not wait
+        # long before reconnecting to it
+        self.retryMax = 2.0
+
+    def makeSocket(self, timeout=1):
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.settimeout(timeout)
+        s.connect(self.address)
+        return s
+
+    def send(self, s):
+        # a socket connected before fork is shared with the parent,
+        # frames written by both processes would interleave
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            if self.sock:
+                self.sock.close()
+                self.sock = None
+        logging.handlers.SocketHandler.send(self, s)
+
+    def makePickle(self, record):
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatter_for_exc.formatException(record.exc_info)
+        d = dict(record.__dict__)
+        d['msg'] = record.getMessage()
+        d['args'] = None
+        d['exc_info'] = None
+        d[SHIP_LOGGER_KEY] = self.logger_name
+        try:
+            s = pickle.dumps(d, 2)
+        except Exception:
+            # extra attributes could be anything
+            for k, v in d.items():
+                if not isinstance(v, (string_types, int, float, bool, type(None))):
+                    d[k] = repr(v)
+            s = pickle.dumps(d, 2)
+        return struct.pack('>L', len(s)) + s
+
+
+SHIP_LOGGER_KEY = '_torext_logger'
+
+ENV_LOG_WRITER = 'TOREXT_LOG_WRITER'
+
+# address of the log writer process, records of file handlers are shipped
+# to it instead of being written by this process
+log_writer_address = os.environ.get(ENV_LOG_WRITER)
+
+
+def use_log_writer(address):
+    """Ship file logs of this process, and the processes started by it,
+    to the log writer listening on `address`, ``set_loggers`` should be
+    called again to apply it
+    """
+    global log_writer_address
+    log_writer_address = address
+    if address:
+        os.environ[ENV_LOG_WRITER] = address
+    else:
+        os.environ.pop(ENV_LOG_WRITER, None)
 
 
 HANDLER_TYPES = {
     'stream': BaseStreamHandler,
+    'rotating_file': RotatingFileHandler,
+    'timed_rotating_file': TimedRotatingFileHandler,
 }
 
 
+def make_file_handler(handler, filename, max_bytes=0, when='midnight', interval=1, backup_count=0):
+    if handler == 'rotating_file':
+        return RotatingFileHandler(filename, max_bytes=max_bytes, backup_count=backup_count)
+    if handler == 'timed_rotating_file':
+        return TimedRotatingFileHandler(filename, when=when, interval=interval,
+                                        backup_count=backup_count)
+    raise ValueError('Unknown log handler type %s' % handler)
+
+
+def uses_file_handlers(loggers):
+    return any(config.get('handler', 'stream') != 'stream' for config in loggers.values())
+
+
+def make_formatter(formatter='base', fmt=None, datefmt=None, stream=None, color=None):
+    if formatter == 'json':
+        return JSONFormatter(datefmt=datefmt)
+
+    formatter_kwgs = {}
+    for i in ('fmt', 'datefmt'):
+        if locals()[i] is not None:
+            formatter_kwgs[i] = locals()[i]
+    return FORMATTER_TYPES[formatter](stream=stream, color=color, **formatter_kwgs)
+
+
 def set_logger(name,
                level='INFO',
                fmt=None,
                datefmt=None,
                propagate=1,
-               remove_handlers=False):
+               remove_handlers=False,
+               queue=False,
+               queue_size=10000,
+               queue_block=False,
+               formatter='base',
+               handler='stream',
+               filename=None,
+               max_bytes=0,
+               when='midnight',
+               interval=1,
+               backup_count=0):
     """
     This function will clear the previous handlers and set only one handler,
     which will only be StreamHandler for the logger.
 
     This function is designed to be able to called multiple times in a context.
 
+    If `queue` is True, the StreamHandler is wrapped by a QueueHandler,
+    records are written in a background thread, see ``QueueHandler``.
+
+    `formatter` is a key of ``FORMATTER_TYPES``, `fmt` is ignored by 'json'.
+
+    `handler` could be 'rotating_file' (by `max_bytes`) or 'timed_rotating_file'
+    (by `when` and `interval`) to write to `filename` instead of stderr, when
+    there is a log writer process, the records are shipped to it.
+
     Note that if a logger has no handlers, it will be added a handler automatically when it is used.
     """
     logger = logging.getLogger(name)
@@ -171,21 +535,56 @@ def set_logger(name,
         logger.handlers = []
         return
 
+    if handler != 'stream' and log_writer_address:
+        handler_key = ('ship', log_writer_address)
+    elif handler != 'stream':
+        handler_key = (handler, filename, max_bytes, when, interval, backup_count)
+    else:
+        handler_key = ('stream', )
+
+    handler_type = handler
     handler = None
-    for h in logger.handlers:
-        if isinstance(h, logging.StreamHandler):
-            # use existing instead of clean and create
-            handler = h
-            break
+    for h in list(logger.handlers):
+        if isinstance(h, (logging.StreamHandler, QueueHandler, LogShipHandler)):
+            base_handler = h.target if isinstance(h, QueueHandler) else h
+            if isinstance(h, QueueHandler) == bool(queue) and \
+                    getattr(base_handler, 'handler_key', ('stream', )) == handler_key:
+                # use existing instead of clean and create
+                handler = h
+                break
+            # switched between queued and direct writing, or handler types
+            logger.removeHandler(h)
+            if h.__class__ is not logging.StreamHandler:
+                h.close()
     if not handler:
-        handler = logging.StreamHandler()
+        if handler_key[0] == 'ship':
+            handler = LogShipHandler(log_writer_address, name)
+        elif handler_key[0] == 'stream':
+            handler = logging.StreamHandler()
+        else:
+            handler = make_file_handler(handler_type, filename, max_bytes=max_bytes, when=when,
+                                        interval=interval, backup_count=backup_count)
+        handler.handler_key = handler_key
+        if queue:
+            handler = QueueHandler(handler)
         logger.addHandler(handler)
-
-    formatter_kwgs = {}
-    for i in ('fmt', 'datefmt'):
-        if locals()[i] is not None:
-            formatter_kwgs[i] = locals()[i]
-    handler.setFormatter(BaseFormatter(**formatter_kwgs))
+    # before the queue, where the context of current request is
+    handler.addFilter(request_id_filter)
+
+    if queue:
+        handler.queue_size = queue_size
+        handler.block = queue_block
+        if handler._pid is not None:
+            handler.queue.maxsize = queue_size
+        base_handler = handler.target
+    else:
+        base_handler = handler
+
+    if handler_key[0] == 'stream':
+        base_handler.setFormatter(make_formatter(formatter, fmt, datefmt, stream=base_handler.stream))
+    elif handler_key[0] != 'ship':
+        # no colors in files
+        base_handler.setFormatter(make_formatter(formatter, fmt, datefmt, color=False))
 
 
 def set_loggers(loggers):
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Log writer process
+#
+# With multiple processes, file handlers in every worker appending to the
+# same file interleave lines and contend on the file, and rotation by one
+# process breaks the others. Instead, the master forks a single writer
+# process before workers are started, which owns the file handlers of
+# ``LOGGERS``. Workers ship records of those loggers to it through a unix
+# socket (``LogShipHandler``), the writer reads every record available on
+# all connections, writes them, then flushes the files once per batch.
+#
+# The listening socket is bound before forking, so records sent before
+# the writer accepts are kept in the backlog. The writer ignores SIGINT
+# and SIGTERM, and exits after the master has exited and all workers have
+# disconnected, so that the last records of stopping workers are written.
+#
+# If the writer dies, the master (the supervisor, or the parent of forked
+# processes) which reaps it calls ``on_exit`` to start it again on the same
+# address, and shipping handlers reconnect to it.
+
+import os
+import time
+import errno
+import select
+import signal
+import socket
+import struct
+import logging
+
+from torext.compat import pickle
+from torext.log import (
+    app_log, make_file_handler, make_formatter, use_log_writer, SHIP_LOGGER_KEY)
+
+
+HEADER = struct.Struct('>L')
+
+# a writer exits within this many seconds after started is restarted
+# after this delay, so that a writer which could not run does not spin
+RESTART_DELAY = 1
+
+
+class LogWriter(object):
+    def __init__(self, address, loggers):
+        """`loggers` is the config of ``LOGGERS``"""
+        self.address = address
+        self.loggers = loggers
+        self.pid = None
+        self.started_at = None
+        self.handlers = {}
+        self.listener = None
+
+    def start(self):
+        """Bind the socket and fork the writer process, return its pid"""
+        if os.path.exists(self.address):
+            os.remove(self.address)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.address)
+        # records are unpickled, only the owner could connect
+        os.chmod(self.address, 0o600)
+        self.listener.listen(128)
+
+        self.started_at = time.time()
+        pid = os.fork()
+        if pid:
+            self.pid = pid
+            self.listener.close()
+            return pid
+
+        code = 0
+        try:
+            self.serve()
+        except Exception:
+            app_log.error('Log writer failed', exc_info=True)
+            code = 1
+        finally:
+            os._exit(code)
+
+    def on_exit(self, status):
+        """Called by the master which reaped the writer with `status`, start it again"""
+        if os.WIFSIGNALED(status):
+            reason = 'killed by signal %s' % os.WTERMSIG(status)
+        else:
+            reason = 'exited with status %s' % os.WEXITSTATUS(status)
+        app_log.error('Log writer %s %s, restarting', self.pid, reason)
+        if time.time() - self.started_at < RESTART_DELAY:
+            time.sleep(RESTART_DELAY)
+        return self.start()
+
+    def make_handlers(self):
+        use_log_writer(None)
+        for name, config in self.loggers.items():
+            if config.get('handler', 'stream') == 'stream':
+                continue
+            handler = make_file_handler(
+                config['handler'], config['filename'],
+                max_bytes=config.get('max_bytes', 0), when=config.get('when', 'midnight'),
+                interval=config.get('interval', 1), backup_count=config.get('backup_count', 0))
+            handler.setFormatter(make_formatter(
+                config.get('formatter', 'base'), config.get('fmt'), config.get('datefmt'), color=False))
+            handler.batch = True
+            self.handlers[name] = handler
+
+    def serve(self):
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        # handlers of the master are inherited when restarted
+        for sig in (signal.SIGHUP, signal.SIGQUIT, signal.SIGCHLD, signal.SIGUSR1):
+            signal.signal(sig, signal.SIG_DFL)
+        self.make_handlers()
+        parent = os.getppid()
+        # socket -> received bytes not yet parsed
+        connections = {}
+        while True:
+            try:
+                readable = select.select([self.listener] + list(connections), [], [], 1)[0]
+            except select.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            for sock in readable:
+                if sock is self.listener:
+                    conn, _ = self.listener.accept()
+                    connections[conn] = b''
+                    continue
+                data = sock.recv(65536)
+                if not data:
+                    sock.close()
+                    del connections[sock]
+                    continue
+                connections[sock] = self.handle_data(connections[sock] + data)
+            for handler in self.handlers.values():
+                handler.flush(force=True)
+
+            if os.getppid() != parent and not connections:
+                break
+
+        self.listener.close()
+        if os.path.exists(self.address):
+            os.remove(self.address)
+        for handler in self.handlers.values():
+            handler.close()
+
+    def handle_data(self, data):
+        """Handle the complete records in `data`, return the rest"""
+        offset = 0
+        while len(data) - offset >= HEADER.size:
+            length = HEADER.unpack_from(data, offset)[0]
+            end = offset + HEADER.size + length
+            if len(data) < end:
+                break
+            d = pickle.loads(data[offset + HEADER.size:end])
+            offset = end
+            handler = self.handlers.get(d.pop(SHIP_LOGGER_KEY, None))
+            if handler:
+                handler.handle(logging.makeLogRecord(d))
+        return data[offset:]
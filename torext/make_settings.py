@@ -6,6 +6,47 @@ from torext.errors import SettingsError
 from torext.log import set_loggers
 
 
+class FrozenDict(dict):
+    """A read-only dict, for dicts in frozen settings"""
+    def _read_only(self, *args, **kwargs):
+        raise SettingsError('Frozen settings is read-only, set the key on settings instead')
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self), ))
+
+
+class FrozenSettings(object):
+    """Read-only snapshot of settings, values are accessed as attributes,
+    which is much faster than ``Settings.__getitem__``, lists are frozen
+    into tuples and dicts into ``FrozenDict``, recursively.
+    """
+    def __init__(self, items):
+        self.__dict__.update((k, _freeze(v)) for k, v in items)
+
+    def __setattr__(self, key, value):
+        raise SettingsError('Frozen settings is read-only, set "%s" on settings instead' % key)
+
+    __delattr__ = __setattr__
+
+    def replace(self, key, value):
+        """Return a new snapshot with `key` changed"""
+        items = dict(self.__dict__)
+        items[key] = value
+        return FrozenSettings(items.items())
+
+
+def _freeze(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(i) for i in value)
+    if isinstance(value, dict) and not isinstance(value, FrozenDict):
+        return FrozenDict((k, _freeze(v)) for k, v in value.items())
+    if isinstance(value, set):
+        return frozenset(value)
+    return value
+
+
 class Settings(dict, SingletonMixin):
     """
     Philosophy was borrowed from django.conf.Settings
@@ -37,6 +78,16 @@ class Settings(dict, SingletonMixin):
     >>> settings['PORT']
     8765
 
+    for values read in every request, use the frozen snapshot, which is
+    updated whenever a value is set on settings:
+    >>> settings.frozen.DEBUG
+    True
+
+    the snapshot holds frozen copies, so changing a list or dict of settings
+    in place is not seen by it, nor by the code that reads it, set the key
+    again instead:
+    >>> settings['LOGGING_IGNORE_URLS'] = settings['LOGGING_IGNORE_URLS'] + ['/health']
+
     TODO require_setting
     """
     def __init__(self):
@@ -44,6 +95,7 @@ class Settings(dict, SingletonMixin):
         Setting definitions in base_settings are indispensable
         """
         self._callbacks = {}
+        self.frozen = None
         self.add_key_callback('LOGGERS', set_loggers)
 
         from torext import base_settings
@@ -53,6 +105,7 @@ class Settings(dict, SingletonMixin):
                 self[i] = getattr(base_settings, i)
 
         self._module = None
+        self.freeze()
 
     def __getattr__(self, key):
         try:
@@ -76,13 +129,28 @@ class Settings(dict, SingletonMixin):
                                     ' UPPER CASE VARIABLE as setting' % key)
         key_upper = key.upper()
         super(Settings, self).__setitem__(key_upper, value)
-        if key_upper in self._callbacks:
-            self._callbacks[key](value)
+        if self.frozen is not None:
+            self.frozen = self.frozen.replace(key_upper, value)
+        for callback in self._callbacks.get(key_upper, ()):
+            callback(value)
+
+    def update(self, *args, **kwargs):
+        # so that the frozen snapshot and callbacks are updated
+        for k, v in dict(*args, **kwargs).items():
+            self[k] = v
+
+    def freeze(self):
+        """Compile current values into ``self.frozen``"""
+        self.frozen = FrozenSettings(self.items())
+        return self.frozen
 
     def __str__(self):
         return '<Settings. %s >' % dict(self)
 
     def add_key_callback(self, key, callback):
-        self._callbacks[key] = callback
+        """Call `callback` with the new value whenever `key` is set"""
+        callbacks = self._callbacks.setdefault(key, [])
+        if callback not in callbacks:
+            callbacks.append(callback)
 
 settings = Settings.instance()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Request metrics
+#
+# Request time of every finished request is recorded into a histogram keyed
+# by handler class (``module.qualname``), method and status code. Buckets are log-linear (1, 2,
+# 2.5, 5, 7.5 of each power of 10) so that the relative error is bounded
+# like a HDR histogram while staying cheap: recording is a bisect in a
+# short list and an increment.
+#
+# With multiple processes, each process dumps a snapshot to ``METRICS_DIR``
+# periodically, ``MetricsHandler`` merges the snapshots of all processes, so
+# one scrape shows the whole node. Snapshots of exited processes are kept,
+# so that counters never go backwards, the supervisor folds them into one
+# cumulative snapshot ``EXITED_FILENAME`` as workers are reaped, so that
+# the directory does not grow with every recycled worker.
+
+import os
+import json
+import bisect
+
+from torext.log import app_log
+
+
+# snapshot of all exited processes
+EXITED_FILENAME = 'exited.json'
+
+# upper bounds in seconds, from 0.1ms to 75s
+BUCKETS = [round(m * 10 ** e, 6) for e in range(-4, 2) for m in (1, 2, 2.5, 5, 7.5)]
+
+
+class Histogram(object):
+    __slots__ = ('counts', 'sum')
+
+    def __init__(self, counts=None, sum=0.0):
+        # the last one is for values beyond the largest bucket
+        self.counts = counts or [0] * (len(BUCKETS) + 1)
+        self.sum = sum
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum += other.sum
+
+
+def get_handler_name(cls):
+    """``module.qualname`` of a handler class, handlers of the same name
+    in different modules are told apart
+    """
+    return '%s.%s' % (cls.__module__, getattr(cls, '__qualname__', cls.__name__))
+
+
+class Metrics(object):
+    def __init__(self):
+        # (handler, method, status) -> Histogram
+        self.histograms = {}
+        # handler class -> name
+        self.handler_names = {}
+
+    def observe(self, handler, request_time):
+        """Record a finished request, `request_time` is in seconds"""
+        cls = handler.__class__
+        name = self.handler_names.get(cls)
+        if name is None:
+            name = self.handler_names[cls] = get_handler_name(cls)
+        key = (name, handler.request.method, handler.get_status())
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(request_time)
+
+    def snapshot(self):
+        return {
+            'histograms': [list(key) + [h.counts, h.sum] for key, h in self.histograms.items()],
+        }
+
+    def dump(self, dirpath):
+        """Write a snapshot of current process into `dirpath`"""
+        self.dump_file(os.path.join(dirpath, '%s.json' % os.getpid()))
+
+    def dump_file(self, path):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f)
+        # rename is atomic, readers never see a partial file
+        os.rename(tmp_path, path)
+
+    def merge_snapshot(self, data):
+        for handler, method, status, counts, sum_ in data['histograms']:
+            key = (handler, method, status)
+            histogram = Histogram(counts, sum_)
+            if key in self.histograms:
+                self.histograms[key].merge(histogram)
+            else:
+                self.histograms[key] = histogram
+
+    def load_file(self, path):
+        with open(path, 'r') as f:
+            self.merge_snapshot(json.load(f))
+
+    @classmethod
+    def load(cls, dirpath):
+        """Merge snapshots of all processes in `dirpath`"""
+        metrics = cls()
+        for filename in os.listdir(dirpath):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                metrics.load_file(os.path.join(dirpath, filename))
+            except (IOError, OSError, ValueError):
+                app_log.warning('Failed to load metrics from %s', filename, exc_info=True)
+        return metrics
+
+    def format_prometheus(self, prefix='torext'):
+        """Render in Prometheus text exposition format"""
+        lines = [
+            '# HELP %s_request_duration_seconds Request time.' % prefix,
+            '# TYPE %s_request_duration_seconds histogram' % prefix,
+        ]
+        requests = {}
+        errors = {}
+        for key in sorted(self.histograms):
+            handler, method, status = key
+            histogram = self.histograms[key]
+            labels = 'handler="%s",method="%s",status="%s"' % key
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram.counts):
+                cumulative += count
+                lines.append('%s_request_duration_seconds_bucket{%s,le="%s"} %s' % (
+                    prefix, labels, bound, cumulative))
+            count = cumulative + histogram.counts[-1]
+            lines.append('%s_request_duration_seconds_bucket{%s,le="+Inf"} %s' % (prefix, labels, count))
+            lines.append('%s_request_duration_seconds_sum{%s} %s' % (prefix, labels, repr(histogram.sum)))
+            lines.append('%s_request_duration_seconds_count{%s} %s' % (prefix, labels, count))
+            requests[key] = count
+            if status >= 500:
+                errors[handler] = errors.get(handler, 0) + count
+
+        lines.append('# HELP %s_requests_total Finished requests.' % prefix)
+        lines.append('# TYPE %s_requests_total counter' % prefix)
+        for key in sorted(requests):
+            lines.append('%s_requests_total{handler="%s",method="%s",status="%s"} %s' % (
+                (prefix, ) + key + (requests[key], )))
+
+        lines.append('# HELP %s_request_errors_total Requests finished with 5xx status.' % prefix)
+        lines.append('# TYPE %s_request_errors_total counter' % prefix)
+        for handler in sorted(errors):
+            lines.append('%s_request_errors_total{handler="%s"} %s' % (prefix, handler, errors[handler]))
+        return '\n'.join(lines) + '\n'
+
+
+def fold_snapshot(dirpath, pid):
+    """Merge the snapshot of exited process `pid` into ``EXITED_FILENAME``,
+    and remove it, called by the supervisor when a worker is reaped
+    """
+    path = os.path.join(dirpath, '%s.json' % pid)
+    if not os.path.exists(path):
+        return
+    exited_path = os.path.join(dirpath, EXITED_FILENAME)
+    metrics = Metrics()
+    if os.path.exists(exited_path):
+        metrics.load_file(exited_path)
+    metrics.load_file(path)
+    # written before removing, so that the counters are never missed
+    metrics.dump_file(exited_path)
+    os.remove(path)
+
+
+def clear_dir(dirpath):
+    """Remove snapshots of the last run, called before workers start"""
+    if not os.path.isdir(dirpath):
+        os.makedirs(dirpath)
+        return
+    for filename in os.listdir(dirpath):
+        if filename.endswith('.json') or filename.endswith('.json.tmp'):
+            os.remove(os.path.join(dirpath, filename))
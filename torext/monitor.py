@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# IOLoop lag monitor
+#
+# A callback scheduled on the ioloop every `interval` seconds measures how
+# late it runs, which is the time a ready callback or request has to wait
+# before the loop gets to it. A watchdog thread checks that the callback
+# keeps running, when the loop is blocked for longer than `threshold`, it
+# captures the stack of the ioloop thread and the request being handled,
+# so that the handler doing synchronous work could be found.
+
+import sys
+import time
+import threading
+import traceback
+from collections import deque
+
+from tornado.web import RequestHandler
+
+from torext.log import app_log
+
+
+def find_handler(frame):
+    """Find the request handler that the frame, or one of its callers,
+    is executing a method of
+    """
+    while frame is not None:
+        obj = frame.f_locals.get('self')
+        if isinstance(obj, RequestHandler):
+            return obj
+        frame = frame.f_back
+    return None
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0
+    index = min(int(len(sorted_values) * p), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class LoopMonitor(object):
+    def __init__(self, io_loop, interval=0.1, threshold=0.5, window=600):
+        """
+        `interval` and `threshold` are in seconds, the percentiles are
+        calculated from the latest `window` samples
+        """
+        self.io_loop = io_loop
+        self.interval = interval
+        self.threshold = threshold
+        self.samples = deque(maxlen=window)
+        # times the loop has been blocked longer than threshold
+        self.blocks = 0
+        self.max_lag = 0
+        # (request summary, stack) of the latest block
+        self.last_block = None
+
+        self._running = False
+        self._stopped = threading.Event()
+        self._timeout = None
+        self._expected = None
+        self._last_tick = None
+        self._blocked_since = None
+        self._loop_thread_id = None
+        self._watchdog = None
+
+    def start(self):
+        self._running = True
+        self._stopped.clear()
+        self._last_tick = time.time()
+        self.io_loop.add_callback(self._start_on_loop)
+        self._watchdog = threading.Thread(target=self._watch, name='torext-loop-watchdog')
+        self._watchdog.daemon = True
+        self._watchdog.start()
+
+    def stop(self):
+        self._running = False
+        self._stopped.set()
+        if self._watchdog:
+            self._watchdog.join()
+            self._watchdog = None
+        if self._timeout is not None:
+            self.io_loop.remove_timeout(self._timeout)
+            self._timeout = None
+
+    def _start_on_loop(self):
+        self._loop_thread_id = threading.current_thread().ident
+        self._schedule(time.time())
+
+    def _schedule(self, now):
+        if not self._running:
+            return
+        self._expected = now + self.interval
+        self._timeout = self.io_loop.add_timeout(self._expected, self._tick)
+
+    def _tick(self):
+        now = time.time()
+        lag = max(now - self._expected, 0)
+        self.samples.append(lag)
+        if lag > self.max_lag:
+            self.max_lag = lag
+        self._last_tick = now
+        if self._blocked_since is not None:
+            app_log.warning('IOLoop was blocked for %.2fms', (now - self._blocked_since) * 1000)
+            self._blocked_since = None
+        self._schedule(now)
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval):
+            last_tick = self._last_tick
+            if self._blocked_since is not None or self._loop_thread_id is None:
+                continue
+            if time.time() - last_tick - self.interval > self.threshold:
+                self._blocked_since = last_tick + self.interval
+                self.blocks += 1
+                self.report_block()
+
+    def report_block(self):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return
+        handler = find_handler(frame)
+        request = handler._request_summary() if handler else 'no request'
+        stack = ''.join(traceback.format_stack(frame))
+        self.last_block = (request, stack)
+        app_log.warning('IOLoop blocked for more than %.2fms, handling %s:\n%s',
+                        self.threshold * 1000, request, stack)
+
+    def percentiles(self):
+        """Return lag percentiles in milliseconds"""
+        values = sorted(self.samples)
+        return {
+            'p50': percentile(values, 0.5) * 1000,
+            'p90': percentile(values, 0.9) * 1000,
+            'p99': percentile(values, 0.99) * 1000,
+            'max': self.max_lag * 1000,
+            'blocks': self.blocks,
+        }
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Run blocking or CPU bound code out of the IOLoop
+#
+# Thread pool and process pool are created per process on first use, sized
+# by ``THREAD_POOL_SIZE`` and ``PROCESS_POOL_SIZE``. Requires
+# ``concurrent.futures``, which is in the standard library since python 3.2,
+# for python 2 install the ``futures`` package.
+
+import time
+import functools
+import threading
+from collections import deque
+
+from tornado.ioloop import IOLoop
+
+from torext.monitor import percentile
+
+try:
+    from concurrent import futures
+except ImportError:
+    futures = None
+
+
+def _timed_call(fn, args, kwargs):
+    # runs in the pool, the start time tells how long the task was queued
+    return time.time(), fn(*args, **kwargs)
+
+
+class Pool(object):
+    """An executor that keeps statistics of its tasks"""
+    def __init__(self, executor, size):
+        self.executor = executor
+        self.size = size
+        # submitted but not finished, including the running ones
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        # seconds the latest tasks waited before started
+        self.waits = deque(maxlen=1000)
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        """Same as ``Executor.submit``, returns a future that could be
+        yielded in ``tornado.gen.coroutine``
+        """
+        future = futures.Future()
+        submitted_at = time.time()
+
+        def done(inner):
+            with self._lock:
+                self.pending -= 1
+                if inner.exception() is not None:
+                    self.failed += 1
+                else:
+                    self.completed += 1
+            if inner.exception() is not None:
+                future.set_exception(inner.exception())
+                return
+            started_at, result = inner.result()
+            self.waits.append(max(started_at - submitted_at, 0))
+            future.set_result(result)
+
+        with self._lock:
+            self.pending += 1
+        self.executor.submit(_timed_call, fn, args, kwargs).add_done_callback(done)
+        return future
+
+    def stats(self):
+        waits = sorted(self.waits)
+        return {
+            'size': self.size,
+            'pending': self.pending,
+            'queued': max(self.pending - self.size, 0),
+            'completed': self.completed,
+            'failed': self.failed,
+            # in milliseconds
+            'wait_p50': percentile(waits, 0.5) * 1000,
+            'wait_p99': percentile(waits, 0.99) * 1000,
+        }
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+
+def _check_futures():
+    if futures is None:
+        raise ImportError('concurrent.futures is required to offload, '
+                          'install `futures` package on python 2')
+
+
+def make_thread_pool(size):
+    _check_futures()
+    return Pool(futures.ThreadPoolExecutor(size), size)
+
+
+def make_process_pool(size=None):
+    """`size` defaults to the number of cpus"""
+    from tornado.process import cpu_count
+
+    _check_futures()
+    size = size or cpu_count()
+    return Pool(futures.ProcessPoolExecutor(size), size)
+
+
+def offload(method):
+    """Run the decorated handler method in the thread pool of app,
+    the request is finished on the IOLoop after the method returns,
+    exceptions are handled as usual.
+
+    The method could ``write``, ``set_header``, ``render_string``,
+    but should not ``flush`` or ``finish`` (so neither ``render``),
+    these touch the connection and must be called in the IOLoop thread.
+
+    >>> class ReportHandler(BaseHandler):
+    ...     @offload
+    ...     def get(self):
+    ...         rows = self.db.query(Report).all()
+    ...         self.write(self.render_string('report.html', rows=rows))
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self._auto_finish = False
+        future = self.app.run_in_thread(method, self, *args, **kwargs)
+
+        def callback(future):
+            try:
+                future.result()
+            except Exception as e:
+                self._handle_request_exception(e)
+                return
+            if not self._finished:
+                self.finish()
+
+        IOLoop.current().add_future(future, callback)
+    return wrapper
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Token bucket rate limiting shared by processes
+#
+# Buckets live in a file mapped into memory by every process, so that all
+# workers on a host count against the same limits. The file is a hash table
+# of fixed size slots ``(key hash, tokens, last update time)``, a key is
+# looked up in the PROBES slots following its hash position, with a POSIX
+# record lock on those slots only, so a check is O(1) and processes rarely
+# contend. When all the probed slots are taken by other keys, the least
+# recently updated one is reused, which could only make a limit looser.
+
+import os
+import mmap
+import time
+import fcntl
+import struct
+import hashlib
+import tempfile
+
+from torext import settings
+
+
+SLOT = struct.Struct('<Qdd')
+PROBES = 4
+
+
+def hash_key(key):
+    if not isinstance(key, bytes):
+        key = key.encode('utf8')
+    h = struct.unpack('<Q', hashlib.md5(key).digest()[:8])[0]
+    # 0 marks an empty slot
+    return h or 1
+
+
+class BucketTable(object):
+    def __init__(self, path, slots=65536):
+        self.path = path
+        self.slots = slots
+        # probes never wrap around the end of the table
+        size = SLOT.size * (slots + PROBES)
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self.fd).st_size != size:
+            os.ftruncate(self.fd, size)
+        self.mmap = mmap.mmap(self.fd, size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+
+    def close(self):
+        self.mmap.close()
+        os.close(self.fd)
+
+    def consume(self, key, rate, burst, cost=1):
+        """Take `cost` tokens from the bucket of `key`, which is refilled
+        by `rate` tokens per second up to `burst` tokens.
+
+        Return ``(allowed, remaining tokens, seconds to retry after)``.
+        """
+        h = hash_key(key)
+        start = (h % self.slots) * SLOT.size
+        length = SLOT.size * PROBES
+        now = time.time()
+
+        fcntl.lockf(self.fd, fcntl.LOCK_EX, length, start)
+        try:
+            offset = None
+            oldest = None
+            for i in range(start, start + length, SLOT.size):
+                slot_hash, tokens, updated_at = SLOT.unpack_from(self.mmap, i)
+                if slot_hash == h:
+                    offset = i
+                    tokens = min(burst, tokens + (now - updated_at) * rate)
+                    break
+                if oldest is None or updated_at < oldest[1]:
+                    oldest = (i, updated_at)
+            else:
+                # empty slots are the oldest ones
+                offset = oldest[0]
+                tokens = burst
+
+            if tokens >= cost:
+                tokens -= cost
+                allowed, retry_after = True, 0
+            else:
+                allowed, retry_after = False, (cost - tokens) / float(rate)
+            SLOT.pack_into(self.mmap, offset, h, tokens, now)
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, length, start)
+        return allowed, tokens, retry_after
+
+
+_table = None
+
+
+def get_table():
+    """The table of current process, file is ``RATELIMIT_FILE``, or a file
+    named by PORT in temp directory, so that workers of a server share it
+    """
+    global _table
+    if not _table:
+        path = settings['RATELIMIT_FILE'] or os.path.join(
+            tempfile.gettempdir(), 'torext-ratelimit-%s' % settings['PORT'])
+        _table = BucketTable(path, slots=settings['RATELIMIT_SLOTS'])
+    return _table
+
+
+class RateLimitMixin(object):
+    """Limit requests of a handler per client, add ``'ratelimit'``
+    to ``PREPARES`` to enable it:
+
+    >>> class APIHandler(RateLimitMixin, BaseHandler):
+    ...     PREPARES = ['ratelimit']
+    ...     RATELIMIT_RATE = 10
+    ...     RATELIMIT_BURST = 20
+
+    Requests over the limit get 429 with Retry-After header.
+    """
+    # tokens per second
+    RATELIMIT_RATE = 10
+
+    # bucket capacity
+    RATELIMIT_BURST = 10
+
+    def get_ratelimit_key(self):
+        """Override to limit by other things like user id or api key,
+        return None to skip limiting the request
+        """
+        return '%s:%s' % (self.__class__.__name__, self.request.remote_ip)
+
+    def prepare_ratelimit(self):
+        key = self.get_ratelimit_key()
+        if key is None:
+            return
+        allowed, remaining, retry_after = get_table().consume(
+            key, self.RATELIMIT_RATE, self.RATELIMIT_BURST)
+        self.set_header('X-RateLimit-Limit', str(self.RATELIMIT_BURST))
+        self.set_header('X-RateLimit-Remaining', str(int(remaining)))
+        if not allowed:
+            # 429 is not in httplib.responses of python 2, give the reason
+            self.set_status(429, reason='Too Many Requests')
+            self.set_header('Retry-After', str(int(retry_after) + 1))
+            self.finish()
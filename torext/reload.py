@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Live settings reload
+#
+# The settings module and an optional override file (python or json) are
+# read again on SIGUSR1, or when their modification time changes. Reading
+# runs in a thread so the IOLoop is not blocked, then the changes are
+# validated against the types of current values and applied in one IOLoop
+# callback through ``settings[key] = value``, so that the frozen snapshot
+# and the key callbacks are updated, and no request sees a half applied
+# reload. If a key callback fails, the applied keys are rolled back.
+#
+# Only keys whose values in the files differ from the last loaded ones are
+# applied, so values set by command line or ``extra_settings`` are kept
+# unless they are changed in the files, and only keys listed in
+# ``SETTINGS_RELOADABLE``, the others require a restart.
+
+import os
+import json
+import signal
+import threading
+
+from tornado.ioloop import PeriodicCallback
+
+from torext import settings
+from torext.compat import string_types
+from torext.errors import SettingsError
+from torext.log import app_log
+
+
+def load_file(path):
+    """Load settings from a python or json file"""
+    if path.endswith('.json'):
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    namespace = {'__file__': path}
+    with open(path, 'r') as f:
+        exec(compile(f.read(), path, 'exec'), namespace)
+    return dict((k, v) for k, v in namespace.items()
+                if not k.startswith('_') and k == k.upper())
+
+
+def validate(key, value):
+    if key not in settings:
+        return
+    current = settings[key]
+    if current is None or value is None:
+        return
+    if isinstance(current, bool) or isinstance(value, bool):
+        valid = isinstance(current, bool) and isinstance(value, bool)
+    elif isinstance(current, (int, float)):
+        valid = isinstance(value, (int, float))
+    elif isinstance(current, (list, tuple)):
+        valid = isinstance(value, (list, tuple))
+    elif isinstance(current, string_types):
+        valid = isinstance(value, string_types)
+    else:
+        valid = isinstance(value, type(current))
+    if not valid:
+        raise SettingsError('%s should be %s, got %r' % (key, type(current).__name__, value))
+
+
+class SettingsReloader(object):
+    def __init__(self, paths, reloadable, interval=0):
+        """`interval` is the seconds between modification checks,
+        0 means only reload on SIGUSR1
+        """
+        # module ``__file__`` could be the compiled one
+        self.paths = [i[:-1] if i.endswith('.pyc') else i for i in paths if i]
+        self.reloadable = set(reloadable)
+        self.interval = interval
+        self.io_loop = None
+        # values in the files when they were loaded last time
+        self.baseline = self.load()
+        self.mtimes = self.get_mtimes()
+        self._loading = False
+        self._thread = None
+
+    def load(self):
+        values = {}
+        for path in self.paths:
+            # the override file could be created later
+            if os.path.exists(path):
+                values.update(load_file(path))
+        return values
+
+    def get_mtimes(self):
+        mtimes = []
+        for path in self.paths:
+            try:
+                mtimes.append(os.stat(path).st_mtime)
+            except OSError:
+                mtimes.append(None)
+        return mtimes
+
+    def start(self, io_loop):
+        self.io_loop = io_loop
+
+        def on_signal(signum, frame):
+            io_loop.add_callback_from_signal(self.reload)
+
+        signal.signal(signal.SIGUSR1, on_signal)
+        if self.interval:
+            PeriodicCallback(self.check, self.interval * 1000, io_loop=io_loop).start()
+        # catch up with the changes after baseline was loaded,
+        # for a worker forked from a preloaded master
+        self.reload()
+
+    def check(self):
+        mtimes = self.get_mtimes()
+        if mtimes != self.mtimes:
+            self.mtimes = mtimes
+            self.reload()
+
+    def reload(self):
+        if self._loading:
+            return
+        self._loading = True
+        self._thread = threading.Thread(target=self._load_in_thread, name='torext-settings-reload')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _load_in_thread(self):
+        try:
+            changes = self.diff(self.load())
+        except Exception:
+            app_log.error('Failed to reload settings', exc_info=True)
+            changes = None
+        self.io_loop.add_callback(self.apply, changes)
+
+    def diff(self, values):
+        """Return the validated changes since the last load"""
+        changes = {}
+        for key, value in values.items():
+            if key in self.baseline and self.baseline[key] == value:
+                continue
+            if key not in self.reloadable:
+                app_log.warning('Setting %s changed, restart to apply it', key)
+                continue
+            validate(key, value)
+            changes[key] = value
+        return changes
+
+    def apply(self, changes):
+        self._loading = False
+        if not changes:
+            return
+        applied = {}
+        try:
+            for key, value in changes.items():
+                applied[key] = settings.get(key)
+                settings[key] = value
+        except Exception:
+            app_log.error('Failed to apply settings, roll back', exc_info=True)
+            for key, value in applied.items():
+                try:
+                    settings[key] = value
+                except Exception:
+                    app_log.error('Failed to roll back %s', key, exc_info=True)
+            return
+        self.baseline.update(changes)
+        app_log.info('Settings reloaded: %s', ', '.join(sorted(changes)))
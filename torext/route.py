@@ -1,17 +1,33 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import re
+import json
+
+from tornado.escape import url_escape
+from tornado.util import import_object
+from tornado.web import URLSpec, RequestHandler
+
 from torext import settings
+from torext.compat import quote_plus
 from torext.errors import URLRouteError
 from torext.log import app_log
 
 
 class ModuleSearcher(object):
-    def __init__(self, label):
+    def __init__(self, label, lazy=None):
+        """`lazy` None means ``LAZY_ROUTES``"""
         assert settings['PROJECT'], 'you must set PROJECT first'
         self.import_path = settings['PROJECT'] + '.' + label
+        self.lazy = lazy
         self._handlers = []
 
+    @property
+    def is_lazy(self):
+        if self.lazy is None:
+            return settings['LAZY_ROUTES']
+        return self.lazy
+
     def get_handlers(self):
         module = __import__(self.import_path, fromlist=[settings['PROJECT']])
 
@@ -35,32 +51,395 @@ class Router(object):
         self.specs = specs
         self.prefix = prefix
         self._handlers = []
+        # ModuleSearcher of every include, lazy or not
+        self.searchers = []
 
     def get_handlers(self):
         for spec in self.specs:
-            if isinstance(spec[1], str):
-                searcher = ModuleSearcher(spec[1])
+            searcher = spec[1]
+            if isinstance(searcher, str):
+                searcher = ModuleSearcher(searcher)
+            if not isinstance(searcher, ModuleSearcher):
+                self.add(spec)
+                continue
+            self.searchers.append(searcher)
+            if searcher.is_lazy:
+                lazy_include = LazyInclude((self.prefix or '') + spec[0], searcher)
+                # the prefix is already added
+                self._handlers.extend(lazy_include.get_placeholders())
+            else:
                 for searcher_spec in searcher.get_handlers():
                     _searcher_spec = list(searcher_spec)
                     _searcher_spec[0] = spec[0] + _searcher_spec[0]
                     self.add(tuple(_searcher_spec))
-            else:
-                self.add(spec)
 
         return self._handlers
 
     def add(self, spec):
         if self.prefix:
-            spec = (self.prefix + spec[0], spec[1])
+            spec = (self.prefix + spec[0], ) + tuple(spec[1:])
         app_log.debug('add url spec in router: %s' % str(spec))
         self._handlers.append(spec)
 
 
-def include(label):
-    return ModuleSearcher(label)
+def include(label, lazy=None):
+    """Include the ``handlers`` of module `label` in the project, if `lazy`
+    (default ``LAZY_ROUTES``), the module is imported on the first request
+    that matches its routes, see ``LazyInclude``
+    """
+    return ModuleSearcher(label, lazy=lazy)
+
+
+_manifests = {}
+
+
+def get_manifest(path):
+    """Load the route manifest written by ``TorextApp.write_route_manifest``,
+    which maps module import paths to their routes
+    """
+    if path not in _manifests:
+        with open(path, 'r') as f:
+            _manifests[path] = json.load(f)
+    return _manifests[path]
+
+
+def make_spec(spec):
+    """Make ``URLSpec`` from a tuple ``(pattern, handler[, kwargs[, name]])``,
+    in the same way as ``Application.add_handlers``, which does not accept names
+    """
+    if isinstance(spec, URLSpec):
+        return spec
+    handler = spec[1]
+    if isinstance(handler, str):
+        handler = import_object(handler)
+    kwargs = spec[2] if len(spec) > 2 else None
+    name = spec[3] if len(spec) > 3 else None
+    return URLSpec(spec[0], handler, kwargs or {}, name)
+
+
+class URLBuilder(object):
+    """Build the path of a route, the pattern is compiled into a format
+    string once, so that building costs one format call. Groups are filled
+    by positional arguments, or by keyword arguments for named groups.
+
+    Unlike ``URLSpec.reverse``, escaped characters in the pattern like ``\\.``
+    are unescaped. Patterns that could not be compiled, e.g. with unescaped
+    ``.`` or a trailing ``/?``, are built by ``URLSpec.reverse`` as before.
+    """
+    def __init__(self, spec):
+        self.spec = spec
+        self.pattern = spec.regex.pattern
+        self.group_count = spec.regex.groups
+        groupindex = spec.regex.groupindex
+        self.group_names = sorted(groupindex, key=groupindex.get)
+        self.path = self._compile(self.pattern, self.group_count)
+
+    @staticmethod
+    def _compile(pattern, groups):
+        """Return the format string, or None if `pattern` is too complicated"""
+        if pattern.startswith('^'):
+            pattern = pattern[1:]
+        if pattern.endswith('$'):
+            pattern = pattern[:-1]
+        if pattern.count('(') != groups or pattern.count(')') != groups:
+            return None
+
+        pieces = []
+        for i, fragment in enumerate(pattern.split('(')):
+            if i:
+                fragment = fragment[fragment.index(')') + 1:]
+            literal = parse_literal(fragment)
+            if literal is None:
+                return None
+            pieces.append(literal.replace('%', '%%'))
+        return '%s'.join(pieces)
+
+    def __call__(self, *args, **kwargs):
+        if kwargs or len(args) != self.group_count or self.path is None:
+            args = self._check_args(args, kwargs)
+            if self.path is None:
+                return self.spec.reverse(*args)
+        if not args:
+            return self.path
+        return self.path % tuple([escape_url_arg(i) for i in args])
+
+    def _check_args(self, args, kwargs):
+        if kwargs:
+            if args or len(kwargs) != len(self.group_names):
+                raise ValueError('Arguments of %s should be all keyword arguments of %s' % (
+                    self.pattern, ', '.join(self.group_names)))
+            args = [kwargs[i] for i in self.group_names]
+        if len(args) != self.group_count:
+            raise ValueError('%s requires %s arguments, got %s' % (
+                self.pattern, self.group_count, len(args)))
+        return args
+
+
+def escape_url_arg(value):
+    # integers are the most common arguments, which need no escaping
+    if type(value) is int:
+        return str(value)
+    if isinstance(value, bytes):
+        return quote_plus(value)
+    if not isinstance(value, type(u'')):
+        value = str(value)
+    return url_escape(value)
+
+
+class LazyIncludeHandler(RequestHandler):
+    """Placeholder of the routes of a lazy include, loads the real routes
+    on the first request, then dispatches the request again
+    """
+    def initialize(self, include):
+        self.include = include
+
+    def _execute(self, transforms, *args, **kwargs):
+        try:
+            self.include.load(self.application)
+        except Exception as e:
+            self._transforms = transforms
+            self._handle_request_exception(e)
+            return
+        # requests in progress are tracked by the handler dispatched later
+        self._finished = True
+        dispatch = getattr(self.application, '_dispatch', self.application)
+        dispatch(self.request)
+
+
+class LazyInclude(object):
+    """Routes of a module that is not imported until they are needed.
+
+    Until loaded, the routes are placeholders handled by ``LazyIncludeHandler``:
+    one that matches every path under `prefix`, or the exact patterns from the
+    route manifest (``ROUTE_MANIFEST``), so that no module is imported to
+    register routes at all. Once loaded, the placeholders are replaced by the
+    real routes in the application, at the same position.
+    """
+    def __init__(self, prefix, searcher):
+        self.prefix = prefix
+        self.searcher = searcher
+
+    def get_placeholders(self):
+        entries = None
+        if settings['ROUTE_MANIFEST']:
+            entries = get_manifest(settings['ROUTE_MANIFEST']).get(self.searcher.import_path)
+        if entries is None:
+            return [(self.prefix + '.*', LazyIncludeHandler, {'include': self})]
+        # names are kept so that urls could be built before loaded
+        return [(self.prefix + i['pattern'], LazyIncludeHandler, {'include': self}, i.get('name'))
+                for i in entries]
+
+    def get_handlers(self):
+        return [(self.prefix + spec[0], ) + tuple(spec[1:])
+                for spec in self.searcher.get_handlers()]
+
+    def load(self, application):
+        """Replace the placeholders in `application`, which is one of those
+        made by ``TorextApp.make_application``
+        """
+        handlers = None
+        for _, host_specs in application.handlers:
+            indexes = [i for i, spec in enumerate(host_specs)
+                       if spec.handler_class is LazyIncludeHandler and spec.kwargs['include'] is self]
+            if not indexes:
+                continue
+            if handlers is None:
+                handlers = self.get_handlers()
+            specs = [make_spec(i) for i in handlers]
+            for i in reversed(indexes):
+                del host_specs[i]
+            host_specs[indexes[0]:indexes[0]] = specs
+            for spec in specs:
+                if spec.name:
+                    application.named_handlers[spec.name] = spec
+                    if getattr(application, 'url_builders', None) is not None:
+                        application.url_builders.pop(spec.name, None)
+        if handlers is None:
+            return
+        app_log.debug('Loaded lazy routes of %s', self.searcher.import_path)
+        if getattr(application, 'routers', None) is not None:
+            application.compile_routes()
+
+
+def get_lazy_includes(application):
+    """Return the lazy includes not loaded in `application`"""
+    includes = []
+    for _, host_specs in application.handlers:
+        for spec in host_specs:
+            if spec.handler_class is LazyIncludeHandler and spec.kwargs['include'] not in includes:
+                includes.append(spec.kwargs['include'])
+    return includes
 
 
 def format_pattern(ptn):
     if ptn.endswith('/') and len(ptn) > 1:
         ptn = ptn[:-1]
     return ptn
+
+
+# a regex that never matches
+NEVER_MATCH = re.compile(r'(?!)')
+
+# segments of these regexes never contain '/', value is the checker of a
+# segment, None accepts any, matched routes are verified by their regex
+SEGMENT_MATCHERS = {
+    r'[^/]+': None,
+    r'[^/]*': None,
+    r'\w+': None,
+    r'\d+': lambda s: s.isdigit(),
+    r'[0-9]+': lambda s: s.isdigit(),
+}
+
+SEGMENT_PARAM_REGEX = re.compile(r'^\((?:\?P<\w+>)?(.+)\)$')
+
+REGEX_CHARS = set('.^$*+?{}[]|()\\')
+
+
+class NeverMatchSpec(object):
+    """Returned by ``_get_host_handlers`` when no route matches, so that
+    tornado responds 404"""
+    regex = NEVER_MATCH
+
+
+def parse_literal(segment):
+    """Return the literal string that `segment` regex matches, or None"""
+    chars = []
+    escaped = False
+    for c in segment:
+        if escaped:
+            if c.isalnum():
+                return None
+            chars.append(c)
+            escaped = False
+        elif c == '\\':
+            escaped = True
+        elif c in REGEX_CHARS:
+            return None
+        else:
+            chars.append(c)
+    if escaped:
+        return None
+    return ''.join(chars)
+
+
+class _Node(object):
+    __slots__ = ('static', 'params', 'routes', 'fallbacks', 'min_index')
+
+    def __init__(self):
+        self.static = {}
+        # [(checker, key, node)]
+        self.params = []
+        # [(index, spec)], routes ending at this node
+        self.routes = []
+        # [(index, spec)], routes whose rest could only be matched by regex
+        self.fallbacks = []
+        self.min_index = None
+
+    def child(self, key, checker=None, is_param=False):
+        if not is_param:
+            node = self.static.get(key)
+            if node is None:
+                node = self.static[key] = _Node()
+            return node
+        for _checker, _key, node in self.params:
+            if _key == key:
+                return node
+        node = _Node()
+        self.params.append((checker, key, node))
+        return node
+
+    def finalize(self):
+        indexes = [i for i, _ in self.routes] + [i for i, _ in self.fallbacks]
+        for node in list(self.static.values()) + [i[2] for i in self.params]:
+            indexes.append(node.finalize())
+        self.routes.sort(key=lambda x: x[0])
+        self.fallbacks.sort(key=lambda x: x[0])
+        self.min_index = min(indexes)
+        return self.min_index
+
+
+class RadixRouter(object):
+    """Find the first spec in `specs` (``URLSpec`` list) whose regex matches
+    a path, as tornado does by trying them in order, but in a tree of path
+    segments: literal segments are looked up in dicts, simple groups like
+    ``(\\d+)`` or ``([^/]+)`` are checked without regex, and only the rest
+    of a pattern that could not be split is matched by regex. A candidate is
+    verified by its regex before returned, so the result is always the same
+    as tornado.
+    """
+    def __init__(self, specs):
+        self.specs = specs
+        self.root = _Node()
+        # path -> (index, spec) of literal routes
+        self.literals = {}
+        for index, spec in enumerate(specs):
+            self.add(index, spec)
+        if specs:
+            self.root.finalize()
+
+    def add(self, index, spec):
+        pattern = spec.regex.pattern
+        if pattern.startswith('^'):
+            pattern = pattern[1:]
+        if pattern.endswith('$') and not pattern.endswith('\\$'):
+            pattern = pattern[:-1]
+
+        node = self.root
+        # alternatives could start anywhere
+        if not pattern.startswith('/') or '|' in pattern:
+            node.fallbacks.append((index, spec))
+            return
+
+        literal = True
+        for segment in pattern.split('/'):
+            value = parse_literal(segment)
+            if value is not None:
+                node = node.child(value)
+                continue
+            literal = False
+            m = SEGMENT_PARAM_REGEX.match(segment)
+            if m and m.group(1) in SEGMENT_MATCHERS:
+                node = node.child(m.group(1), SEGMENT_MATCHERS[m.group(1)], is_param=True)
+                continue
+            node.fallbacks.append((index, spec))
+            return
+        node.routes.append((index, spec))
+        if literal:
+            path = parse_literal(pattern)
+            if path is not None and path not in self.literals:
+                self.literals[path] = (index, spec)
+
+    def lookup(self, path):
+        """Return the first matching spec, or None"""
+        best = self.literals.get(path)
+        if best is not None and best[0] == 0:
+            return best[1]
+        if self.specs:
+            best = self._search(self.root, path, path.split('/'), 0, best)
+        return best and best[1]
+
+    def _search(self, node, path, segments, i, best):
+        if best is not None and node.min_index >= best[0]:
+            return best
+        for index, spec in node.fallbacks:
+            if best is not None and index >= best[0]:
+                break
+            if spec.regex.match(path):
+                best = (index, spec)
+                break
+        if i == len(segments):
+            for index, spec in node.routes:
+                if best is not None and index >= best[0]:
+                    break
+                if spec.regex.match(path):
+                    best = (index, spec)
+                    break
+            return best
+        segment = segments[i]
+        child = node.static.get(segment)
+        if child is not None:
+            best = self._search(child, path, segments, i + 1, best)
+        for checker, _, child in node.params:
+            if checker is None or checker(segment):
+                best = self._search(child, path, segments, i + 1, best)
+        return best
@@ -0,0 +1,741 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Supervisor mode for multi-process serving
+#
+# The master process binds the listening sockets once and never serves
+# requests itself, workers are spawned by re-executing the current command
+# line with the bound sockets inherited, so that a worker always runs the
+# code that is on disk at the time it is spawned. Or in the preload mode,
+# workers are forked from master in which the application was built, and
+# call the worker target directly, so that the memory of loaded code and
+# data is shared copy-on-write.
+#
+# Workers report to master through a status pipe: ``ready`` once they are
+# accepting, then a heartbeat with the served requests count and RSS every
+# few seconds. Master kills workers that stop sending heartbeats, respawns
+# crashed workers (with backoff when they crash in a loop), and recycles
+# workers that exceed the max requests or max RSS limits gracefully, in the
+# same way as a rolling restart.
+#
+# With ``reuse_port``, master binds nothing, each worker binds its own
+# listener with SO_REUSEPORT so that the kernel balances connections among
+# workers instead of waking them all up on a shared socket.
+#
+# Signals handled by the master:
+#   HUP       rolling restart, replace workers one at a time
+#   TERM/INT  graceful shutdown, workers stop accepting and drain
+#   QUIT      immediate shutdown
+# and those passed as `forward_signals` are sent to all workers
+
+import os
+import sys
+import time
+import errno
+import fcntl
+import random
+import select
+import signal
+import socket
+import resource
+
+from tornado import netutil
+
+from torext.log import app_log
+
+
+ENV_SOCKETS = 'TOREXT_WORKER_SOCKETS'
+ENV_PIPE = 'TOREXT_WORKER_PIPE'
+ENV_ID = 'TOREXT_WORKER_ID'
+
+# extra seconds given to a stopping worker before it gets SIGKILL
+KILL_GRACE = 5
+
+# a worker exits within this many seconds after spawned is counted as a
+# crash loop, the respawn will be delayed exponentially up to MAX_BACKOFF
+CRASH_WINDOW = 10
+MAX_BACKOFF = 60
+
+
+# not defined in python 2
+SO_REUSEPORT = getattr(socket, 'SO_REUSEPORT', 15 if sys.platform.startswith('linux') else None)
+
+
+def bind_sockets(port, address=None, reuse_port=False, backlog=128):
+    """Same as ``tornado.netutil.bind_sockets``, with SO_REUSEPORT option"""
+    if not reuse_port:
+        return netutil.bind_sockets(port, address=address, backlog=backlog)
+    if SO_REUSEPORT is None:
+        raise ValueError('SO_REUSEPORT is not supported on this platform')
+
+    sockets = []
+    family = socket.AF_UNSPEC if socket.has_ipv6 else socket.AF_INET
+    for res in set(socket.getaddrinfo(address or None, port, family, socket.SOCK_STREAM,
+                                      0, socket.AI_PASSIVE)):
+        af, socktype, proto, canonname, sockaddr = res
+        sock = socket.socket(af, socktype, proto)
+        set_inheritable(sock.fileno(), False)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, SO_REUSEPORT, 1)
+        if af == socket.AF_INET6 and hasattr(socket, 'IPPROTO_IPV6'):
+            sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 1)
+        sock.setblocking(0)
+        sock.bind(sockaddr)
+        sock.listen(backlog)
+        sockets.append(sock)
+    return sockets
+
+
+def set_cpu_affinity(index):
+    """Pin current process to the cpu of `index` (modulo cpu count),
+    return the cpu number, or None if not supported
+    """
+    from tornado.process import cpu_count
+
+    cpu = index % cpu_count()
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, [cpu])
+        return cpu
+    if not sys.platform.startswith('linux'):
+        app_log.warning('CPU affinity is not supported on %s', sys.platform)
+        return None
+
+    import ctypes
+    import ctypes.util
+
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    mask = ctypes.c_ulong(1 << cpu)
+    if libc.sched_setaffinity(0, ctypes.sizeof(mask), ctypes.byref(mask)) != 0:
+        app_log.warning('Failed to set CPU affinity: errno %s', ctypes.get_errno())
+        return None
+    return cpu
+
+
+def fork_processes(num_processes, max_restarts=100, log_writer=None, forward_signals=()):
+    """Fork `num_processes` children and return the task id in each of them,
+    like ``tornado.process.fork_processes``, which never returns in the
+    parent, so the parent could not shut down gracefully on its own: here
+    TERM and INT received by the parent are forwarded to the children, and
+    they are not restarted after that. The parent exits when all children
+    have exited.
+
+    `log_writer` (``torext.logwriter.LogWriter``) is restarted if it exits.
+
+    `forward_signals` received by the parent are sent to every child, like
+    those of ``Supervisor``.
+    """
+    from tornado import process
+
+    if num_processes is None or num_processes <= 0:
+        num_processes = process.cpu_count()
+    app_log.info('Starting %s processes', num_processes)
+    # pid -> task id
+    children = {}
+    stopping = []
+
+    def on_signal(signum, frame):
+        if signum in (signal.SIGTERM, signal.SIGINT):
+            stopping.append(signum)
+        for pid in list(children):
+            try:
+                os.kill(pid, signum)
+            except OSError as e:
+                if e.errno != errno.ESRCH:
+                    raise
+
+    def start_child(i):
+        pid = os.fork()
+        if pid == 0:
+            # handled by the application in the child
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(sig, signal.SIG_DFL)
+            # ignored until the application handles them
+            for sig in forward_signals:
+                signal.signal(sig, signal.SIG_IGN)
+            random.seed()
+            process._task_id = i
+            return i
+        children[pid] = i
+        return None
+
+    for sig in [signal.SIGTERM, signal.SIGINT] + list(forward_signals):
+        signal.signal(sig, on_signal)
+    for i in range(num_processes):
+        id = start_child(i)
+        if id is not None:
+            return id
+
+    restarts = 0
+    while children:
+        try:
+            pid, status = os.wait()
+        except OSError as e:
+            if e.errno == errno.EINTR:
+                continue
+            raise
+        id = children.pop(pid, None)
+        if id is None:
+            if log_writer and pid == log_writer.pid and not stopping:
+                log_writer.on_exit(status)
+            continue
+        if os.WIFSIGNALED(status):
+            reason = 'killed by signal %s' % os.WTERMSIG(status)
+        elif os.WEXITSTATUS(status) != 0:
+            reason = 'exited with status %s' % os.WEXITSTATUS(status)
+        else:
+            app_log.info('Child %s (pid %s) exited normally', id, pid)
+            continue
+        if stopping:
+            app_log.info('Child %s (pid %s) %s', id, pid, reason)
+            continue
+        app_log.warning('Child %s (pid %s) %s, restarting', id, pid, reason)
+        restarts += 1
+        if restarts > max_restarts:
+            raise RuntimeError('Too many child restarts, giving up')
+        id = start_child(id)
+        if id is not None:
+            return id
+    sys.exit(0)
+
+
+def get_rss(pid=None):
+    """Return resident set size of a process in bytes"""
+    try:
+        with open('/proc/%s/statm' % (pid or 'self'), 'r') as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize()
+    except (IOError, OSError):
+        if pid is not None:
+            return None
+        # not linux, fallback to peak RSS, which is in bytes on mac
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform != 'darwin':
+            rss *= 1024
+        return rss
+
+
+def get_memory_info(pid=None):
+    """Return memory usage of a process in bytes as a dict of
+    ``rss``, ``pss`` (proportional set size, shared pages are divided by
+    the number of processes sharing them), ``uss`` (unique set size, the
+    memory that would be freed if the process exits) and ``shared``,
+    return None if not available (linux only).
+    """
+    pid = pid or 'self'
+    # smaps_rollup is much cheaper, but only in linux 4.14+
+    for name in ('smaps_rollup', 'smaps'):
+        try:
+            with open('/proc/%s/%s' % (pid, name), 'r') as f:
+                lines = f.readlines()
+            break
+        except (IOError, OSError):
+            continue
+    else:
+        return None
+
+    fields = {}
+    for line in lines:
+        parts = line.split()
+        # values lines look like ``Private_Dirty:     12 kB``
+        if len(parts) == 3 and parts[2] == 'kB':
+            key = parts[0][:-1]
+            fields[key] = fields.get(key, 0) + int(parts[1]) * 1024
+    uss = fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)
+    return {
+        'rss': fields.get('Rss', 0),
+        'pss': fields.get('Pss', 0),
+        'uss': uss,
+        'shared': fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0),
+    }
+
+
+def set_inheritable(fd, inheritable=True):
+    flags = fcntl.fcntl(fd, fcntl.F_GETFD)
+    if inheritable:
+        flags &= ~fcntl.FD_CLOEXEC
+    else:
+        flags |= fcntl.FD_CLOEXEC
+    fcntl.fcntl(fd, fcntl.F_SETFD, flags)
+
+
+def set_nonblocking(fd):
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+
+def is_worker():
+    """Whether current process is a worker spawned by supervisor"""
+    return ENV_ID in os.environ
+
+
+def worker_id():
+    if not is_worker():
+        return None
+    return int(os.environ[ENV_ID])
+
+
+def get_inherited_sockets():
+    """Rebuild the listening sockets passed by master,
+    the environment value is formatted as ``fd:family,fd:family``
+    """
+    sockets = []
+    if not os.environ.get(ENV_SOCKETS):
+        return sockets
+    for i in os.environ[ENV_SOCKETS].split(','):
+        fd, family = [int(j) for j in i.split(':')]
+        sock = socket.fromfd(fd, family, socket.SOCK_STREAM)
+        # `fromfd` dups the file descriptor, the original one is useless now
+        os.close(fd)
+        set_inheritable(sock.fileno(), False)
+        sock.setblocking(0)
+        sockets.append(sock)
+    return sockets
+
+
+class WorkerChannel(object):
+    """The worker side of the status pipe, through which a worker
+    reports its state to master, one message per line.
+    """
+    def __init__(self, fd):
+        self.fd = fd
+        set_inheritable(fd, False)
+        set_nonblocking(fd)
+
+    @classmethod
+    def from_environ(cls):
+        return cls(int(os.environ[ENV_PIPE]))
+
+    def notify(self, *parts):
+        line = ' '.join(str(i) for i in parts) + '\n'
+        try:
+            os.write(self.fd, line.encode('ascii'))
+        except OSError as e:
+            # master is busy or gone, neither should break the worker
+            if e.errno not in (errno.EAGAIN, errno.EPIPE):
+                raise
+
+
+def run_worker(app, heartbeat_interval=5, sockets=None, cpu_affinity=False):
+    """Serve the application in a worker process, called by ``TorextApp.run``
+    when the process is spawned by supervisor. `sockets` is for the
+    SO_REUSEPORT mode, in which workers bind their own sockets.
+    """
+    from tornado.ioloop import PeriodicCallback
+
+    if cpu_affinity:
+        cpu = set_cpu_affinity(worker_id())
+        app_log.info('Worker %s pinned to cpu %s', worker_id(), cpu)
+
+    app.make_http_server(sockets=get_inherited_sockets() + (sockets or []))
+    app.start_process_tasks()
+    io_loop = app.io_loop
+    channel = WorkerChannel.from_environ()
+    master_pid = os.getppid()
+
+    def heartbeat():
+        if os.getppid() != master_pid:
+            app_log.warning('Master %s is gone, shutting down', master_pid)
+            heartbeat_callback.stop()
+            app.shutdown()
+            return
+        channel.notify('heartbeat', app.request_count, get_rss())
+
+    heartbeat_callback = PeriodicCallback(heartbeat, heartbeat_interval * 1000, io_loop=io_loop)
+
+    def on_term(signum, frame):
+        io_loop.add_callback_from_signal(app.shutdown)
+
+    signal.signal(signal.SIGTERM, on_term)
+    # Ctrl-C is delivered to the whole process group, let master decide
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+    io_loop.add_callback(channel.notify, 'ready')
+    heartbeat_callback.start()
+    io_loop.start()
+
+
+class Worker(object):
+    """Master side record of a worker process"""
+    def __init__(self, pid, id, fd):
+        self.pid = pid
+        self.id = id
+        self.fd = fd
+        self.buffer = b''
+        self.spawned_at = time.time()
+        self.ready = False
+        self.retiring = False
+        self.kill_at = None
+        self.last_heartbeat = self.spawned_at
+        self.requests = 0
+        self.max_requests = 0
+        self.rss = 0
+
+    def __repr__(self):
+        return '<Worker %s pid=%s>' % (self.id, self.pid)
+
+
+class Supervisor(object):
+    def __init__(self, sockets, num_workers, graceful_timeout=30, boot_timeout=60,
+                 timeout=60, max_requests=0, max_rss=0, worker_target=None,
+                 forward_signals=(), metrics_dir=None, log_writer=None):
+        """
+        `timeout` is the seconds a worker could keep silent before being
+        killed, `max_requests` is the requests count and `max_rss` is the
+        RSS in bytes that a worker will be recycled after reaching,
+        0 means no limit.
+
+        If `worker_target` is passed, workers are forked without exec and
+        call ``worker_target(sockets)`` to serve.
+
+        `forward_signals` received by master are sent to every worker.
+
+        If `metrics_dir` is passed, metrics snapshots of reaped workers are
+        folded into one, see ``torext.metrics.fold_snapshot``.
+
+        `log_writer` (``torext.logwriter.LogWriter``) is restarted if it exits.
+        """
+        self.sockets = sockets
+        self.num_workers = num_workers
+        self.graceful_timeout = graceful_timeout
+        self.boot_timeout = boot_timeout
+        self.timeout = timeout
+        self.max_requests = max_requests
+        self.max_rss = max_rss
+        self.worker_target = worker_target
+        self.forward_signals = list(forward_signals)
+        self.metrics_dir = metrics_dir
+        self.log_writer = log_writer
+
+        # pid -> Worker
+        self.workers = {}
+        # workers waiting to be replaced, handled one at a time
+        self.replace_queue = []
+        # new worker pid -> the old worker it replaces
+        self.replacing = {}
+        # worker id -> crashes in a row
+        self.crashes = {}
+        # worker id -> time to respawn
+        self.pending_spawns = {}
+
+        self.stopping = False
+        self.stop_deadline = None
+        self._signals = []
+        self._wakeup_r = self._wakeup_w = None
+
+    @classmethod
+    def bind(cls, port, address=None, reuse_port=False, **kwargs):
+        """In `reuse_port` mode, sockets are bound in workers"""
+        if reuse_port:
+            return cls([], **kwargs)
+        return cls(bind_sockets(port, address=address), **kwargs)
+
+    def run(self):
+        self.init_signals()
+        app_log.info('Supervisor started (pid %s), spawning %s workers',
+                     os.getpid(), self.num_workers)
+        for i in range(self.num_workers):
+            self.spawn_worker(i)
+
+        while True:
+            self.handle_signals()
+            self.reap_workers()
+            if self.stopping:
+                if not self.workers:
+                    break
+                if time.time() > self.stop_deadline:
+                    self.kill_workers(signal.SIGKILL)
+            else:
+                self.maintain_workers()
+            self.wait(1.0)
+
+        app_log.info('Supervisor exit')
+        sys.exit(0)
+
+    def init_signals(self):
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        for fd in (self._wakeup_r, self._wakeup_w):
+            set_inheritable(fd, False)
+            set_nonblocking(fd)
+
+        for sig in [signal.SIGHUP, signal.SIGTERM, signal.SIGINT,
+                    signal.SIGQUIT, signal.SIGCHLD] + self.forward_signals:
+            signal.signal(sig, self._on_signal)
+
+    def _on_signal(self, signum, frame):
+        if signum != signal.SIGCHLD:
+            self._signals.append(signum)
+        try:
+            os.write(self._wakeup_w, b'.')
+        except OSError:
+            pass
+
+    def wait(self, timeout):
+        fds = [self._wakeup_r] + [w.fd for w in self.workers.values()]
+        try:
+            readable, _, _ = select.select(fds, [], [], timeout)
+        except (select.error, OSError) as e:
+            if e.args[0] == errno.EINTR:
+                return
+            raise
+        for fd in readable:
+            if fd == self._wakeup_r:
+                try:
+                    while os.read(fd, 64):
+                        pass
+                except OSError:
+                    pass
+                continue
+            for worker in list(self.workers.values()):
+                if worker.fd == fd:
+                    self.read_messages(worker)
+
+    def read_messages(self, worker):
+        try:
+            data = os.read(worker.fd, 4096)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return
+            raise
+        worker.buffer += data
+        while b'\n' in worker.buffer:
+            line, worker.buffer = worker.buffer.split(b'\n', 1)
+            parts = line.decode('ascii').split()
+            if parts:
+                self.handle_message(worker, parts[0], parts[1:])
+
+    def handle_message(self, worker, kind, args):
+        if kind == 'ready':
+            worker.ready = True
+            app_log.info('%s is ready', worker)
+            worker.last_heartbeat = time.time()
+            old = self.replacing.pop(worker.pid, None)
+            if old is not None:
+                self.retire_worker(old)
+        elif kind == 'heartbeat':
+            worker.last_heartbeat = time.time()
+            worker.requests, worker.rss = int(args[0]), int(args[1])
+
+    def handle_signals(self):
+        while self._signals:
+            signum = self._signals.pop(0)
+            if signum == signal.SIGHUP:
+                self.rolling_restart()
+            elif signum in (signal.SIGTERM, signal.SIGINT):
+                self.stop(graceful=True)
+            elif signum == signal.SIGQUIT:
+                self.stop(graceful=False)
+            elif signum in self.forward_signals:
+                app_log.info('Forward signal %s to workers', signum)
+                self.kill_workers(signum)
+
+    def spawn_worker(self, id):
+        r, w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # child process
+            status = 1
+            try:
+                os.close(r)
+                for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT,
+                            signal.SIGQUIT, signal.SIGCHLD):
+                    signal.signal(sig, signal.SIG_DFL)
+                # ignored until the worker handles them, which survives exec
+                for sig in self.forward_signals:
+                    signal.signal(sig, signal.SIG_IGN)
+                if self.worker_target:
+                    self._run_forked_worker(id, w)
+                    status = 0
+                else:
+                    env = dict(os.environ)
+                    env[ENV_SOCKETS] = ','.join(
+                        '%s:%s' % (s.fileno(), s.family) for s in self.sockets)
+                    env[ENV_PIPE] = str(w)
+                    env[ENV_ID] = str(id)
+                    for sock in self.sockets:
+                        set_inheritable(sock.fileno())
+                    set_inheritable(w)
+                    os.execve(sys.executable, [sys.executable] + sys.argv, env)
+            except Exception:
+                app_log.error('Failed to run worker %s', id, exc_info=True)
+            finally:
+                os._exit(status)
+
+        os.close(w)
+        set_inheritable(r, False)
+        set_nonblocking(r)
+        worker = Worker(pid, id, r)
+        if self.max_requests:
+            # jitter the limit so that workers will not be recycled at once
+            worker.max_requests = self.max_requests + random.randint(0, self.max_requests // 10)
+        self.workers[pid] = worker
+        app_log.info('Spawned %s', worker)
+        return worker
+
+    def _run_forked_worker(self, id, pipe_fd):
+        # pipes of master are useless in worker
+        for fd in [self._wakeup_r, self._wakeup_w] + [i.fd for i in self.workers.values()]:
+            if fd is not None:
+                os.close(fd)
+        # the sockets are passed directly, nothing to inherit
+        os.environ[ENV_SOCKETS] = ''
+        os.environ[ENV_PIPE] = str(pipe_fd)
+        os.environ[ENV_ID] = str(id)
+        # or all workers generate the same random sequence
+        random.seed()
+        self.worker_target(list(self.sockets))
+
+    def retire_worker(self, worker):
+        """Ask a worker to stop accepting and drain"""
+        worker.retiring = True
+        worker.kill_at = time.time() + self.graceful_timeout + KILL_GRACE
+        self.signal_worker(worker, signal.SIGTERM)
+
+    def signal_worker(self, worker, signum):
+        try:
+            os.kill(worker.pid, signum)
+        except OSError as e:
+            if e.errno != errno.ESRCH:
+                raise
+
+    def kill_workers(self, signum):
+        for worker in list(self.workers.values()):
+            self.signal_worker(worker, signum)
+
+    def reap_workers(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError as e:
+                if e.errno == errno.ECHILD:
+                    return
+                raise
+            if not pid:
+                return
+            worker = self.workers.pop(pid, None)
+            if worker is None:
+                if self.log_writer and pid == self.log_writer.pid and not self.stopping:
+                    self.log_writer.on_exit(status)
+                continue
+            os.close(worker.fd)
+            self.on_worker_exit(worker, status)
+            if self.metrics_dir:
+                self.fold_metrics(worker)
+
+    def fold_metrics(self, worker):
+        from torext.metrics import fold_snapshot
+
+        try:
+            fold_snapshot(self.metrics_dir, worker.pid)
+        except (IOError, OSError, ValueError):
+            app_log.warning('Failed to fold metrics of %s', worker, exc_info=True)
+
+    def on_worker_exit(self, worker, status):
+        if os.WIFSIGNALED(status):
+            reason = 'killed by signal %s' % os.WTERMSIG(status)
+        else:
+            reason = 'exited with status %s' % os.WEXITSTATUS(status)
+
+        if worker.retiring or self.stopping:
+            app_log.info('%s %s', worker, reason)
+            return
+
+        app_log.warning('%s %s unexpectedly', worker, reason)
+
+        old = self.replacing.pop(worker.pid, None)
+        if old is not None:
+            # the new code could not boot, keep old workers serving
+            app_log.error('%s failed to boot, abort replacing workers', worker)
+            del self.replace_queue[:]
+            return
+
+        # an old worker whose replacement is still booting
+        for new_pid, old in list(self.replacing.items()):
+            if old is worker:
+                del self.replacing[new_pid]
+                return
+
+        if time.time() - worker.spawned_at < CRASH_WINDOW:
+            crashes = self.crashes.get(worker.id, 0) + 1
+        else:
+            crashes = 0
+        self.crashes[worker.id] = crashes
+        if crashes:
+            delay = min(2 ** (crashes - 1), MAX_BACKOFF)
+            app_log.warning('Worker %s crashed %s times in a row, respawn in %ss',
+                            worker.id, crashes, delay)
+            self.pending_spawns[worker.id] = time.time() + delay
+        else:
+            self.spawn_worker(worker.id)
+
+    def maintain_workers(self):
+        now = time.time()
+        for id, spawn_at in list(self.pending_spawns.items()):
+            if now >= spawn_at:
+                del self.pending_spawns[id]
+                self.spawn_worker(id)
+
+        for worker in list(self.workers.values()):
+            if worker.retiring:
+                continue
+            if not worker.ready:
+                # at startup, respawned after crashes, or replacing another
+                if now - worker.spawned_at > self.boot_timeout:
+                    app_log.error('%s did not get ready in %ss, kill it', worker, self.boot_timeout)
+                    self.signal_worker(worker, signal.SIGKILL)
+                continue
+            if now - worker.last_heartbeat > self.timeout:
+                app_log.error('%s sent no heartbeat in %ss, kill it', worker, self.timeout)
+                self.signal_worker(worker, signal.SIGKILL)
+                continue
+            if (worker.pid in self.replacing or worker in self.replace_queue or
+                    worker in self.replacing.values()):
+                continue
+            if self.max_requests and worker.requests >= worker.max_requests:
+                app_log.info('%s served %s requests, recycle it', worker, worker.requests)
+                self.replace_worker(worker)
+            elif self.max_rss and worker.rss >= self.max_rss:
+                app_log.info('%s RSS %sMB exceeds limit, recycle it',
+                             worker, worker.rss // 1024 // 1024)
+                self.replace_worker(worker)
+
+        for worker in list(self.workers.values()):
+            if worker.kill_at and now > worker.kill_at:
+                app_log.warning('%s did not exit in time, kill it', worker)
+                worker.kill_at = None
+                self.signal_worker(worker, signal.SIGKILL)
+
+        if self.replacing:
+            return
+        while self.replace_queue:
+            old = self.replace_queue.pop(0)
+            if old.pid in self.workers and not old.retiring:
+                new = self.spawn_worker(old.id)
+                self.replacing[new.pid] = old
+                break
+
+    def replace_worker(self, worker):
+        if worker not in self.replace_queue:
+            self.replace_queue.append(worker)
+
+    def rolling_restart(self):
+        app_log.info('Rolling restart %s workers', len(self.workers))
+        for worker in sorted(self.workers.values(), key=lambda x: x.id):
+            if not worker.retiring:
+                self.replace_worker(worker)
+
+    def stop(self, graceful=True):
+        if self.stopping and graceful:
+            return
+        self.stopping = True
+        del self.replace_queue[:]
+        self.replacing.clear()
+        self.pending_spawns.clear()
+        if graceful:
+            app_log.info('Stopping workers gracefully, timeout %ss', self.graceful_timeout)
+            self.stop_deadline = time.time() + self.graceful_timeout + KILL_GRACE
+            self.kill_workers(signal.SIGTERM)
+        else:
+            app_log.info('Stopping workers immediately')
+            self.stop_deadline = time.time()
+            self.kill_workers(signal.SIGKILL)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from torext import settings
+from torext.app import TorextApp
+from torext.handlers import BaseHandler
+from torext.accesslog import PrefixMatcher, BufferedWriter, AccessLog
+from nose.tools import eq_
+
+
+class FakeRequest(object):
+    method = 'GET'
+    remote_ip = '127.0.0.1'
+
+    def __init__(self, uri):
+        self.uri = uri
+        self.path = uri.split('?')[0]
+
+
+def test_prefix_matcher():
+    matcher = PrefixMatcher(['/api', '/api/v2', '/static'])
+    eq_(matcher.match('/api/v2/users'), '/api/v2')
+    eq_(matcher.match('/api/v1/users'), '/api')
+    eq_(matcher.match('/home'), None)
+    eq_(PrefixMatcher([]).match('/api'), None)
+
+
+def test_sample_rate():
+    access_log = AccessLog(None, ignore_urls=['/favicon.ico'], sample_rate=0.5,
+                           route_sample_rates={'/health': 0, '/api': 0.1},
+                           status_sample_rates={404: 0.01}, slow_threshold=1)
+
+    def rate(uri, status=200, request_time=0.01):
+        return access_log.get_sample_rate(FakeRequest(uri), status, request_time)
+
+    eq_(rate('/home'), 0.5)
+    eq_(rate('/favicon.ico'), 0)
+    eq_(rate('/health'), 0)
+    eq_(rate('/api/users'), 0.1)
+    eq_(rate('/home', 404), 0.01)
+    # errors and slow requests are always kept
+    eq_(rate('/health', 500), 1)
+    eq_(rate('/favicon.ico', 200, 2), 1)
+
+
+class AccessLogTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'access.log')
+
+        app = TorextApp()
+
+        @app.route('/ok')
+        class OKHandler(BaseHandler):
+            def get(self):
+                self.write('ok')
+
+        @app.route('/error')
+        class ErrorHandler(BaseHandler):
+            def get(self):
+                raise ValueError('oops')
+
+        app.update_settings({
+            'TESTING': True,
+            'ACCESS_LOG': True,
+            'ACCESS_LOG_FILE': self.path,
+            'ACCESS_LOG_ROUTE_SAMPLE_RATES': {'/ok': 0},
+        })
+        self.app = app
+        self.c = app.test_client()
+
+    def tearDown(self):
+        self.c.close()
+        settings['ACCESS_LOG'] = False
+        settings['ACCESS_LOG_FILE'] = None
+        settings['ACCESS_LOG_ROUTE_SAMPLE_RATES'] = {}
+        os.close(self.app.access_log.writer.fd)
+        shutil.rmtree(self.tmpdir)
+
+    def read_lines(self):
+        with open(self.path, 'r') as f:
+            return [json.loads(i) for i in f.read().splitlines()]
+
+    def test_log(self):
+        self.c.get('/ok')
+        self.c.get('/error')
+        # nothing is written before flushing
+        eq_(self.read_lines(), [])
+
+        self.app.access_log.flush()
+        lines = self.read_lines()
+        eq_(len(lines), 1)
+        eq_(lines[0]['status'], 500)
+        eq_(lines[0]['uri'], '/error')
+        eq_(lines[0]['handler'], 'ErrorHandler')
+        eq_(lines[0]['rate'], 1)
+
+    def test_buffer_size(self):
+        writer = BufferedWriter(self.path, buffer_size=10)
+        writer.write('12345\n')
+        eq_(os.path.getsize(self.path), 0)
+        writer.write('67890\n')
+        eq_(os.path.getsize(self.path), 12)
+        os.close(writer.fd)
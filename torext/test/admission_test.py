@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+
+from tornado.web import asynchronous
+
+from torext import settings
+from torext.app import TorextApp
+from torext.handlers import BaseHandler
+from torext.admission import Limiter
+from nose.tools import eq_
+
+
+class AdmissionTest(unittest.TestCase):
+    admission_settings = {}
+
+    def setUp(self):
+        app = TorextApp()
+
+        @app.route('/slow')
+        class SlowHandler(BaseHandler):
+            @asynchronous
+            def get(self):
+                self.app.io_loop.add_timeout(time.time() + 0.1, self.finish)
+
+        @app.route('/fast')
+        class FastHandler(BaseHandler):
+            def get(self):
+                self.write('ok')
+
+        self.old_settings = dict((k, settings[k]) for k in self.admission_settings)
+        app.update_settings(dict(self.admission_settings, TESTING=True))
+        self.c = app.test_client()
+
+    def tearDown(self):
+        self.c.close()
+        settings.update(self.old_settings)
+
+    def fetch_all(self, paths):
+        """Fetch concurrently, return responses in the order of finishing"""
+        responses = []
+
+        def callback(response):
+            responses.append(response)
+            if len(responses) == len(paths):
+                self.c.io_loop.stop()
+
+        for path in paths:
+            self.c.http_client.fetch(self.c.get_url(path), callback=callback)
+        self.c.io_loop.start()
+        return responses
+
+
+class QueueTest(AdmissionTest):
+    admission_settings = {
+        'ADMISSION_LIMIT': 1,
+        'ADMISSION_QUEUE_SIZE': 1,
+        'ADMISSION_QUEUE_TIMEOUT': 5,
+    }
+
+    def test_queue_and_reject(self):
+        responses = self.fetch_all(['/slow', '/slow', '/slow'])
+        eq_([i.code for i in responses], [503, 200, 200])
+        eq_(responses[0].headers['Retry-After'], '1')
+        stats = self.c.app.application.admission.limiter.stats()
+        eq_(stats['rejected'], 1)
+        eq_(stats['active'], 0)
+
+    def test_sync_handlers(self):
+        responses = self.fetch_all(['/fast'] * 5)
+        eq_([i.code for i in responses], [200] * 5)
+
+
+class QueueTimeoutTest(AdmissionTest):
+    admission_settings = {
+        'ADMISSION_LIMIT': 1,
+        'ADMISSION_QUEUE_TIMEOUT': 0.02,
+    }
+
+    def test_expire(self):
+        responses = self.fetch_all(['/slow', '/slow'])
+        eq_([i.code for i in responses], [503, 200])
+        eq_(self.c.app.application.admission.limiter.expired, 1)
+
+
+class RouteLimitTest(AdmissionTest):
+    admission_settings = {
+        'ADMISSION_ROUTE_LIMITS': {'/slow': 1},
+        'ADMISSION_QUEUE_SIZE': 0,
+    }
+
+    def test_route_limit(self):
+        responses = self.fetch_all(['/slow', '/slow', '/fast'])
+        eq_(sorted(i.code for i in responses), [200, 200, 503])
+        eq_([i.request.url.endswith('/fast') for i in responses if i.code == 503], [False])
+
+
+def test_adaptive_limit():
+    limiter = Limiter('*', 10, adaptive=True, target_latency=0.1, min_limit=2)
+    limiter.on_finish(0.5)
+    eq_(limiter.limit, 9)
+    # at most once per target latency
+    limiter.on_finish(0.5)
+    eq_(limiter.limit, 9)
+
+    # grows only when saturated
+    for _ in range(20):
+        limiter.on_finish(0.01)
+    eq_(limiter.limit, 9)
+    limiter.active = 9
+    for _ in range(12):
+        limiter.on_finish(0.01)
+    eq_(limiter.limit, 10)
+    for _ in range(100):
+        limiter.on_finish(0.01)
+    eq_(limiter.limit, 10)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import json
+import shutil
+import tempfile
+import unittest
+
+from tornado.web import asynchronous, RequestHandler
+
+from torext.app import TorextApp
+from torext.handlers import BaseHandler
+from torext.handlers.status import StatusHandler
+from nose.tools import eq_
+
+
+def make_app():
+    app = TorextApp()
+
+    @app.route('/slow')
+    class SlowHandler(BaseHandler):
+        @asynchronous
+        def get(self):
+            self.app.io_loop.add_timeout(time.time() + 0.2, self.finish)
+
+    app.route('/_status')(StatusHandler)
+
+    app.update_settings({
+        'TESTING': True
+    })
+    return app
+
+
+class ShutdownTest(unittest.TestCase):
+    def setUp(self):
+        self.app = make_app()
+        self.c = self.app.test_client()
+
+    def tearDown(self):
+        self.c.close()
+
+    def test_status(self):
+        rv = self.c.get('/_status')
+        d = json.loads(rv.body)
+        eq_(d['inflight'], 0)
+        eq_(d['shutting_down'], False)
+
+    def test_drain(self):
+        app = self.app
+        results = []
+
+        @app.register_shutdown_hook
+        def hook():
+            results.append('hook')
+
+        def start_shutdown():
+            results.append(app.inflight_requests)
+            app.shutdown(timeout=5)
+
+        self.c.http_client.fetch(self.c.get_url('/slow'),
+                                 callback=lambda resp: results.append(resp.code))
+        self.c.io_loop.add_timeout(time.time() + 0.05, start_shutdown)
+        # stopped by shutdown
+        self.c.io_loop.start()
+
+        eq_(results, [1, 200, 'hook'])
+        eq_(app.inflight_requests, 0)
+
+    def test_deadline(self):
+        app = self.app
+        self.c.http_client.fetch(self.c.get_url('/slow'), callback=lambda resp: None)
+        self.c.io_loop.add_timeout(time.time() + 0.05, lambda: app.shutdown(timeout=0))
+        self.c.io_loop.start()
+
+        eq_(app.inflight_requests, 1)
+
+        # let the slow request finish before next test
+        self.c.io_loop.add_timeout(time.time() + 0.3, self.c.io_loop.stop)
+        self.c.io_loop.start()
+
+
+class PreloadTest(unittest.TestCase):
+    def setUp(self):
+        self.template_path = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.template_path, 'sub'))
+        for name in ('index.html', 'sub/item.html'):
+            with open(os.path.join(self.template_path, name), 'w') as f:
+                f.write('{{ 1 + 1 }}')
+
+    def tearDown(self):
+        RequestHandler._template_loaders.pop(self.template_path, None)
+        shutil.rmtree(self.template_path)
+
+    def test_warm_templates(self):
+        app = TorextApp(application_options={'template_path': self.template_path})
+        app.update_settings({'TESTING': True})
+        app.preload()
+
+        loader = RequestHandler._template_loaders[self.template_path]
+        eq_(sorted(loader.templates), ['index.html', 'sub/item.html'])
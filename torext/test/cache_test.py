@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+
+from torext import cache
+from torext.app import TorextApp
+from torext.handlers import BaseHandler
+from torext.cache import ResponseCache, CacheEntry, ResponseCacheMixin
+from nose.tools import eq_
+
+
+def make_entry(body, ttl=10, stale_ttl=0):
+    return CacheEntry(200, [('Content-Type', 'text/plain')], body, ttl, stale_ttl)
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def test_lru(self):
+        c = ResponseCache(130)
+        size = make_entry(b'x' * 20).size
+        for key in 'abc':
+            c.set(key, make_entry(b'x' * 20))
+        # `a` becomes the most recently used
+        c.get('a')
+        c.set('d', make_entry(b'x' * 20))
+        eq_(sorted(c.entries), ['a', 'c', 'd'])
+        eq_(c.size, size * 3)
+        eq_(c.evictions, 1)
+
+        # too large to be cached
+        c.set('e', make_entry(b'x' * 200))
+        assert 'e' not in c.entries
+
+    def test_stale(self):
+        c = ResponseCache(1000)
+        c.set('a', make_entry(b'a', ttl=0, stale_ttl=10))
+        c.set('b', make_entry(b'b', ttl=0, stale_ttl=0))
+        entry, is_fresh = c.get('a')
+        eq_((entry.body, is_fresh), (b'a', False))
+        eq_(c.get('b'), (None, False))
+        assert 'b' not in c.entries
+        eq_((c.stale_hits, c.misses), (1, 1))
+
+    def test_route_ttls(self):
+        c = ResponseCache(1000, route_ttls={'/api': 5, '/api/articles': 1})
+        eq_(c.get_ttl('/api/articles/1', 60), 1)
+        eq_(c.get_ttl('/api/users', 60), 5)
+        eq_(c.get_ttl('/', 60), 60)
+
+
+class ResponseCacheMixinTest(unittest.TestCase):
+    def setUp(self):
+        app = TorextApp()
+        self.calls = calls = []
+
+        @app.route('/articles')
+        class ArticlesHandler(ResponseCacheMixin, BaseHandler):
+            PREPARES = ['cache']
+            CACHE_TTL = 0.05
+            CACHE_STALE_TTL = 10
+            CACHE_QUERY_ARGS = ['page']
+
+            def get(self):
+                calls.append(self.get_argument('page', None))
+                self.set_header('X-Count', str(len(calls)))
+                self.write_json({'count': len(calls)})
+
+        app.update_settings({'TESTING': True})
+        self.c = app.test_client()
+
+    def tearDown(self):
+        self.c.close()
+        cache._cache = None
+
+    def test_hit(self):
+        rv = self.c.get('/articles?page=1')
+        eq_(rv.headers['X-Cache'], 'MISS')
+        rv = self.c.get('/articles?page=1&other=1')
+        eq_(rv.headers['X-Cache'], 'HIT')
+        eq_(rv.headers['X-Count'], '1')
+        eq_(rv.headers['Content-Type'], 'application/json; charset=UTF-8')
+        eq_(rv.body, b'{"count": 1}')
+        self.c.get('/articles?page=2')
+        eq_(self.calls, ['1', '2'])
+
+        stats = cache.get_cache().stats()
+        eq_((stats['hits'], stats['misses'], stats['entries']), (1, 2, 2))
+
+    def test_stale_while_revalidate(self):
+        self.c.get('/articles')
+        time.sleep(0.06)
+        rv = self.c.get('/articles')
+        eq_(rv.headers['X-Cache'], 'STALE')
+        eq_(rv.body, b'{"count": 1}')
+        # the refresh is dispatched in the next IOLoop iteration
+        rv = self.c.get('/articles')
+        eq_(len(self.calls), 2)
+        eq_(self.c.get('/articles').body, b'{"count": 2}')
+        eq_(cache.get_cache().refreshing, set())
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+
+from tornado.web import asynchronous
+
+from torext import coalesce
+from torext.app import TorextApp
+from torext.handlers import BaseHandler
+from torext.coalesce import CoalesceMixin
+from nose.tools import eq_
+
+
+class CoalesceTest(unittest.TestCase):
+    def setUp(self):
+        app = TorextApp()
+        self.calls = calls = []
+
+        class SlowHandler(CoalesceMixin, BaseHandler):
+            PREPARES = ['coalesce']
+            COALESCE_TIMEOUT = 1
+            delay = 0.05
+
+            @asynchronous
+            def get(self):
+                calls.append(self.request.uri)
+                self.app.io_loop.add_timeout(time.time() + self.delay, self.respond)
+
+            def respond(self):
+                self.set_header('X-Calls', str(len(calls)))
+                self.finish('ok')
+
+        @app.route('/slow')
+        class OKHandler(SlowHandler):
+            pass
+
+        @app.route('/error')
+        class ErrorHandler(SlowHandler):
+            def respond(self):
+                raise ValueError('failed')
+
+        @app.route('/cookie')
+        class CookieHandler(SlowHandler):
+            def respond(self):
+                self.set_cookie('a', '1')
+                self.finish('ok')
+
+        @app.route('/timeout')
+        class TimeoutHandler(SlowHandler):
+            COALESCE_TIMEOUT = 0.05
+            delay = 0.2
+
+        app.update_settings({'TESTING': True})
+        self.c = app.test_client()
+
+    def tearDown(self):
+        self.c.close()
+        coalesce._group = None
+
+    def fetch_all(self, paths):
+        responses = []
+
+        def callback(response):
+            responses.append(response)
+            if len(responses) == len(paths):
+                self.c.io_loop.stop()
+
+        for path in paths:
+            self.c.http_client.fetch(self.c.get_url(path), callback=callback)
+        self.c.io_loop.start()
+        return responses
+
+    def test_coalesce(self):
+        responses = self.fetch_all(['/slow'] * 3 + ['/slow?page=2'])
+        eq_(sorted(self.calls), ['/slow', '/slow?page=2'])
+        eq_([i.code for i in responses], [200] * 4)
+        eq_(set(i.body for i in responses), set([b'ok']))
+        # headers of the leader are shared
+        eq_(len(set(i.headers['X-Calls'] for i in responses if i.request.url.endswith('/slow'))), 1)
+        stats = coalesce.get_flight_group().stats()
+        eq_((stats['leaders'], stats['followers'], stats['inflight']), (2, 2, 0))
+
+        # a finished flight is not joined
+        self.c.get('/slow')
+        eq_(len(self.calls), 3)
+
+    def test_error(self):
+        responses = self.fetch_all(['/error'] * 3)
+        eq_(len(self.calls), 1)
+        eq_([i.code for i in responses], [500] * 3)
+
+    def test_not_shared(self):
+        responses = self.fetch_all(['/cookie'] * 3)
+        # followers run on their own after the leader
+        eq_(len(self.calls), 3)
+        eq_([i.code for i in responses], [200] * 3)
+        assert all('Set-Cookie' in i.headers for i in responses)
+
+    def test_timeout(self):
+        responses = self.fetch_all(['/timeout'] * 2)
+        eq_([i.code for i in responses], [504, 200])
+        eq_(coalesce.get_flight_group().timeouts, 1)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import logging
+import unittest
+
+from tornado.web import asynchronous
+from tornado.httpclient import AsyncHTTPClient
+
+from torext import settings
+from torext.app import TorextApp
+from torext.handlers import BaseHandler
+from torext.context import get_request_id, request_id_filter
+from nose.tools import eq_
+
+
+class RecordHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class RequestIDTest(unittest.TestCase):
+    def setUp(self):
+        app = TorextApp()
+        test = self
+
+        @app.route('/echo')
+        class EchoHandler(BaseHandler):
+            def get(self):
+                self.write_json({
+                    'received': self.request.headers.get('X-Request-Id'),
+                    'request_id': self.request_id,
+                })
+
+        @app.route('/error')
+        class ErrorHandler(BaseHandler):
+            def get(self):
+                raise ValueError('oops')
+
+        @app.route('/outer')
+        class OuterHandler(BaseHandler):
+            @asynchronous
+            def get(self):
+                self.app.io_loop.add_timeout(time.time() + 0.01, self.on_timeout)
+
+            def on_timeout(self):
+                logging.getLogger('test.context').info('in callback')
+                AsyncHTTPClient(io_loop=self.app.io_loop).fetch(
+                    test.c.get_url('/echo'), self.on_response)
+
+            def on_response(self, response):
+                self.write(response.body)
+                self.finish()
+
+        app.update_settings({'TESTING': True, 'REQUEST_ID': True})
+        self.c = app.test_client()
+
+        self.handler = RecordHandler()
+        self.handler.addFilter(request_id_filter)
+        self.logger = logging.getLogger('test.context')
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.c.close()
+        settings['REQUEST_ID'] = False
+
+    def test_inbound(self):
+        rv = self.c.get('/echo', headers={'X-Request-Id': 'abc-123'})
+        eq_(rv.headers['X-Request-Id'], 'abc-123')
+
+        rv = self.c.get('/echo', headers={'X-Request-Id': 'bad id!'})
+        eq_(len(rv.headers['X-Request-Id']), 16)
+
+    def test_propagate(self):
+        rv = self.c.get('/outer', headers={'X-Request-Id': 'abc-123'})
+        eq_(rv.headers['X-Request-Id'], 'abc-123')
+        eq_(self.handler.records[0].request_id, 'abc-123')
+        # sent with the request made in a callback of the request
+        eq_(rv.body.decode('utf8').count('abc-123'), 2)
+        # context is restored after the request
+        eq_(get_request_id(), None)
+
+    def test_error(self):
+        # kept when the response is cleared by send_error
+        rv = self.c.get('/error', headers={'X-Request-Id': 'abc-123'})
+        eq_(rv.code, 500)
+        eq_(rv.headers['X-Request-Id'], 'abc-123')
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import unittest
+
+from torext import settings
+from torext.app import TorextApp
+from torext.handlers import BaseHandler
+from torext.log import app_log
+from torext.debuglog import debug_levels
+from nose.tools import eq_
+
+
+class RecordHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class DebugRequestTest(unittest.TestCase):
+    def setUp(self):
+        app = TorextApp()
+
+        @app.route('/users')
+        class UsersHandler(BaseHandler):
+            def get(self):
+                with self.span('query users'):
+                    self.log_debug('found %s users', 2)
+                self.write('ok')
+
+        @app.route('/debug/users')
+        class DebugUsersHandler(UsersHandler):
+            pass
+
+        @app.route('/debug/records')
+        class RecordsHandler(BaseHandler):
+            def get(self):
+                app_log.debug('debug record')
+                self.write('ok')
+
+        app.update_settings({
+            'TESTING': True,
+            'DEBUG_REQUEST_SECRET': 'secret',
+            'DEBUG_REQUEST_ROUTES': ['/debug/.*'],
+        })
+        self.app = app
+        self.c = app.test_client()
+
+        self.handler = RecordHandler()
+        self.handler.setLevel(logging.INFO)
+        self.logger = logging.getLogger('torext.app')
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.c.close()
+        settings['DEBUG_REQUEST_SECRET'] = None
+        settings['DEBUG_REQUEST_ROUTES'] = []
+
+    def test_not_debugged(self):
+        self.c.get('/users')
+        self.c.get('/users', headers={'X-Debug-Token': 'forged'})
+        eq_(self.handler.messages, [])
+
+    def assert_debugged(self, reason):
+        messages = self.handler.messages
+        eq_(len(messages), 4)
+        assert messages[0].startswith('Request Infomations')
+        eq_(messages[1], '[debug] found 2 users')
+        assert messages[2].startswith('Response Infomations')
+        assert messages[3].startswith('Debug 200 GET')
+        assert '(%s)' % reason in messages[3]
+        assert 'query users' in messages[3]
+
+    def test_token(self):
+        token = self.app.request_debugger.make_token('tester')
+        assert isinstance(token, str)
+        self.c.get('/users', headers={'X-Debug-Token': token})
+        self.assert_debugged('token')
+
+    def test_cookie(self):
+        token = self.app.request_debugger.make_token('tester')
+        self.c.get('/users', headers={'Cookie': 'debug_token=%s' % token})
+        self.assert_debugged('token')
+
+    def test_route(self):
+        self.c.get('/debug/users')
+        self.assert_debugged('route')
+
+    def test_debug_records(self):
+        self.handler.setLevel(logging.NOTSET)
+        old_level = self.logger.level
+        self.logger.setLevel(logging.INFO)
+        try:
+            self.c.get('/debug/records')
+            assert 'debug record' in self.handler.messages
+            # levels are restored after the request
+            eq_(self.logger.level, logging.INFO)
+            eq_(debug_levels.depth, 0)
+
+            self.handler.messages = []
+            debug_levels.enter()
+            try:
+                # lowered, but not of a debugged request
+                app_log.debug('other record')
+                # changed meanwhile, not restored
+                self.logger.setLevel(logging.ERROR)
+            finally:
+                debug_levels.exit()
+            eq_(self.handler.messages, [])
+            eq_(self.logger.level, logging.ERROR)
+        finally:
+            self.logger.setLevel(old_level)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import logging
+import unittest
+
+from torext import settings
+from torext.app import TorextApp
+from torext.handlers import BaseHandler
+from torext.errorlog import ErrorLog, fingerprint
+from nose.tools import eq_
+
+
+def raise_here(exc):
+    raise exc
+
+
+def get_exc_info(exc, there=False):
+    try:
+        if there:
+            raise exc
+        raise_here(exc)
+    except Exception:
+        return sys.exc_info()
+
+
+class RecordHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def test_fingerprint():
+    a = fingerprint(get_exc_info(ValueError('a')))
+    eq_(a, fingerprint(get_exc_info(ValueError('b'))))
+    assert a != fingerprint(get_exc_info(KeyError('a')))
+    assert a != fingerprint(get_exc_info(ValueError('a'), there=True))
+
+
+def test_error_log():
+    error_log = ErrorLog(limit=2, interval=60)
+    results = [error_log.should_log(get_exc_info(ValueError(i)))[0] for i in range(5)]
+    eq_(results, [True, True, False, False, False])
+    eq_(error_log.should_log(get_exc_info(KeyError('a')))[0], True)
+
+    handler = RecordHandler()
+    logger = logging.getLogger('torext.app')
+    logger.addHandler(handler)
+    try:
+        error_log.report()
+    finally:
+        logger.removeHandler(handler)
+    eq_(len(handler.records), 1)
+    assert 'suppressed 3 of 5' in handler.records[0].getMessage()
+    # a new interval is started
+    eq_(error_log.should_log(get_exc_info(ValueError('a')))[0], True)
+
+
+class ErrorLogAppTest(unittest.TestCase):
+    def setUp(self):
+        app = TorextApp()
+
+        @app.route('/error')
+        class ErrorHandler(BaseHandler):
+            def get(self):
+                raise ValueError('oops')
+
+        app.update_settings({'TESTING': True, 'ERROR_LOG_LIMIT': 1})
+        self.app = app
+        self.c = app.test_client()
+
+    def tearDown(self):
+        self.c.close()
+        settings['ERROR_LOG_LIMIT'] = 0
+
+    def test_suppress(self):
+        for i in range(3):
+            eq_(self.c.get('/error').code, 500)
+        error = list(self.app.error_log.errors.values())[0]
+        eq_(error[0], 3)
+        assert 'oops' in error[1]
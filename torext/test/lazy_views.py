@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Route module included lazily by route_test.py
+
+from torext.handlers import BaseHandler
+
+
+class ListHandler(BaseHandler):
+    def get(self):
+        self.write('list')
+
+
+class ItemHandler(BaseHandler):
+    def get(self, id):
+        self.write('item %s' % id)
+
+
+handlers = [
+    ('', ListHandler, {}, 'item_list'),
+    (r'/(\d+)', ItemHandler),
+]
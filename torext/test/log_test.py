@@ -1,9 +1,12 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import sys
+import json
 import logging
-from torext.log import set_logger
-from nose.tools import with_setup
+import threading
+from torext.log import set_logger, QueueHandler, BaseFormatter, JSONFormatter, _get_colors
+from nose.tools import with_setup, eq_
 from torext.compat import PY2
 
 
@@ -34,3 +37,107 @@ def logging_teardown():
 @with_setup(logging_setup, logging_teardown)
 def do_logging(msg):
     logging.info(msg)
+
+
+def test_formatter():
+    formatter = BaseFormatter(fmt='%(color)s%(fixed_levelname)s %(message)s%(end_color)s')
+    eq_(formatter.fields, ('fixed_levelname', 'message'))
+    record = logging.LogRecord('test', logging.WARNING, __file__, 1, 'hello %s', ('world', ), None)
+    eq_(formatter.format(record), u'WARN hello world')
+    # colors are detected once for a stream
+    assert formatter._colors is _get_colors(sys.stderr)
+
+
+def test_json_formatter():
+    formatter = JSONFormatter()
+    record = logging.LogRecord('test', logging.INFO, __file__, 1, 'hello %s', (u'中文', ), None)
+    record.request_id = 'abc'
+    data = json.loads(formatter.format(record))
+    eq_(data['level'], 'INFO')
+    eq_(data['module'], 'log_test')
+    eq_(data['lineno'], 1)
+    eq_(data['message'], u'hello 中文')
+    eq_(data['request_id'], 'abc')
+    assert 'exc' not in data
+
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        record = logging.LogRecord('test', logging.ERROR, __file__, 1, 'oops', (), sys.exc_info())
+    data = json.loads(formatter.format(record))
+    assert 'ZeroDivisionError' in data['exc']
+
+
+class SlowHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.event = threading.Event()
+        self.records = []
+
+    def emit(self, record):
+        self.event.wait()
+        self.records.append(self.format(record))
+
+
+def test_queue_handler():
+    target = SlowHandler()
+    handler = QueueHandler(target, queue_size=2)
+    logger = logging.getLogger('test.queue')
+    logger.propagate = 0
+    logger.addHandler(handler)
+    try:
+        data = {'n': 0}
+        for i in range(5):
+            data['n'] = i
+            logger.warning('%(n)s', data)
+        # at most one is taken by the thread, two are queued
+        assert handler.dropped >= 2
+
+        target.event.set()
+        handler.flush()
+        # args are merged when logged
+        assert '0' in target.records
+        assert '4' not in target.records
+        assert [i for i in target.records if 'log records dropped' in i]
+    finally:
+        logger.removeHandler(handler)
+        handler.close()
+
+
+def test_queue_handler_bad_call():
+    errors = []
+
+    class Handler(QueueHandler):
+        def handleError(self, record):
+            errors.append(record)
+
+    target = SlowHandler()
+    target.event.set()
+    handler = Handler(target)
+    logger = logging.getLogger('test.queue_error')
+    logger.propagate = 0
+    logger.addHandler(handler)
+    try:
+        # not raised to the caller
+        logger.warning('%s %s', 1)
+        eq_(len(errors), 1)
+    finally:
+        logger.removeHandler(handler)
+        handler.close()
+
+
+def test_set_logger_queue():
+    set_logger('test.set_queue', queue=True, queue_size=10)
+    logger = logging.getLogger('test.set_queue')
+    try:
+        eq_(len(logger.handlers), 1)
+        handler = logger.handlers[0]
+        assert isinstance(handler, QueueHandler)
+        eq_(handler.queue_size, 10)
+
+        # switch back to direct writing
+        set_logger('test.set_queue')
+        eq_(len(logger.handlers), 1)
+        assert isinstance(logger.handlers[0], logging.StreamHandler)
+    finally:
+        logger.handlers = []
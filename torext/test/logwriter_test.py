@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import shutil
+import signal
+import logging
+import tempfile
+import unittest
+
+from torext.log import set_logger, LogShipHandler, RotatingFileHandler
+from torext.logwriter import LogWriter
+from nose.tools import eq_
+
+
+class LogWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'app.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_rotating_file(self):
+        set_logger('test.file', handler='rotating_file', filename=self.path,
+                   max_bytes=100, backup_count=2, fmt='%(message)s', propagate=0)
+        logger = logging.getLogger('test.file')
+        try:
+            handler = logger.handlers[0]
+            assert isinstance(handler, RotatingFileHandler)
+            for i in range(10):
+                logger.info('%s', 'x' * 40)
+            eq_(sorted(os.listdir(self.tmpdir)), ['app.log', 'app.log.1', 'app.log.2'])
+            # reused when set again
+            set_logger('test.file', handler='rotating_file', filename=self.path,
+                       max_bytes=100, backup_count=2, propagate=0)
+            assert logger.handlers[0] is handler
+        finally:
+            for h in logger.handlers:
+                h.close()
+            logger.handlers = []
+
+    def test_handle_data(self):
+        writer = LogWriter(os.path.join(self.tmpdir, 'log.sock'), {
+            'test.ship': {'handler': 'rotating_file', 'filename': self.path, 'fmt': '%(message)s'},
+        })
+        writer.make_handlers()
+        ship = LogShipHandler(writer.address, 'test.ship')
+        data = b''
+        for i in range(3):
+            record = logging.LogRecord('test.ship', logging.INFO, __file__, 1, 'line %s', (i, ), None)
+            record.unpicklable = lambda: None
+            data += ship.makePickle(record)
+
+        # a partial record is kept for next read
+        rest = writer.handle_data(data[:-5])
+        eq_(rest, data[len(data) - 5 - len(rest):-5])
+        eq_(writer.handle_data(rest + data[-5:]), b'')
+        writer.handlers['test.ship'].close()
+        with open(self.path) as f:
+            eq_(f.read(), 'line 0\nline 1\nline 2\n')
+
+    def test_restart(self):
+        writer = LogWriter(os.path.join(self.tmpdir, 'log.sock'), {
+            'test.ship': {'handler': 'rotating_file', 'filename': self.path, 'fmt': '%(message)s'},
+        })
+        first = writer.start()
+        os.kill(first, signal.SIGKILL)
+        _, status = os.waitpid(first, 0)
+        writer.started_at -= 10
+        second = writer.on_exit(status)
+        try:
+            assert second != first
+            eq_(writer.pid, second)
+
+            logger = logging.getLogger('test.ship')
+            ship = LogShipHandler(writer.address, 'test.ship')
+            logger.addHandler(ship)
+            try:
+                logger.warning('after restart')
+            finally:
+                logger.removeHandler(ship)
+                ship.close()
+            for i in range(20):
+                if os.path.exists(self.path) and os.path.getsize(self.path):
+                    break
+                time.sleep(0.05)
+            with open(self.path) as f:
+                eq_(f.read(), 'after restart\n')
+        finally:
+            os.kill(second, signal.SIGKILL)
+            os.waitpid(second, 0)
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from torext import settings
+from torext.app import TorextApp
+from torext.handlers import BaseHandler
+from torext.handlers.status import MetricsHandler
+from torext.metrics import Histogram, Metrics, BUCKETS, get_handler_name, fold_snapshot
+from nose.tools import eq_
+
+
+def test_histogram():
+    h = Histogram()
+    for v in (0.00005, 0.0001, 0.003, 100):
+        h.observe(v)
+    # bucket upper bounds are inclusive
+    eq_(h.counts[0], 2)
+    eq_(h.counts[BUCKETS.index(0.005)], 1)
+    eq_(h.counts[-1], 1)
+    eq_(h.count, 4)
+
+
+def test_handler_name():
+    eq_(get_handler_name(MetricsHandler), 'torext.handlers.status.MetricsHandler')
+
+
+class MetricsTest(unittest.TestCase):
+    def setUp(self):
+        app = TorextApp()
+
+        @app.route('/ok')
+        class OKHandler(BaseHandler):
+            def get(self):
+                self.write('ok')
+
+        @app.route('/error')
+        class ErrorHandler(BaseHandler):
+            def get(self):
+                raise ValueError('oops')
+
+        app.route('/metrics')(MetricsHandler)
+        self.ok_name = get_handler_name(OKHandler)
+        self.error_name = get_handler_name(ErrorHandler)
+        app.update_settings({'TESTING': True, 'METRICS': True})
+        self.app = app
+        self.c = app.test_client()
+
+    def tearDown(self):
+        self.c.close()
+        settings['METRICS'] = False
+        settings['METRICS_DIR'] = None
+
+    def test_export(self):
+        self.c.get('/ok')
+        self.c.get('/ok')
+        self.c.get('/error')
+
+        rv = self.c.get('/metrics')
+        lines = rv.body.decode('utf8').splitlines()
+        assert 'torext_requests_total{handler="%s",method="GET",status="200"} 2' % self.ok_name in lines
+        assert 'torext_requests_total{handler="%s",method="GET",status="500"} 1' % self.error_name in lines
+        assert 'torext_request_errors_total{handler="%s"} 1' % self.error_name in lines
+        assert ('torext_request_duration_seconds_bucket'
+                '{handler="%s",method="GET",status="200",le="+Inf"} 2' % self.ok_name) in lines
+
+    def test_merge_processes(self):
+        dirpath = tempfile.mkdtemp()
+        try:
+            settings['METRICS_DIR'] = dirpath
+            other = Metrics()
+            other.merge_snapshot({'histograms': [[self.ok_name, 'GET', 200, [1] + [0] * len(BUCKETS), 0.0001]]})
+            with open('%s/1.json' % dirpath, 'w') as f:
+                json.dump(other.snapshot(), f)
+
+            self.c.get('/ok')
+            rv = self.c.get('/metrics')
+            lines = rv.body.decode('utf8').splitlines()
+            assert 'torext_requests_total{handler="%s",method="GET",status="200"} 2' % self.ok_name in lines
+        finally:
+            shutil.rmtree(dirpath)
+
+
+def test_fold_snapshot():
+    dirpath = tempfile.mkdtemp()
+    try:
+        for pid in (1, 2, 3):
+            metrics = Metrics()
+            metrics.merge_snapshot({'histograms': [['a.OKHandler', 'GET', 200, [1] + [0] * len(BUCKETS), 0.0001]]})
+            metrics.dump_file('%s/%s.json' % (dirpath, pid))
+        fold_snapshot(dirpath, 1)
+        fold_snapshot(dirpath, 2)
+        # not dumped yet
+        fold_snapshot(dirpath, 4)
+        eq_(sorted(os.listdir(dirpath)), ['3.json', 'exited.json'])
+        metrics = Metrics.load(dirpath)
+        eq_(metrics.histograms[('a.OKHandler', 'GET', 200)].count, 3)
+    finally:
+        shutil.rmtree(dirpath)
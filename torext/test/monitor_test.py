@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+
+from torext.app import TorextApp
+from torext.handlers import BaseHandler
+from torext.monitor import LoopMonitor
+from nose.tools import eq_
+
+
+class LoopMonitorTest(unittest.TestCase):
+    def setUp(self):
+        app = TorextApp()
+
+        @app.route('/block')
+        class BlockingHandler(BaseHandler):
+            def get(self):
+                time.sleep(0.3)
+                self.write('ok')
+
+        @app.route('/fast')
+        class FastHandler(BaseHandler):
+            def get(self):
+                self.write('ok')
+
+        app.update_settings({'TESTING': True})
+        self.c = app.test_client()
+        self.monitor = LoopMonitor(self.c.io_loop, interval=0.01, threshold=0.1)
+        self.monitor.start()
+
+    def tearDown(self):
+        self.monitor.stop()
+        self.c.close()
+
+    def test_not_blocked(self):
+        for _ in range(5):
+            self.c.get('/fast')
+        eq_(self.monitor.blocks, 0)
+        eq_(self.monitor.last_block, None)
+
+    def test_blocked(self):
+        self.c.get('/fast')
+        self.c.get('/block')
+        eq_(self.monitor.blocks, 1)
+        request, stack = self.monitor.last_block
+        assert request.startswith('GET /block')
+        assert 'time.sleep(0.3)' in stack
+
+        # let the monitor tick after blocking
+        self.c.get('/fast')
+        lag = self.monitor.percentiles()
+        eq_(lag['blocks'], 1)
+        assert lag['max'] >= 200
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from torext.offload import futures
+if futures is None:
+    print('concurrent.futures is not installed, skip offload_test')
+    from nose.plugins.skip import SkipTest
+    raise SkipTest
+
+import os
+import json
+import time
+import threading
+import unittest
+
+from tornado import gen
+from tornado.web import asynchronous
+
+from torext.app import TorextApp
+from torext.handlers import BaseHandler
+from torext.offload import offload
+from nose.tools import eq_
+
+
+def getpid():
+    return os.getpid()
+
+
+class OffloadTest(unittest.TestCase):
+    def setUp(self):
+        app = TorextApp()
+
+        @app.route('/thread')
+        class ThreadHandler(BaseHandler):
+            @offload
+            def get(self):
+                time.sleep(0.05)
+                self.write_json({'thread': threading.current_thread().name})
+
+        @app.route('/error')
+        class ErrorHandler(BaseHandler):
+            @offload
+            def get(self):
+                raise ValueError('oops')
+
+        @app.route('/process')
+        class ProcessHandler(BaseHandler):
+            @asynchronous
+            @gen.coroutine
+            def get(self):
+                pid = yield self.app.run_in_process(getpid)
+                self.write(str(pid))
+                self.finish()
+
+        app.update_settings({'TESTING': True, 'THREAD_POOL_SIZE': 2, 'PROCESS_POOL_SIZE': 1})
+        self.app = app
+        self.c = app.test_client()
+
+    def tearDown(self):
+        self.c.close()
+        for pool in (self.app.thread_pool, self.app.process_pool):
+            if pool:
+                pool.shutdown()
+
+    def test_thread(self):
+        rv = self.c.get('/thread')
+        eq_(rv.code, 200)
+        assert json.loads(rv.body)['thread'] != threading.current_thread().name
+
+        stats = self.app.thread_pool.stats()
+        eq_(stats['completed'], 1)
+        eq_(stats['pending'], 0)
+
+    def test_error(self):
+        rv = self.c.get('/error')
+        eq_(rv.code, 500)
+        eq_(self.app.thread_pool.stats()['failed'], 1)
+
+    def test_process(self):
+        rv = self.c.get('/process')
+        eq_(rv.code, 200)
+        assert int(rv.body) != os.getpid()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from torext import settings
+from torext import ratelimit
+from torext.app import TorextApp
+from torext.handlers import BaseHandler
+from torext.ratelimit import BucketTable, RateLimitMixin
+from nose.tools import eq_
+
+
+class BucketTableTest(unittest.TestCase):
+    def setUp(self):
+        self.dirpath = tempfile.mkdtemp()
+        self.table = BucketTable(os.path.join(self.dirpath, 'buckets'), slots=16)
+
+    def tearDown(self):
+        self.table.close()
+        shutil.rmtree(self.dirpath)
+
+    def test_consume(self):
+        results = [self.table.consume('a', 1, 3)[0] for _ in range(4)]
+        eq_(results, [True, True, True, False])
+        allowed, remaining, retry_after = self.table.consume('a', 1, 3)
+        assert 0 < retry_after <= 1
+        # other keys are not affected
+        eq_(self.table.consume('b', 1, 3)[0], True)
+
+    def test_eviction(self):
+        # more keys than slots, the table keeps working
+        for i in range(100):
+            eq_(self.table.consume('key%s' % i, 1, 1)[0], True)
+
+    def test_shared_by_processes(self):
+        pid = os.fork()
+        if pid == 0:
+            table = BucketTable(self.table.path, slots=16)
+            table.consume('a', 0.001, 2)
+            os._exit(0)
+        os.waitpid(pid, 0)
+        eq_(self.table.consume('a', 0.001, 2)[0], True)
+        eq_(self.table.consume('a', 0.001, 2)[0], False)
+
+
+class RateLimitMixinTest(unittest.TestCase):
+    def setUp(self):
+        self.dirpath = tempfile.mkdtemp()
+        self.old_file = settings['RATELIMIT_FILE']
+        settings['RATELIMIT_FILE'] = os.path.join(self.dirpath, 'buckets')
+
+        app = TorextApp()
+
+        @app.route('/')
+        class LimitedHandler(RateLimitMixin, BaseHandler):
+            PREPARES = ['ratelimit']
+            RATELIMIT_RATE = 0.1
+            RATELIMIT_BURST = 2
+
+            def get(self):
+                self.write('ok')
+
+        app.update_settings({'TESTING': True})
+        self.c = app.test_client()
+
+    def tearDown(self):
+        self.c.close()
+        ratelimit._table.close()
+        ratelimit._table = None
+        settings['RATELIMIT_FILE'] = self.old_file
+        shutil.rmtree(self.dirpath)
+
+    def test_limit(self):
+        codes = [self.c.get('/').code for _ in range(3)]
+        eq_(codes, [200, 200, 429])
+        rv = self.c.get('/')
+        eq_(rv.headers['Retry-After'], '10')
+        eq_(rv.headers['X-RateLimit-Remaining'], '0')
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from tornado.ioloop import IOLoop
+
+from torext import settings
+from torext.reload import SettingsReloader
+from nose.tools import eq_
+
+
+class SettingsReloaderTest(unittest.TestCase):
+    def setUp(self):
+        self.dirpath = tempfile.mkdtemp()
+        self.module_path = os.path.join(self.dirpath, 'settings.py')
+        self.override_path = os.path.join(self.dirpath, 'override.json')
+        self.write_module('LOG_REQUEST = False\nPORT = 8000\n')
+        self.old = dict((k, settings[k]) for k in ('LOG_REQUEST', 'PORT', 'LOGGING_IGNORE_URLS'))
+        self.io_loop = IOLoop()
+        self.reloader = SettingsReloader([self.module_path, self.override_path],
+                                         ['LOG_REQUEST', 'LOGGING_IGNORE_URLS'])
+        self.reloader.io_loop = self.io_loop
+
+    def tearDown(self):
+        settings.update(self.old)
+        self.io_loop.close()
+        shutil.rmtree(self.dirpath)
+
+    def write_module(self, content):
+        with open(self.module_path, 'w') as f:
+            f.write(content)
+
+    def reload(self):
+        self.reloader.reload()
+        self.io_loop.add_timeout(self.io_loop.time() + 0.5, self.io_loop.stop)
+        original_apply = self.reloader.apply
+
+        def apply(changes):
+            original_apply(changes)
+            self.io_loop.stop()
+        self.reloader.apply = apply
+        self.io_loop.start()
+        self.reloader._thread.join()
+
+    def test_reload(self):
+        settings['PORT'] = 9000
+        self.write_module('LOG_REQUEST = True\nPORT = 8000\n')
+        with open(self.override_path, 'w') as f:
+            json.dump({'LOGGING_IGNORE_URLS': ['/_status']}, f)
+        self.reload()
+
+        eq_(settings['LOG_REQUEST'], True)
+        eq_(settings.frozen.LOGGING_IGNORE_URLS, ('/_status', ))
+        # not changed in files, the value set elsewhere is kept
+        eq_(settings['PORT'], 9000)
+
+    def test_not_reloadable(self):
+        self.write_module('LOG_REQUEST = False\nPORT = 8001\n')
+        self.reload()
+        eq_(settings['PORT'], self.old['PORT'])
+
+    def test_invalid(self):
+        self.write_module('LOG_REQUEST = "yes"\nPORT = 8000\n')
+        self.reload()
+        eq_(settings['LOG_REQUEST'], self.old['LOG_REQUEST'])
+
+    def test_rollback(self):
+        def fail(value):
+            if value:
+                raise ValueError(value)
+
+        settings.add_key_callback('LOG_REQUEST', fail)
+        try:
+            self.write_module('LOG_REQUEST = True\nPORT = 8000\n')
+            self.reload()
+            eq_(settings['LOG_REQUEST'], False)
+        finally:
+            settings._callbacks['LOG_REQUEST'].remove(fail)
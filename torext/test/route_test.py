@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import shutil
+import tempfile
+
+from tornado.web import URLSpec, RequestHandler
+
+from torext import settings
+from torext.app import TorextApp
+from torext.handlers import BaseHandler
+from torext.route import (
+    RadixRouter, parse_literal, include, get_lazy_includes,
+    LazyIncludeHandler, URLBuilder)
+from nose.tools import eq_, assert_raises
+
+
+def make_specs(patterns):
+    return [URLSpec(i, RequestHandler, name=i) for i in patterns]
+
+
+def linear_lookup(specs, path):
+    for spec in specs:
+        if spec.regex.match(path):
+            return spec
+    return None
+
+
+def test_parse_literal():
+    eq_(parse_literal('users'), 'users')
+    eq_(parse_literal(r'a\.json'), 'a.json')
+    eq_(parse_literal('a.json'), None)
+    eq_(parse_literal(r'\d+'), None)
+    eq_(parse_literal('([^/]+)'), None)
+
+
+def test_same_as_linear():
+    specs = make_specs([
+        r'/',
+        r'/users',
+        r'/users/me',
+        r'/users/(\d+)',
+        r'/users/(?P<name>[^/]+)/posts',
+        r'/users/([^/]+)/posts/(\d+)',
+        r'/files/(.*)',
+        r'/files/readme',
+        r'/v1\.0/status',
+        r'/a|/b',
+        r'/items/?',
+        r'/items/(\d+)/(\w+)\.json',
+        r'/pages/([^/]*)',
+    ])
+    router = RadixRouter(specs)
+    paths = [
+        '/', '', '/users', '/users/', '/users/me', '/users/12', '/users/1x',
+        '/users/me/posts', '/users/12/posts/3', '/users/12/posts/x',
+        '/files/', '/files/readme', '/files/a/b/c', '/v1.0/status', '/v1x0/status',
+        '/a', '/b', '/c', '/items', '/items/', '/items/3/abc.json', '/items/3/abc.xml',
+        '/pages/', '/pages/x', '/pages/x/y', '/nothing',
+    ]
+    for path in paths:
+        eq_(router.lookup(path), linear_lookup(specs, path), path)
+
+    # in other orders
+    for specs in (specs[::-1], specs[1::2] + specs[::2]):
+        router = RadixRouter(specs)
+        for path in paths:
+            eq_(router.lookup(path), linear_lookup(specs, path), path)
+
+
+def test_empty():
+    eq_(RadixRouter([]).lookup('/'), None)
+
+
+class TestRadixRouterApp(object):
+    def setUp(self):
+        app = TorextApp()
+
+        @app.route(r'/items/(\d+)')
+        class ItemHandler(BaseHandler):
+            def get(self, id):
+                self.write('item %s' % id)
+
+        @app.route('/items/new')
+        class NewItemHandler(BaseHandler):
+            def get(self):
+                self.write('new')
+
+        @app.route('/', host='api.example.com')
+        class APIHandler(BaseHandler):
+            def get(self):
+                self.write('api')
+
+        self.old_radix_router = settings['RADIX_ROUTER']
+        app.update_settings({'TESTING': True, 'RADIX_ROUTER': True})
+        self.c = app.test_client()
+
+    def tearDown(self):
+        self.c.close()
+        settings['RADIX_ROUTER'] = self.old_radix_router
+
+    def test_routes(self):
+        assert self.c.app.application.routers is not None
+        eq_(self.c.get('/items/3').body, b'item 3')
+        eq_(self.c.get('/items/new').body, b'new')
+        eq_(self.c.get('/items/x').code, 404)
+        eq_(self.c.get('/', headers={'Host': 'api.example.com'}).body, b'api')
+        eq_(self.c.get('/').code, 404)
+
+
+LAZY_MODULE = 'torext.test.lazy_views'
+
+
+class TestLazyRoutes(object):
+    route_settings = {}
+
+    def setUp(self):
+        sys.modules.pop(LAZY_MODULE, None)
+        self.old_settings = dict((k, settings[k]) for k in ['PROJECT'] + list(self.route_settings))
+        settings['PROJECT'] = 'torext'
+        settings.update(self.route_settings)
+        self.app = TorextApp()
+        self.app.route_many([
+            ('/items', include('test.lazy_views', lazy=True)),
+        ])
+
+        @self.app.route('/other')
+        class OtherHandler(BaseHandler):
+            def get(self):
+                self.write('other')
+
+        self.app.update_settings({'TESTING': True})
+        self.c = self.app.test_client()
+
+    def tearDown(self):
+        self.c.close()
+        settings.update(self.old_settings)
+
+    def test_load_on_request(self):
+        eq_(self.c.get('/other').body, b'other')
+        assert LAZY_MODULE not in sys.modules
+        eq_(self.c.get('/items/3').body, b'item 3')
+        assert LAZY_MODULE in sys.modules
+        eq_(get_lazy_includes(self.c.app.application), [])
+        eq_(self.c.get('/items').body, b'list')
+        eq_(self.c.get('/items/x').code, 404)
+
+    def test_manifest(self):
+        dirpath = tempfile.mkdtemp()
+        try:
+            path = os.path.join(dirpath, 'routes.json')
+            # specs other than tuples
+            self.app.add_handlers([URLSpec(r'/spec', BaseHandler)])
+            manifest = self.app.write_route_manifest(path)
+            eq_(manifest, {
+                LAZY_MODULE: [
+                    {'pattern': '', 'handler': LAZY_MODULE + '.ListHandler', 'name': 'item_list'},
+                    {'pattern': r'/(\d+)', 'handler': LAZY_MODULE + '.ItemHandler'},
+                ]
+            })
+
+            sys.modules.pop(LAZY_MODULE, None)
+            settings['ROUTE_MANIFEST'] = path
+            app = TorextApp()
+            app.route_many([
+                ('/items', include('test.lazy_views', lazy=True)),
+            ])
+            application = app.make_application()
+            eq_(application.reverse_url('item_list'), '/items')
+            eq_([i.regex.pattern for i in application.handlers[-1][1]
+                 if i.handler_class is LazyIncludeHandler],
+                [r'/items$', r'/items/(\d+)$'])
+            assert LAZY_MODULE not in sys.modules
+        finally:
+            settings['ROUTE_MANIFEST'] = None
+            shutil.rmtree(dirpath)
+
+
+def test_manifest_not_lazy():
+    old_project = settings['PROJECT']
+    settings['PROJECT'] = 'torext'
+    dirpath = tempfile.mkdtemp()
+    try:
+        app = TorextApp()
+        app.route_many([
+            ('/items', include('test.lazy_views')),
+        ])
+        manifest = app.write_route_manifest(os.path.join(dirpath, 'routes.json'))
+        eq_([i['handler'] for i in manifest[LAZY_MODULE]],
+            [LAZY_MODULE + '.ListHandler', LAZY_MODULE + '.ItemHandler'])
+    finally:
+        settings['PROJECT'] = old_project
+        shutil.rmtree(dirpath)
+
+
+class TestLazyRoutesRadixRouter(TestLazyRoutes):
+    route_settings = {'RADIX_ROUTER': True}
+
+
+def test_url_builder():
+    spec = URLSpec(r'/users/(\d+)/posts/([^/]+)', RequestHandler)
+    build = URLBuilder(spec)
+    eq_(build(1, 'a b/c'), spec.reverse(1, 'a b/c'))
+    eq_(build(1, u'中'), '/users/1/posts/%E4%B8%AD')
+
+    eq_(URLBuilder(URLSpec(r'/v1\.0/status', RequestHandler))(), '/v1.0/status')
+    eq_(URLBuilder(URLSpec(r'/items/(?P<id>\d+)/(?P<field>\w+)', RequestHandler))(
+        field='name', id=3), '/items/3/name')
+    assert_raises(ValueError, build, 1)
+
+
+def test_url_builder_fallback():
+    # not compiled, built by URLSpec.reverse
+    for pattern, args in [
+            ('/robots.txt', ()),
+            ('/feed.xml', ()),
+            (r'/api/v1.0/(\w+)', ('users', )),
+            (r'/users/(\d+)/?', (3, )),
+            (r'/a/?', ())]:
+        spec = URLSpec(pattern, RequestHandler)
+        build = URLBuilder(spec)
+        assert build.path is None
+        eq_(build(*args), spec.reverse(*args))
+    eq_(URLBuilder(URLSpec(r'/users/(?P<id>\d+)/?', RequestHandler))(id=3), '/users/3/?')
+    assert_raises(ValueError, URLBuilder(URLSpec(r'/users/(\d+)/?', RequestHandler)))
+
+
+class TestNamedRoutes(object):
+    def setUp(self):
+        app = TorextApp()
+
+        @app.route(r'/items/(?P<id>\d+)', name='item')
+        class ItemHandler(BaseHandler):
+            def get(self, id):
+                self.write(self.reverse_url('item', id=int(id) + 1))
+
+        app.route_many('/api', [
+            (r'/users/(\d+)', BaseHandler, {}, 'user'),
+            (r'/feed.xml', BaseHandler, {}, 'feed'),
+        ])
+        app.update_settings({'TESTING': True})
+        self.c = app.test_client()
+
+    def tearDown(self):
+        self.c.close()
+
+    def test_reverse_url(self):
+        application = self.c.app.application
+        eq_(sorted(application.url_builders), ['feed', 'item', 'user'])
+        eq_(application.reverse_url('user', 12), '/api/users/12')
+        eq_(application.reverse_url('feed'), '/api/feed.xml')
+        eq_(self.c.get('/items/1').body, b'/items/2')
+        assert_raises(KeyError, application.reverse_url, 'nothing')
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from torext import settings
+from torext.errors import SettingsError
+from nose.tools import eq_, assert_raises
+
+
+def test_frozen():
+    frozen = settings.frozen
+    eq_(frozen.PORT, settings['PORT'])
+    assert isinstance(frozen.LOGGING_IGNORE_URLS, tuple)
+    with assert_raises(SettingsError):
+        frozen.PORT = 1
+
+
+def test_frozen_nested():
+    settings['TEST_NESTED'] = {'a': [1, {'b': 2}]}
+    try:
+        value = settings.frozen.TEST_NESTED
+        eq_(value, {'a': (1, {'b': 2})})
+        with assert_raises(SettingsError):
+            value['a'] = 1
+        with assert_raises(SettingsError):
+            value['a'][1].update(b=3)
+        # the original is not changed
+        eq_(settings['TEST_NESTED'], {'a': [1, {'b': 2}]})
+    finally:
+        dict.pop(settings, 'TEST_NESTED')
+        settings.freeze()
+
+
+def test_frozen_updated():
+    before = settings['LOG_REQUEST']
+    try:
+        settings['LOG_REQUEST'] = not before
+        eq_(settings.frozen.LOG_REQUEST, not before)
+        settings.update({'LOG_REQUEST': before})
+        eq_(settings.frozen.LOG_REQUEST, before)
+    finally:
+        settings['LOG_REQUEST'] = before
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import signal
+from torext.supervisor import Supervisor, Worker
+from nose.tools import eq_
+
+
+class FakeSupervisor(Supervisor):
+    """Records spawns and signals instead of doing them"""
+    def __init__(self, *args, **kwargs):
+        super(FakeSupervisor, self).__init__([], *args, **kwargs)
+        self.signaled = []
+        self._next_pid = 100
+
+    def spawn_worker(self, id):
+        self._next_pid += 1
+        worker = Worker(self._next_pid, id, None)
+        self.workers[worker.pid] = worker
+        return worker
+
+    def signal_worker(self, worker, signum):
+        self.signaled.append((worker.pid, signum))
+
+
+def exit_worker(sv, pid, status=0):
+    worker = sv.workers.pop(pid)
+    sv.on_worker_exit(worker, status)
+
+
+def test_rolling_restart():
+    sv = FakeSupervisor(2)
+    olds = [sv.spawn_worker(i) for i in range(2)]
+
+    sv.rolling_restart()
+    sv.maintain_workers()
+    # only one replacement at a time
+    eq_(len(sv.workers), 3)
+    new_pid = max(sv.workers)
+    eq_(sv.workers[new_pid].id, 0)
+
+    sv.handle_message(sv.workers[new_pid], 'ready', [])
+    eq_(sv.signaled, [(olds[0].pid, signal.SIGTERM)])
+    assert olds[0].retiring
+
+    sv.maintain_workers()
+    eq_(len(sv.workers), 4)
+    exit_worker(sv, olds[0].pid)
+    # a retiring worker is not respawned
+    eq_(len(sv.workers), 3)
+
+    new_pid = max(sv.workers)
+    sv.handle_message(sv.workers[new_pid], 'ready', [])
+    exit_worker(sv, olds[1].pid)
+    eq_(sorted(w.id for w in sv.workers.values()), [0, 1])
+    assert not sv.replace_queue and not sv.replacing
+
+
+def test_failed_boot_aborts_restart():
+    sv = FakeSupervisor(2)
+    olds = [sv.spawn_worker(i) for i in range(2)]
+
+    sv.rolling_restart()
+    sv.maintain_workers()
+    new_pid = max(sv.workers)
+    exit_worker(sv, new_pid, status=1 << 8)
+
+    # old workers keep serving
+    eq_(set(sv.workers), set(w.pid for w in olds))
+    assert not sv.replace_queue and not sv.replacing
+    eq_(sv.signaled, [])
+
+
+def test_respawn_crashed_worker():
+    sv = FakeSupervisor(2)
+    olds = [sv.spawn_worker(i) for i in range(2)]
+    olds[1].spawned_at -= 3600
+    exit_worker(sv, olds[1].pid, status=signal.SIGSEGV)
+    eq_(sorted(w.id for w in sv.workers.values()), [0, 1])
+
+
+def test_recycle_by_max_requests():
+    sv = FakeSupervisor(1, max_requests=100)
+    worker = sv.spawn_worker(0)
+    worker.max_requests = 100
+    sv.handle_message(worker, 'ready', [])
+
+    sv.handle_message(worker, 'heartbeat', ['99', '1024'])
+    sv.maintain_workers()
+    eq_(len(sv.workers), 1)
+
+    sv.handle_message(worker, 'heartbeat', ['100', '1024'])
+    sv.maintain_workers()
+    eq_(len(sv.workers), 2)
+    eq_(list(sv.replacing.values()), [worker])
+
+
+def test_recycle_by_max_rss():
+    sv = FakeSupervisor(1, max_rss=1024 * 1024)
+    worker = sv.spawn_worker(0)
+    sv.handle_message(worker, 'ready', [])
+    sv.handle_message(worker, 'heartbeat', ['1', str(2 * 1024 * 1024)])
+    sv.maintain_workers()
+    eq_(list(sv.replacing.values()), [worker])
+
+
+def test_kill_hung_worker():
+    sv = FakeSupervisor(1, timeout=10)
+    worker = sv.spawn_worker(0)
+    sv.handle_message(worker, 'ready', [])
+    worker.last_heartbeat -= 11
+    sv.maintain_workers()
+    eq_(sv.signaled, [(worker.pid, signal.SIGKILL)])
+
+
+def test_boot_timeout():
+    sv = FakeSupervisor(2, boot_timeout=10)
+    workers = [sv.spawn_worker(i) for i in range(2)]
+    sv.handle_message(workers[1], 'ready', [])
+    for worker in workers:
+        worker.spawned_at -= 20
+    # workers spawned at startup are killed too, not only replacements
+    sv.maintain_workers()
+    eq_(sv.signaled, [(workers[0].pid, signal.SIGKILL)])
+
+
+def test_crash_loop_backoff():
+    sv = FakeSupervisor(1)
+    worker = sv.spawn_worker(0)
+    exit_worker(sv, worker.pid, status=1 << 8)
+    # crashed right after spawned, respawn is delayed
+    eq_(len(sv.workers), 0)
+    assert 0 in sv.pending_spawns
+
+    sv.pending_spawns[0] = 0
+    sv.maintain_workers()
+    eq_(len(sv.workers), 1)
+    assert not sv.pending_spawns
+
+
+def test_bind_reuse_port():
+    from torext.supervisor import bind_sockets, SO_REUSEPORT
+    if SO_REUSEPORT is None:
+        return
+
+    first = bind_sockets(0, address='127.0.0.1', reuse_port=True)
+    port = first[0].getsockname()[1]
+    # another listener on the same port is allowed
+    second = bind_sockets(port, address='127.0.0.1', reuse_port=True)
+    for sock in first + second:
+        sock.close()
+
+
+def test_fork_worker_target():
+    import os
+    from torext.supervisor import WorkerChannel, worker_id
+
+    def target(sockets):
+        WorkerChannel.from_environ().notify('ready', worker_id(), len(sockets))
+
+    sv = Supervisor([], 1, worker_target=target)
+    worker = sv.spawn_worker(3)
+    pid, status = os.waitpid(worker.pid, 0)
+    eq_(os.WEXITSTATUS(status), 0)
+    eq_(os.read(worker.fd, 4096), b'ready 3 0\n')
+    os.close(worker.fd)
+
+
+def test_fork_processes_forward_signals():
+    import os
+    import time
+    from torext.supervisor import fork_processes
+
+    pid = os.fork()
+    if pid == 0:
+        # the parent of forked processes
+        status = 2
+        try:
+            fork_processes(2)
+            signal.signal(signal.SIGTERM, lambda *args: os._exit(0))
+            time.sleep(10)
+            status = 1
+        except SystemExit as e:
+            status = e.code
+        finally:
+            os._exit(status)
+
+    time.sleep(0.5)
+    start = time.time()
+    os.kill(pid, signal.SIGTERM)
+    pid, status = os.waitpid(pid, 0)
+    # the parent exits normally once children exit
+    assert os.WIFEXITED(status)
+    eq_(os.WEXITSTATUS(status), 0)
+    assert time.time() - start < 5
+
+
+def test_fork_processes_forward_signals_to_children():
+    import os
+    import time
+    from torext.supervisor import fork_processes
+
+    pid = os.fork()
+    if pid == 0:
+        status = 2
+        try:
+            fork_processes(2, forward_signals=[signal.SIGUSR1])
+            signal.signal(signal.SIGUSR1, lambda *args: os._exit(0))
+            time.sleep(10)
+            status = 1
+        except SystemExit as e:
+            status = e.code
+        finally:
+            os._exit(status)
+
+    time.sleep(0.5)
+    start = time.time()
+    os.kill(pid, signal.SIGUSR1)
+    pid, status = os.waitpid(pid, 0)
+    # the parent survives the signal, and exits after the children
+    assert os.WIFEXITED(status)
+    eq_(os.WEXITSTATUS(status), 0)
+    assert time.time() - start < 5
+
+
+def test_get_memory_info():
+    from torext.supervisor import get_memory_info
+
+    info = get_memory_info()
+    if info is None:
+        # not linux
+        return
+    assert 0 < info['uss'] <= info['rss']
+    assert info['uss'] <= info['pss'] <= info['rss']